@@ -0,0 +1,205 @@
+"""
+受付制御
+ブラウザを使う取得処理の同時実行数を全体・クライアントごとに制限し、超えた分は上限付きの待ち行列に入れる
+待ち行列があふれた場合は、すぐに 429 を返せるよう AdmissionRejectedError を送出する
+"""
+import asyncio
+import logging
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 実行時間の実績がないときに Retry-After の見積もりに使う1件あたりの秒数
+DEFAULT_HOLD_SECONDS = 60.0
+
+
+class AdmissionRejectedError(Exception):
+    """
+    受付できなかった場合のエラー（待ち行列が満杯・クライアントの上限超過・待ち時間超過）
+
+    Args:
+        message (str): エラーメッセージ
+        retry_after (int): 再試行までの目安の秒数
+        reason (str): queue_full / client_limit / timeout
+    """
+
+    def __init__(self, message: str, retry_after: int, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    ブラウザを使う取得処理の受付を制御する
+
+    実行中が max_concurrent 件に達している場合は先着順に待たせ、待ち行列が max_queue 件を
+    超える場合やクライアントの実行中・待機中の合計が per_client_limit 件を超える場合は受け付けない。
+    ジョブ・事前取得など、断らずに順番を待たせたい処理は wait=True で確保する
+    （待ち行列の上限・待ち時間の上限を適用せず、クライアントの上限は空くまで待つ）。
+
+    Args:
+        max_concurrent (int): 全体で同時に実行できる件数
+        per_client_limit (int): 1クライアント（JWTのsub / client_id）が同時に実行・待機できる件数（0以下で無制限）
+        max_queue (int): 待ち行列の最大件数
+        queue_timeout (float): 待ち行列で待つ最大秒数
+        window (int): 待ち時間の平均・最大値の計算に使う直近の件数
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 2,
+        per_client_limit: int = 2,
+        max_queue: int = 10,
+        queue_timeout: float = 120.0,
+        window: int = 100
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_client_limit = per_client_limit
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._running = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._clients: Dict[str, int] = {}
+        # クライアントの上限が空くのを待っている呼び出し元（wait=True）
+        self._client_waiters: Deque[asyncio.Future] = deque()
+        self._hold_seconds = DEFAULT_HOLD_SECONDS
+        self._wait_samples: Deque[float] = deque(maxlen=max(1, window))
+        self._max_wait = 0.0
+        self._stats = {
+            "admitted_total": 0,
+            "queued_total": 0,
+            "rejected_total": 0,
+            "rejected_by_reason": {},
+        }
+
+    def _retry_after(self) -> int:
+        """待ち行列がはける目安の秒数（直近の実行時間から見積もる）"""
+        rounds = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, math.ceil(self._hold_seconds * rounds))
+
+    def _reject(self, message: str, reason: str) -> AdmissionRejectedError:
+        self._stats["rejected_total"] += 1
+        by_reason = self._stats["rejected_by_reason"]
+        by_reason[reason] = by_reason.get(reason, 0) + 1
+        return AdmissionRejectedError(message, self._retry_after(), reason)
+
+    def _release(self) -> None:
+        # 待機中の呼び出し元があれば実行枠をそのまま引き渡す
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    async def _acquire(self, timeout: Optional[float]) -> None:
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._stats["queued_total"] += 1
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise self._reject(
+                f"実行待ちが{self.queue_timeout:.0f}秒を超えました。しばらくしてから再試行してください", "timeout"
+            ) from None
+        except BaseException:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # 枠を引き渡された直後にキャンセルされた場合は次の待機者へ回す
+                self._release()
+            raise
+
+    def _client_full(self, client_key: str) -> bool:
+        return self.per_client_limit > 0 and self._clients.get(client_key, 0) >= self.per_client_limit
+
+    async def _wait_for_client(self, client_key: str) -> None:
+        """クライアントの実行中・待機中の件数が上限を下回るまで待つ"""
+        loop = asyncio.get_running_loop()
+        while self._client_full(client_key):
+            waiter = loop.create_future()
+            self._client_waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._client_waiters:
+                    self._client_waiters.remove(waiter)
+
+    def _notify_clients(self) -> None:
+        while self._client_waiters:
+            waiter = self._client_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, client_id: Optional[str] = None, wait: bool = False):
+        """
+        実行枠を1つ確保する（空きがなければ待つ）
+
+        Args:
+            client_id: クライアント（HTTPのユーザー・クライアントID、ジョブの所有者など）
+            wait: Trueの場合は受付を断らず、枠が空くまで待つ（ジョブ・事前取得用）
+
+        Raises:
+            AdmissionRejectedError: 待ち行列が満杯、クライアントの上限超過、または待ち時間の上限を超えた場合（wait=False のみ）
+        """
+        client_key = client_id or "-"
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        if wait:
+            await self._wait_for_client(client_key)
+        else:
+            if self._client_full(client_key):
+                raise self._reject(
+                    f"同時に実行できるレポート取得は1クライアントあたり{self.per_client_limit}件までです", "client_limit"
+                )
+            if self._running >= self.max_concurrent and len(self._waiters) >= self.max_queue:
+                raise self._reject("レポート取得の待ち行列が満杯です。しばらくしてから再試行してください", "queue_full")
+
+        self._clients[client_key] = self._clients.get(client_key, 0) + 1
+        try:
+            await self._acquire(None if wait else self.queue_timeout)
+            waited = loop.time() - queued_at
+            self._wait_samples.append(waited)
+            self._max_wait = max(self._max_wait, waited)
+            self._stats["admitted_total"] += 1
+            if waited >= 1.0:
+                logger.info(f"レポート取得の実行待ちが{waited:.1f}秒ありました（クライアント: {client_key}）")
+            started_at = loop.time()
+            try:
+                yield
+            finally:
+                # Retry-After の見積もりに使う1件あたりの実行時間（指数移動平均）
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (loop.time() - started_at)
+                self._release()
+        finally:
+            self._clients[client_key] -= 1
+            if self._clients[client_key] <= 0:
+                self._clients.pop(client_key, None)
+            self._notify_clients()
+
+    def stats(self) -> Dict[str, Any]:
+        samples = list(self._wait_samples)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "per_client_limit": self.per_client_limit,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queue_depth": sum(1 for w in self._waiters if not w.done()),
+            "clients": dict(self._clients),
+            "wait_avg_ms": round(sum(samples) / len(samples) * 1000, 1) if samples else None,
+            "wait_window_max_ms": round(max(samples) * 1000, 1) if samples else None,
+            "wait_max_ms": round(self._max_wait * 1000, 1),
+            "hold_estimate_s": round(self._hold_seconds, 1),
+            **self._stats,
+            "rejected_by_reason": dict(self._stats["rejected_by_reason"]),
+        }
@@ -2,7 +2,10 @@
 OAuth2認証モジュール
 JWTトークンを使用した認証システム
 """
+import json
+import logging
 import os
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from jose import JWTError, jwt
@@ -11,6 +14,10 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
+from config import get_admin_settings
+
+logger = logging.getLogger(__name__)
+
 # パスワードハッシュ化の設定
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -58,11 +65,18 @@ class Client(BaseModel):
 
 
 # 簡易的なユーザーデータベース（本番環境では実際のDBを使用）
-# 環境変数からユーザー情報を取得
-def get_users_db() -> Dict[str, UserInDB]:
+# 起動時に一度だけ構築してメモリに保持する（bcryptハッシュ化をリクエスト毎に行わないため）
+_users_db: Optional[Dict[str, UserInDB]] = None
+_clients_db: Optional[Dict[str, Client]] = None
+# 管理者として扱うユーザー名（ユーザー・クライアントと同じタイミングで読み込む）
+_admin_users: frozenset = frozenset()
+_db_lock = threading.Lock()
+
+
+def _build_users_db() -> Dict[str, UserInDB]:
     """
-    ユーザーデータベースを取得
-    環境変数からユーザー情報を読み込む
+    環境変数からユーザーデータベースを構築する
+    パスワードのハッシュ化を伴うため、リクエスト処理中には呼ばないこと
     """
     users_db: Dict[str, UserInDB] = {}
     
@@ -70,7 +84,6 @@ def get_users_db() -> Dict[str, UserInDB]:
     # 形式: USER_USERNAME=admin,USER_PASSWORD=secret,USER_EMAIL=admin@example.com
     # または複数ユーザー: USERS='[{"username":"admin","password":"secret","email":"admin@example.com"}]'
     
-    import json
     users_json = os.getenv("USERS")
     if users_json:
         try:
@@ -114,14 +127,12 @@ def get_users_db() -> Dict[str, UserInDB]:
     return users_db
 
 
-def get_clients_db() -> Dict[str, Client]:
+def _build_clients_db() -> Dict[str, Client]:
     """
-    OAuth2クライアントデータベースを取得
-    環境変数からクライアント情報を読み込む
+    環境変数からOAuth2クライアントデータベースを構築する
     """
     clients_db: Dict[str, Client] = {}
     
-    import json
     # 環境変数からクライアント情報を取得
     # 形式: OAUTH_CLIENTS='[{"client_id":"n8n","client_secret":"secret123","scope":"read"}]'
     clients_json = os.getenv("OAUTH_CLIENTS")
@@ -163,6 +174,43 @@ def get_clients_db() -> Dict[str, Client]:
     return clients_db
 
 
+def load_auth_databases() -> None:
+    """
+    ユーザー・クライアントデータベースを構築してメモリに保持する
+    起動時と、設定変更時（SIGHUP / 管理エンドポイント）に呼び出す
+    """
+    global _users_db, _clients_db, _admin_users
+    with _db_lock:
+        users_db = _build_users_db()
+        clients_db = _build_clients_db()
+        admin_users = frozenset(get_admin_settings()["users"])
+        # 参照の差し替えのみ行うため、処理中のリクエストは古いDBを最後まで使える
+        _users_db = users_db
+        _clients_db = clients_db
+        _admin_users = admin_users
+    logger.info(f"認証データベースを読み込みました: ユーザー{len(users_db)}件, クライアント{len(clients_db)}件")
+
+
+def get_users_db() -> Dict[str, UserInDB]:
+    """
+    ユーザーデータベースを取得
+    未構築の場合のみ環境変数から構築する
+    """
+    if _users_db is None:
+        load_auth_databases()
+    return _users_db
+
+
+def get_clients_db() -> Dict[str, Client]:
+    """
+    OAuth2クライアントデータベースを取得
+    未構築の場合のみ環境変数から構築する
+    """
+    if _clients_db is None:
+        load_auth_databases()
+    return _clients_db
+
+
 def authenticate_client(client_id: str, client_secret: str) -> Optional[Client]:
     """クライアントを認証"""
     clients_db = get_clients_db()
@@ -273,3 +321,19 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="無効なユーザーです")
     return current_user
 
+
+
+async def get_current_admin_user(
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_active_user)
+) -> User:
+    """
+    現在のユーザーが管理者であることを確認する
+    管理者はパスワード認証のユーザーのみとし、Client Credentials のトークンは受け付けない
+    """
+    payload = verify_token(token, "access") or {}
+    if payload.get("grant_type") == "client_credentials":
+        raise HTTPException(status_code=403, detail="管理者権限が必要です")
+    if current_user.username not in _admin_users:
+        raise HTTPException(status_code=403, detail="管理者権限が必要です")
+    return current_user
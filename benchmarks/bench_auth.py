@@ -0,0 +1,83 @@
+"""
+認証処理のベンチマーク
+リクエスト毎にユーザーDBを構築していた従来方式と、起動時に構築したDBを使う方式の
+get_current_user 1回あたりのコストを比較する
+
+使い方:
+    python benchmarks/bench_auth.py --users 1 10 --iterations 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import auth  # noqa: E402
+
+
+def _configure_users(count: int) -> None:
+    users = [
+        {"username": f"user{i}", "password": f"password{i}", "email": f"user{i}@example.com"}
+        for i in range(count)
+    ]
+    os.environ["USERS"] = json.dumps(users)
+    os.environ.pop("OAUTH_USERNAME", None)
+    os.environ.pop("OAUTH_PASSWORD", None)
+
+
+async def _legacy_get_current_user(token: str) -> auth.User:
+    """従来方式: リクエスト毎にDBを構築（全パスワードをbcryptでハッシュ化）"""
+    payload = auth.verify_token(token, "access")
+    users_db = auth._build_users_db()
+    user = auth.get_user(users_db, username=payload.get("sub"))
+    return auth.User(**user.dict())
+
+
+def _measure(func, token: str, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        asyncio.run(func(token))
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def run(user_counts, iterations: int) -> list:
+    results = []
+    for count in user_counts:
+        _configure_users(count)
+        auth.load_auth_databases()
+        token = auth.create_access_token({"sub": "user0"})
+        legacy = _measure(_legacy_get_current_user, token, iterations)
+        cached = _measure(auth.get_current_user, token, iterations)
+        results.append({"users": count, "before": legacy, "after": cached})
+        print(
+            f"users={count:>3}  before: {legacy['median_ms']:>9.3f} ms/req  "
+            f"after: {cached['median_ms']:>7.3f} ms/req"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_current_user のリクエスト毎コストを計測する")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.users, args.iterations)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
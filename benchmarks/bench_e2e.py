@@ -0,0 +1,188 @@
+"""
+エンドツーエンドのベンチマーク（模擬サーバー使用）
+benchmarks/mock_rms.py を起動し、レポート種別ごとにログインからCSV変換までの所要時間とフェーズ別の内訳を計測する
+
+実際のポータルやログイン情報は不要。ポータルのURLは rpp_service の読み込み時に環境変数から決まるため、
+模擬サーバーのURLを設定してから読み込む。
+
+使い方:
+    python benchmarks/bench_e2e.py --iterations 3 --delay 3 --rows 2000
+    python benchmarks/bench_e2e.py --report-types rpp tda --cold --output e2e.json
+    python benchmarks/bench_e2e.py --mock-url http://127.0.0.1:8765   # 起動済みの模擬サーバーを使う
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import mock_rms  # noqa: E402
+
+DEFAULT_REPORT_TYPES = ["rpp", "rpp-exp", "cpnadv", "tda", "tdaexp", "cpa"]
+
+# 模擬サーバーはどの認証情報でもログインできる
+BENCH_RMS_CREDENTIALS = {"login_id": "bench", "password": "bench"}
+BENCH_RAKUTEN_CREDENTIALS = {"user_id": "bench", "password": "bench"}
+
+
+def _start_mock_server(host: str, port: int, settings: "mock_rms.MockSettings"):
+    """模擬サーバーを別スレッドで起動する"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(mock_rms.create_app(settings), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError(f"模擬サーバーを起動できませんでした: {host}:{port}")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def _run_once(services, pool, report_type: str, target_date: date, phases_out: dict) -> dict:
+    rpp_service, csv_stream = services
+    marks = []
+
+    def on_phase(phase: str) -> None:
+        marks.append((phase, time.perf_counter()))
+
+    started = time.perf_counter()
+    status = "ok"
+    written = 0
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as temp_dir:
+        report_path = await rpp_service.get_rpp_report_csv(
+            rms_credentials=BENCH_RMS_CREDENTIALS,
+            rakuten_credentials=BENCH_RAKUTEN_CREDENTIALS,
+            target_date=target_date,
+            download_dir=os.path.join(temp_dir, "downloads"),
+            report_type=report_type,
+            pool=pool,
+            on_phase=on_phase
+        )
+        if report_path:
+            on_phase("converting")
+            written = await asyncio.get_running_loop().run_in_executor(
+                None, csv_stream.convert_csv_file, report_path, os.path.join(temp_dir, "report.csv"),
+                rpp_service.get_report_slug(report_type)
+            )
+        else:
+            status = "no_data"
+        on_phase("done")
+
+    for (phase, at), (_, next_at) in zip(marks, marks[1:]):
+        phases_out[phase] = phases_out.get(phase, 0.0) + (next_at - at)
+    return {"total_s": time.perf_counter() - started, "status": status, "bytes": written}
+
+
+def _summary(values) -> dict:
+    values = sorted(values)
+    return {
+        "mean": round(statistics.mean(values), 3),
+        "median": round(statistics.median(values), 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+async def _run_report_type(services, report_type: str, target_date: date, args) -> dict:
+    from browser_pool import BrowserPool
+
+    runs = []
+    pool = None
+    try:
+        for _ in range(args.iterations):
+            if pool is None:
+                pool = BrowserPool(size=1, max_jobs_per_browser=1000, lease_timeout=0, headless=not args.headed)
+                await pool.start()
+            phases = {}
+            result = await _run_once(services, pool, report_type, target_date, phases)
+            result["phases_s"] = phases
+            runs.append(result)
+            if args.cold:
+                # 毎回ブラウザを起動し直し、ログインから計測する
+                await pool.close()
+                pool = None
+    finally:
+        if pool is not None:
+            await pool.close()
+
+    phase_names = [name for name in ("lease", "login", "navigate", "date_entry", "waiting", "downloading", "converting")
+                   if any(name in r["phases_s"] for r in runs)]
+    return {
+        "report_type": report_type,
+        "iterations": args.iterations,
+        "cold": args.cold,
+        "statuses": [r["status"] for r in runs],
+        "total_s": _summary([r["total_s"] for r in runs]),
+        "phases_s": {name: _summary([r["phases_s"].get(name, 0.0) for r in runs]) for name in phase_names},
+        "bytes": _summary([r["bytes"] for r in runs]),
+    }
+
+
+def run(args) -> list:
+    server = None
+    base_url = args.mock_url
+    if not base_url:
+        server, _ = _start_mock_server(args.host, args.port, mock_rms.settings_from_args(args))
+        base_url = f"http://{args.host}:{args.port}"
+    os.environ.update(mock_rms.service_env(base_url))
+    # 模擬サーバーに合わせて完了待ちの上限を設定する（未設定の場合のみ）
+    os.environ.setdefault("REPORT_MAX_WAIT_SECONDS", str(max(60, args.delay * 4 + args.jitter)))
+
+    services = (importlib.import_module("rpp_service"), importlib.import_module("csv_stream"))
+    target_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else date.today() - timedelta(days=1)
+
+    async def _run_all() -> list:
+        results = []
+        try:
+            for report_type in args.report_types:
+                result = await _run_report_type(services, report_type, target_date, args)
+                results.append(result)
+                phases = "  ".join(f"{name}={stats['median']:.2f}s" for name, stats in result["phases_s"].items())
+                print(
+                    f"{report_type:<8} total={result['total_s']['median']:>6.2f}s (p95 {result['total_s']['p95']:.2f}s)  "
+                    f"bytes={result['bytes']['median'] / 1024:>8.1f}KiB  {phases}"
+                )
+        finally:
+            await services[0].close_http_client()
+        return results
+
+    try:
+        return asyncio.run(_run_all())
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬サーバーを使い、レポート種別ごとのエンドツーエンド・フェーズ別の所要時間を計測する")
+    parser.add_argument("--report-types", nargs="+", default=DEFAULT_REPORT_TYPES)
+    parser.add_argument("--date", help="取得するレポートの日付 (YYYY-MM-DD、デフォルト: 昨日)")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--cold", action="store_true", help="毎回ブラウザを起動し直してログインから計測する")
+    parser.add_argument("--headed", action="store_true", help="ブラウザを表示して実行する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mock-url", help="起動済みの模擬サーバーのURL（指定した場合はサーバーを起動しない）")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    mock_rms.add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+リクエスト処理のCPUコストのベンチマーク
+ブラウザ以外でリクエストごとにかかる処理を合成データで計測し、結果をJSONで保存する
+バージョン間で結果を比較し、遅くなった項目を検出できる
+
+計測する処理:
+    auth      : ユーザーDBの構築（bcrypt）と、構築済みDBでの get_current_user（ユーザー数 1 / 10 / 100）
+    jwt       : create_access_token / verify_token
+    transcode : Shift_JIS → UTF-8 変換（convert_csv_file、10MB / 200MB のCSV）
+    zip       : ZIPメンバーの展開のみ / 展開しながらの変換
+    tempdir   : 一時ディレクトリの作成・ダウンロードファイル配置・削除
+
+使い方:
+    python benchmarks/bench_hotpaths.py --output hotpaths.json
+    python benchmarks/bench_hotpaths.py --only transcode zip --sizes-mb 10 --iterations 5
+    python benchmarks/bench_hotpaths.py --output new.json --compare hotpaths.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from csv_stream import CHUNK_BYTES, SKIP_HEADER_LINES, convert_csv_file, open_report_csv  # noqa: E402
+
+SUITES = ("auth", "jwt", "transcode", "zip", "tempdir")
+
+MB = 1024 * 1024
+
+
+def _measure(name: str, func: Callable[[], object], iterations: int, params: Optional[dict] = None,
+             size_bytes: Optional[int] = None, warmup: int = 0) -> dict:
+    """func を iterations 回実行して所要時間の統計を返す"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    median = statistics.median(samples)
+    result = {
+        "name": name,
+        "params": params or {},
+        "iterations": iterations,
+        "mean_s": round(statistics.mean(samples), 6),
+        "median_s": round(median, 6),
+        "min_s": round(min(samples), 6),
+        "max_s": round(max(samples), 6),
+    }
+    if size_bytes:
+        result["bytes"] = size_bytes
+        result["throughput_mb_s"] = round(size_bytes / MB / median, 1) if median else None
+    label = " ".join(f"{k}={v}" for k, v in result["params"].items())
+    throughput = f"  {result['throughput_mb_s']:>7.1f} MB/s" if size_bytes else ""
+    print(f"{name:<28} {label:<18} median={median * 1000:>10.3f} ms  min={min(samples) * 1000:>10.3f} ms{throughput}")
+    return result
+
+
+# --- 合成データ ---
+
+def write_synthetic_csv(path: str, size_bytes: int, seed: int = 0) -> int:
+    """レポートと同じ形式（先頭6行のメタ情報 + ヘッダー + 日別の行）のShift_JISのCSVを size_bytes 程度まで書き込む"""
+    rng = random.Random(seed)
+    campaigns = [f"キャンペーン{i:02d}（{rng.choice(['セール', '新商品', '定番', 'ギフト'])}）" for i in range(50)]
+    header = (
+        "レポート種別,rpp\r\n集計期間,2024/01/01-2024/01/31\r\n作成日時,2024/02/01 09:00:00\r\n"
+        "※このレポートは合成データです\r\n※数値は速報値のため変動する場合があります\r\n\r\n"
+        "日付,キャンペーン名,商品管理番号,商品名,表示回数,クリック数,実績額(合計),CPC実績(合計),売上金額(合計)\r\n"
+    )
+    with open(path, "wb") as f:
+        f.write(header.encode("shift_jis"))
+        written = f.tell()
+        day = date(2024, 1, 1)
+        row = 0
+        while written < size_bytes:
+            lines = []
+            for _ in range(2000):
+                impressions = rng.randint(0, 50000)
+                clicks = rng.randint(0, max(1, impressions // 20))
+                spend = clicks * rng.randint(10, 120)
+                lines.append(
+                    f"{(day + timedelta(days=row % 31)).strftime('%Y/%m/%d')},{campaigns[row % 50]},item-{row:07d},"
+                    f"テスト商品{row}　サイズ・カラー各種 送料無料,{impressions},{clicks},{spend},"
+                    f"{spend // clicks if clicks else 0},{spend * rng.randint(1, 15)}\r\n"
+                )
+                row += 1
+            f.write("".join(lines).encode("shift_jis"))
+            written = f.tell()
+    return written
+
+
+def _zip_file(src_path: str, zip_path: str, member_name: str) -> None:
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.write(src_path, member_name)
+
+
+# --- 計測 ---
+
+def bench_auth(user_counts: List[int], iterations: int) -> list:
+    import auth
+
+    results = []
+    for count in user_counts:
+        os.environ["USERS"] = json.dumps([
+            {"username": f"user{i}", "password": f"password{i}", "email": f"user{i}@example.com"} for i in range(count)
+        ])
+        os.environ.pop("OAUTH_USERNAME", None)
+        os.environ.pop("OAUTH_PASSWORD", None)
+        # 起動時（と設定の再読み込み時）のみ発生するコスト
+        results.append(_measure(
+            "auth.build_users_db", auth._build_users_db, max(1, min(iterations, 3)), {"users": count}
+        ))
+        auth.load_auth_databases()
+        token = auth.create_access_token({"sub": f"user{count - 1}"})
+        results.append(_measure(
+            "auth.get_current_user", lambda: asyncio.run(auth.get_current_user(token)),
+            iterations * 10, {"users": count}, warmup=1
+        ))
+    users_db = auth.get_users_db()
+    hashed = users_db["user0"].hashed_password
+    results.append(_measure("auth.verify_password", lambda: auth.verify_password("password0", hashed), iterations))
+    return results
+
+
+def bench_jwt(iterations: int) -> list:
+    import auth
+
+    claims = {"sub": "n8n", "grant_type": "client_credentials", "scope": "read"}
+    token = auth.create_access_token(claims)
+    loops = 1000
+
+    def _encode():
+        for _ in range(loops):
+            auth.create_access_token(claims)
+
+    def _decode():
+        for _ in range(loops):
+            auth.verify_token(token, "access")
+
+    return [
+        _measure("jwt.create_access_token", _encode, iterations, {"calls": loops}, warmup=1),
+        _measure("jwt.verify_token", _decode, iterations, {"calls": loops}, warmup=1),
+    ]
+
+
+def bench_transcode(sizes_mb: List[int], iterations: int, work_dir: str) -> list:
+    results = []
+    for size_mb in sizes_mb:
+        src = os.path.join(work_dir, f"report_{size_mb}mb.csv")
+        dst = os.path.join(work_dir, f"converted_{size_mb}mb.csv")
+        size = write_synthetic_csv(src, size_mb * MB, seed=size_mb)
+        results.append(_measure(
+            "transcode.convert_csv_file", lambda: convert_csv_file(src, dst), iterations, {"size_mb": size_mb}, size
+        ))
+        os.unlink(dst)
+    return results
+
+
+def bench_zip(sizes_mb: List[int], iterations: int, work_dir: str) -> list:
+    results = []
+    for size_mb in sizes_mb:
+        src = os.path.join(work_dir, f"report_{size_mb}mb.csv")
+        if not os.path.exists(src):
+            write_synthetic_csv(src, size_mb * MB, seed=size_mb)
+        size = os.path.getsize(src)
+        zip_path = os.path.join(work_dir, f"report_{size_mb}mb.zip")
+        _zip_file(src, zip_path, f"rpp_report_{size_mb}mb.csv")
+        dst = os.path.join(work_dir, f"converted_{size_mb}mb.csv")
+
+        def _inflate():
+            with open_report_csv(zip_path, "rpp") as member:
+                while member.read(CHUNK_BYTES):
+                    pass
+
+        results.append(_measure("zip.inflate", _inflate, iterations, {"size_mb": size_mb}, size))
+        results.append(_measure(
+            "zip.convert_csv_file", lambda: convert_csv_file(zip_path, dst, "rpp"), iterations, {"size_mb": size_mb}, size
+        ))
+        os.unlink(dst)
+        os.unlink(zip_path)
+    return results
+
+
+def bench_tempdir(iterations: int, work_dir: str) -> list:
+    """1回のレポート取得と同じ構成（downloads / screenshots / ZIP 1つ）の一時ディレクトリを作成して削除する"""
+    payload = os.urandom(256 * 1024)
+    loops = 50
+
+    def _cycle():
+        for _ in range(loops):
+            temp_dir = tempfile.mkdtemp(prefix="rpp_report_", dir=work_dir)
+            download_dir = os.path.join(temp_dir, "downloads")
+            screenshot_dir = os.path.join(download_dir, "screenshots")
+            os.makedirs(screenshot_dir)
+            with open(os.path.join(download_dir, "rpp_report.zip"), "wb") as f:
+                f.write(payload)
+            shutil.rmtree(temp_dir)
+
+    return [_measure("tempdir.create_cleanup", _cycle, iterations, {"cycles": loops}, warmup=1)]
+
+
+# --- 結果の保存・比較 ---
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _result_key(result: dict) -> str:
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> List[str]:
+    """前回の結果と中央値を比較し、tolerance（割合）を超えて遅くなった項目を返す"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    previous = {_result_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{baseline_path}（{baseline.get('meta', {}).get('git_revision')}）との比較:")
+    for result in results:
+        before = previous.get(_result_key(result))
+        if not before or not before["median_s"]:
+            continue
+        ratio = result["median_s"] / before["median_s"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            mark = "  <-- 遅くなりました"
+            regressions.append(_result_key(result))
+        print(f"  {_result_key(result):<48} {before['median_s'] * 1000:>10.3f} ms -> {result['median_s'] * 1000:>10.3f} ms ({ratio:.2f}x){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リクエスト処理のCPUコスト（認証・JWT・文字コード変換・ZIP展開・一時ディレクトリ）を計測する")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES), help="計測する項目")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[10, 200])
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--work-dir", help="合成データを置くディレクトリ（デフォルト: 一時ディレクトリ）")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    parser.add_argument("--compare", help="比較する前回の結果（JSON）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="この割合を超えて遅くなった項目を報告する")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_hotpaths_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        if "auth" in args.only:
+            results += bench_auth(args.users, args.iterations)
+        if "jwt" in args.only:
+            results += bench_jwt(args.iterations)
+        if "transcode" in args.only:
+            results += bench_transcode(args.sizes_mb, args.iterations, work_dir)
+        if "zip" in args.only:
+            results += bench_zip(args.sizes_mb, args.iterations, work_dir)
+        if "tempdir" in args.only:
+            results += bench_tempdir(args.iterations, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "skip_header_lines": SKIP_HEADER_LINES,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
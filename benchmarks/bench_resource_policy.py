@@ -0,0 +1,136 @@
+"""
+リソースポリシーのベンチマーク
+実際のRMSにログインしてレポートを1件取得し、リソースポリシーの有無でフェーズごとの所要時間と転送量を比較する
+
+RMS_CREDENTIALS / RAKUTEN_CREDENTIALS（または個別の環境変数）が必要。
+毎回ブラウザを起動し、保存済みセッションは使わずにログインから計測する。
+
+使い方:
+    python benchmarks/bench_resource_policy.py --date 2024-01-01 --modes off standard strict --iterations 3
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from browser_pool import BrowserPool  # noqa: E402
+from config import get_rakuten_credentials, get_rms_credentials  # noqa: E402
+from resource_policy import RESOURCE_POLICY_MODES, ResourcePolicy, install_page_allowlist  # noqa: E402
+from rpp_service import ensure_logged_in, get_resource_allowlist, navigate_to_report_top  # noqa: E402
+
+
+async def _run_once(mode: str, report_type: str, target_date, headless: bool) -> dict:
+    policy = ResourcePolicy(mode=mode)
+    pool = BrowserPool(size=1, max_jobs_per_browser=1, lease_timeout=0, headless=headless, resource_policy=policy)
+    await pool.start()
+
+    marks = []
+    transfer = {"requests": 0, "failed": 0, "bytes": 0}
+    pending = []
+
+    def on_phase(phase: str) -> None:
+        marks.append((phase, time.perf_counter()))
+
+    async def _count_finished(request) -> None:
+        try:
+            sizes = await request.sizes()
+            transfer["bytes"] += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+        except Exception:
+            pass
+
+    def on_finished(request) -> None:
+        transfer["requests"] += 1
+        pending.append(asyncio.ensure_future(_count_finished(request)))
+
+    def on_failed(request) -> None:
+        transfer["failed"] += 1
+
+    started = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_policy_") as temp_dir:
+            async with pool.lease() as lease:
+                lease.context.on("requestfinished", on_finished)
+                lease.context.on("requestfailed", on_failed)
+                page = await lease.new_page()
+                await install_page_allowlist(page, get_resource_allowlist(report_type))
+                on_phase("login")
+                await ensure_logged_in(lease, page, get_rms_credentials(), get_rakuten_credentials(), Path(temp_dir))
+                await navigate_to_report_top(
+                    page, Path(temp_dir), temp_dir, target_date, report_type=report_type, on_phase=on_phase
+                )
+                on_phase("done")
+                if pending:
+                    await asyncio.gather(*pending)
+    finally:
+        await pool.close()
+
+    phases = {}
+    for (phase, at), (_, next_at) in zip(marks, marks[1:]):
+        phases[phase] = phases.get(phase, 0.0) + (next_at - at)
+    return {
+        "total_s": time.perf_counter() - started,
+        "phases_s": phases,
+        **transfer,
+        "blocked": policy.stats()["blocked_total"],
+    }
+
+
+def _summary(values) -> dict:
+    return {
+        "mean": round(statistics.mean(values), 3),
+        "median": round(statistics.median(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def run(modes, report_type: str, target_date, iterations: int, headless: bool) -> list:
+    results = []
+    for mode in modes:
+        runs = [asyncio.run(_run_once(mode, report_type, target_date, headless)) for _ in range(iterations)]
+        phase_names = sorted({name for r in runs for name in r["phases_s"]})
+        result = {
+            "mode": mode,
+            "iterations": iterations,
+            "total_s": _summary([r["total_s"] for r in runs]),
+            "phases_s": {
+                name: _summary([r["phases_s"].get(name, 0.0) for r in runs]) for name in phase_names
+            },
+            "bytes": _summary([r["bytes"] for r in runs]),
+            "requests": _summary([r["requests"] for r in runs]),
+            "blocked": _summary([r["blocked"] for r in runs]),
+        }
+        results.append(result)
+        phases = "  ".join(f"{name}={stats['median']:.2f}s" for name, stats in result["phases_s"].items())
+        print(
+            f"mode={mode:<8} total={result['total_s']['median']:>6.2f}s  "
+            f"bytes={result['bytes']['median'] / 1024:>9.1f}KiB  requests={result['requests']['median']:>5.0f}  "
+            f"blocked={result['blocked']['median']:>5.0f}  {phases}"
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リソースポリシーの有無でレポート取得のフェーズ別所要時間と転送量を比較する")
+    parser.add_argument("--date", required=True, help="取得するレポートの日付 (YYYY-MM-DD)")
+    parser.add_argument("--report-type", default="rpp")
+    parser.add_argument("--modes", nargs="+", default=["off", "standard"], choices=RESOURCE_POLICY_MODES)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--headed", action="store_true", help="ブラウザを表示して実行する")
+    parser.add_argument("--output", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    target_date = datetime.strptime(args.date, "%Y-%m-%d").date()
+    results = run(args.modes, args.report_type, target_date, args.iterations, not args.headed)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
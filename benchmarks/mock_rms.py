@@ -0,0 +1,501 @@
+"""
+楽天RMSの模擬サーバー
+実際のポータルとログイン情報を使わずに rpp_service.py の動作確認・計測を行うためのローカルサーバー
+
+再現する画面:
+    - glogin（RMSログイン）→ 楽天会員ログイン → 確認画面（次へ）→ メインメニューへのリンク
+    - メインメニュー（RMS利用規約の同意・不定期の確認画面）
+    - 広告管理画面 /ad/{slug}/top（ナビゲーション・レポート種別・期間入力・ダウンロードボタン）
+    - ダウンロード履歴（履歴API + table.table、作成完了までの待ち時間を設定可能）
+    - Shift_JISの合成CSVを含むZIPのダウンロード
+
+使い方:
+    python benchmarks/mock_rms.py --port 8765 --delay 5 --rows 2000
+
+    サービス側は次の環境変数で模擬サーバーに向ける:
+    export RMS_LOGIN_URL=http://127.0.0.1:8765/glogin/
+    export RMS_MAINMENU_URL=http://127.0.0.1:8765/mainmenu/
+    export RMS_AD_BASE_URL=http://127.0.0.1:8765/ad
+    （RESOURCE_POLICY=strict の場合は RESOURCE_POLICY_ALLOW_HOSTS に 127.0.0.1 を追加する）
+"""
+import argparse
+import csv
+import io
+import random
+import secrets
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
+from starlette.routing import Route
+
+SESSION_COOKIE = "mock_rms_session"
+
+# rpp_service.REPORT_TYPES と同じスラッグ（RPP系は期間入力・ナビゲーションがある画面）
+REPORT_SLUGS = ("rpp", "rppexp", "cpnadv", "tda", "tdaexp", "cpa")
+RPP_SLUGS = ("rpp", "rppexp")
+
+NO_DATA_TEXT = "対象データがありません"
+
+_JST = timezone(timedelta(hours=9))
+
+
+class MockSettings:
+    """
+    模擬サーバーの動作設定
+
+    Args:
+        delay (float): レポート作成の完了までの秒数
+        jitter (float): delay に加える乱数の最大秒数
+        rows (int): 1日あたりのCSVの行数
+        no_data_rate (float): 対象データなしにする割合（0〜1）
+        no_data_dates (Set[date]): 常に対象データなしにする日付
+        member_login (bool): 楽天会員ログイン画面を表示するかどうか
+        confirm_screen (bool): ログイン後の確認画面（次へ）を表示するかどうか
+        terms_screen (bool): RMS利用規約の同意画面を表示するかどうか（セッションごとに1回）
+        notice_screen (bool): メインメニュー前の確認画面（チェックボックス）を表示するかどうか（セッションごとに1回）
+    """
+
+    def __init__(
+        self,
+        delay: float = 3.0,
+        jitter: float = 0.0,
+        rows: int = 1000,
+        no_data_rate: float = 0.0,
+        no_data_dates: Optional[Set[date]] = None,
+        member_login: bool = True,
+        confirm_screen: bool = True,
+        terms_screen: bool = True,
+        notice_screen: bool = False
+    ):
+        self.delay = delay
+        self.jitter = jitter
+        self.rows = rows
+        self.no_data_rate = no_data_rate
+        self.no_data_dates = set(no_data_dates or ())
+        self.member_login = member_login
+        self.confirm_screen = confirm_screen
+        self.terms_screen = terms_screen
+        self.notice_screen = notice_screen
+
+
+class MockState:
+    """セッションとレポートの作成履歴"""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.sessions: Dict[str, Dict[str, bool]] = {}
+        self.reports: Dict[str, List[Dict[str, Any]]] = {slug: [] for slug in REPORT_SLUGS}
+        self._next_id = 1
+        self.stats = {"logins_total": 0, "reports_total": 0, "downloads_total": 0, "download_bytes_total": 0}
+
+    def new_session(self) -> str:
+        token = secrets.token_hex(16)
+        self.sessions[token] = {"terms": not self.settings.terms_screen, "notice": not self.settings.notice_screen}
+        self.stats["logins_total"] += 1
+        return token
+
+    def create_report(self, slug: str, start: date, end: date) -> Dict[str, Any]:
+        settings = self.settings
+        no_data = any(start <= d <= end for d in settings.no_data_dates) or random.random() < settings.no_data_rate
+        report = {
+            "id": self._next_id,
+            "start": start,
+            "end": end,
+            "created_at": time.time(),
+            "ready_at": time.time() + settings.delay + random.uniform(0, settings.jitter),
+            "no_data": no_data,
+        }
+        self._next_id += 1
+        self.reports[slug].insert(0, report)
+        self.stats["reports_total"] += 1
+        return report
+
+    def find_report(self, slug: str, report_id: int) -> Optional[Dict[str, Any]]:
+        return next((r for r in self.reports.get(slug, []) if r["id"] == report_id), None)
+
+
+def build_report_zip(slug: str, start: date, end: date, rows_per_day: int) -> bytes:
+    """先頭6行のメタ情報付きのShift_JISのCSVを1つ含むZIPを作る"""
+    text = io.StringIO()
+    text.write(f"レポート種別,{slug}\r\n")
+    text.write(f"集計期間,{start.strftime('%Y/%m/%d')}-{end.strftime('%Y/%m/%d')}\r\n")
+    text.write(f"作成日時,{datetime.now(_JST).strftime('%Y/%m/%d %H:%M:%S')}\r\n")
+    text.write("※このレポートは模擬サーバーが作成した合成データです\r\n")
+    text.write("※数値は速報値のため変動する場合があります\r\n")
+    text.write("\r\n")
+    writer = csv.writer(text, lineterminator="\r\n")
+    writer.writerow(["日付", "キャンペーン名", "商品管理番号", "商品名", "表示回数", "クリック数", "実績額(合計)", "CPC実績(合計)", "売上金額(合計)"])
+    rng = random.Random(f"{slug}-{start}-{end}")
+    day = start
+    while day <= end:
+        for i in range(rows_per_day):
+            impressions = rng.randint(0, 50000)
+            clicks = rng.randint(0, max(1, impressions // 20))
+            spend = clicks * rng.randint(10, 120)
+            writer.writerow([
+                day.strftime("%Y/%m/%d"),
+                f"キャンペーン{i % 20 + 1:02d}",
+                f"item-{i:06d}",
+                f"テスト商品{i}（サイズ・カラー各種）",
+                impressions,
+                clicks,
+                spend,
+                spend // clicks if clicks else 0,
+                spend * rng.randint(1, 15),
+            ])
+        day += timedelta(days=1)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{slug}_report_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.csv", text.getvalue().encode("shift_jis"))
+    return buffer.getvalue()
+
+
+_PAGE = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>__TITLE__</title></head>
+<body>__BODY__</body></html>"""
+
+
+def _page(title: str, body: str) -> HTMLResponse:
+    return HTMLResponse(_PAGE.replace("__TITLE__", title).replace("__BODY__", body))
+
+
+# RPP系の画面（rpp_service.REPORT_TYPES の nav_selector と同じ構造）
+_AD_HEADER = """
+<div class="rpp-header">
+  <div><span>楽天プロモーションプラットフォーム</span></div>
+  <div><nav><div><div class="rpp-nav"><nav><ul>
+    <li><a href="__BASE__/top"><div>トップ</div></a></li>
+    <li><a href="#"><div>キャンペーン</div></a></li>
+    <li><a href="#"><div>キーワード</div></a></li>
+    <li><a href="#"><div>商品</div></a></li>
+    <li><a href="#"><div>予算</div></a></li>
+    <li><a href="__BASE__/report"><div>パフォーマンスレポート</div></a></li>
+  </ul></nav></div></div></nav></div>
+</div>
+"""
+
+_AD_REPORT_FORM = """
+<main>
+  <h1>__LABEL__</h1>
+  <label><input type="radio" name="reportType" id="rdReportTypeCampaign" value="campaign" checked>キャンペーン別</label>
+  <label><input type="radio" name="reportType" id="rdReportTypeItem" value="item">商品別</label>
+  __DATE_INPUTS__
+  <button type="button" id="btnCreateReport">__BUTTON__</button>
+  <p id="message"></p>
+  <a href="__BASE__/history">ダウンロード履歴</a>
+</main>
+<script>
+document.getElementById('btnCreateReport').addEventListener('click', async () => {
+  const start = document.getElementById('startDate');
+  const end = document.getElementById('endDate');
+  const body = {start: start ? start.value : '', end: end ? end.value : ''};
+  const response = await fetch('__BASE__/api/reports', {
+    method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(body)
+  });
+  document.getElementById('message').textContent = response.ok ? 'レポートの作成を受け付けました' : 'エラー';
+});
+</script>
+"""
+
+_DATE_INPUTS = """
+  <input type="text" id="startDate" placeholder="Select start">
+  <input type="text" id="endDate" placeholder="Select end">
+"""
+
+_HISTORY = """
+<main>
+  <h1>ダウンロード履歴</h1>
+  <button type="button" id="btnDownloadHistoryRefresh">更新</button>
+  <table class="table">
+    <thead><tr><th>作成日時・期間</th><th>状態</th><th>ダウンロード</th></tr></thead>
+    <tbody></tbody>
+  </table>
+</main>
+<script>
+async function loadHistory() {
+  const response = await fetch('__BASE__/api/download-history');
+  const payload = await response.json();
+  const rows = payload.result.downloadHistoryList.map((row) => {
+    let link;
+    if (row.status !== '完了') {
+      link = '-';
+    } else if (row.message) {
+      link = row.message;
+    } else {
+      link = '<a href="' + row.downloadUrl + '">ダウンロード</a>';
+    }
+    return '<tr><td>' + row.createdAt + '<br>' + row.period + '</td>'
+      + '<td><div class="cell-content">' + row.status + '</div></td>'
+      + '<td>' + link + '</td></tr>';
+  });
+  document.querySelector('table.table tbody').innerHTML = rows.join('');
+}
+document.getElementById('btnDownloadHistoryRefresh').addEventListener('click', loadHistory);
+loadHistory();
+</script>
+"""
+
+
+def _parse_form_date(value: Any) -> Optional[date]:
+    try:
+        return datetime.strptime(str(value or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def create_app(settings: Optional[MockSettings] = None) -> Starlette:
+    """模擬サーバーのアプリケーションを作る"""
+    state = MockState(settings or MockSettings())
+
+    def _session(request: Request) -> Optional[Dict[str, bool]]:
+        return state.sessions.get(request.cookies.get(SESSION_COOKIE, ""))
+
+    def _redirect(url: str) -> RedirectResponse:
+        return RedirectResponse(url, status_code=303)
+
+    # --- ログイン ---
+
+    async def glogin(request: Request) -> Response:
+        if request.method == "POST":
+            form = await request.form()
+            if not form.get("login_id") or not form.get("passwd"):
+                return _redirect("/glogin/")
+            if state.settings.member_login:
+                return _redirect("/glogin/member")
+            response = _redirect("/glogin/confirm" if state.settings.confirm_screen else "/glogin/menu")
+            response.set_cookie(SESSION_COOKIE, state.new_session(), httponly=True)
+            return response
+        return _page("R-Login", """
+<form method="post" action="/glogin/">
+  <input type="text" name="login_id" placeholder="R-Login ID">
+  <input type="password" name="passwd" placeholder="パスワード">
+  <button type="submit" name="submit">ログイン</button>
+</form>""")
+
+    async def member_login(request: Request) -> Response:
+        if request.method == "POST":
+            form = await request.form()
+            if not form.get("user_id") or not form.get("user_passwd"):
+                return _redirect("/glogin/member")
+            response = _redirect("/glogin/confirm" if state.settings.confirm_screen else "/glogin/menu")
+            response.set_cookie(SESSION_COOKIE, state.new_session(), httponly=True)
+            return response
+        return _page("楽天会員ログイン", """
+<form method="post" action="/glogin/member">
+  <input type="text" name="user_id" placeholder="ユーザID">
+  <input type="password" name="user_passwd" placeholder="パスワード">
+  <button type="submit" name="submit">ログイン</button>
+</form>""")
+
+    async def login_confirm(request: Request) -> Response:
+        if request.method == "POST":
+            return _redirect("/glogin/menu")
+        return _page("確認", """
+<p>ご利用中のアカウントを確認してください。</p>
+<form method="post" action="/glogin/confirm"><button type="submit" name="submit">次へ</button></form>""")
+
+    async def login_menu(request: Request) -> Response:
+        mainmenu_url = str(request.url_for("mainmenu"))
+        return _page("RMS", f'<p>ログインしました。</p><a href="{mainmenu_url}">RMSメインメニューへ</a>')
+
+    # --- メインメニュー ---
+
+    async def mainmenu(request: Request) -> Response:
+        session = _session(request)
+        if session is None:
+            return _redirect("/glogin/")
+        if not session["terms"]:
+            return _page("RMS利用規約", """
+<p>RMS利用規約をご確認ください。</p>
+<form method="post" action="/mainmenu/terms"><button type="submit">RMSを利用します</button></form>""")
+        if not session["notice"]:
+            return _page("お知らせの確認", """
+<form method="post" action="/mainmenu/notice">
+  <label><input type="checkbox" name="confirm" value="1">お知らせを確認しました</label>
+  <button type="submit" class="btn-reset btn-round btn-red">RMSメインメニューへ進む</button>
+</form>""")
+        return _page("RMSメインメニュー", "<h1>RMSメインメニュー</h1>")
+
+    async def mainmenu_terms(request: Request) -> Response:
+        session = _session(request)
+        if session is not None:
+            session["terms"] = True
+        return _redirect("/mainmenu/")
+
+    async def mainmenu_notice(request: Request) -> Response:
+        session = _session(request)
+        form = await request.form()
+        if session is not None and form.get("confirm"):
+            session["notice"] = True
+        return _redirect("/mainmenu/")
+
+    # --- 広告管理画面 ---
+
+    def _slug(request: Request) -> Optional[str]:
+        slug = request.path_params["slug"]
+        return slug if slug in REPORT_SLUGS else None
+
+    async def ad_page(request: Request) -> Response:
+        slug = _slug(request)
+        if slug is None:
+            return Response("Not Found", status_code=404)
+        if _session(request) is None:
+            return _redirect("/glogin/")
+        base = f"/ad/{slug}"
+        is_rpp = slug in RPP_SLUGS
+        form = (
+            _AD_REPORT_FORM
+            .replace("__LABEL__", slug.upper())
+            .replace("__DATE_INPUTS__", _DATE_INPUTS if is_rpp else "")
+            .replace("__BUTTON__", "全商品レポートダウンロード" if is_rpp else "ダウンロード")
+        )
+        body = '<div id="root"><div>' + (_AD_HEADER if is_rpp else "") + form + "</div></div>"
+        return _page(slug.upper(), body.replace("__BASE__", base))
+
+    async def ad_history(request: Request) -> Response:
+        slug = _slug(request)
+        if slug is None:
+            return Response("Not Found", status_code=404)
+        if _session(request) is None:
+            return _redirect("/glogin/")
+        return _page("ダウンロード履歴", _HISTORY.replace("__BASE__", f"/ad/{slug}"))
+
+    async def api_create_report(request: Request) -> Response:
+        slug = _slug(request)
+        if slug is None or _session(request) is None:
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        payload = await request.json()
+        yesterday = datetime.now(_JST).date() - timedelta(days=1)
+        start = _parse_form_date(payload.get("start")) or yesterday
+        end = _parse_form_date(payload.get("end")) or start
+        report = state.create_report(slug, start, max(start, end))
+        return JSONResponse({"id": report["id"]}, status_code=202)
+
+    async def api_download_history(request: Request) -> Response:
+        slug = _slug(request)
+        if slug is None or _session(request) is None:
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        now = time.time()
+        rows = []
+        for report in state.reports[slug][:20]:
+            completed = now >= report["ready_at"]
+            row = {
+                "id": report["id"],
+                "createdAt": datetime.fromtimestamp(report["created_at"], _JST).strftime("%Y/%m/%d %H:%M:%S"),
+                "period": f"{report['start'].strftime('%Y/%m/%d')}～{report['end'].strftime('%Y/%m/%d')}",
+                "status": "完了" if completed else "処理中",
+                "downloadUrl": None,
+                "message": None,
+            }
+            if completed and report["no_data"]:
+                row["message"] = NO_DATA_TEXT
+            elif completed:
+                row["downloadUrl"] = f"/ad/{slug}/download/{report['id']}"
+            rows.append(row)
+        return JSONResponse({"result": {"downloadHistoryList": rows}})
+
+    async def download(request: Request) -> Response:
+        slug = _slug(request)
+        if slug is None:
+            return Response("Not Found", status_code=404)
+        if _session(request) is None:
+            # セッション切れの場合は実際のポータルと同じくログイン画面（HTML）を返す
+            return _redirect("/glogin/")
+        report = state.find_report(slug, int(request.path_params["report_id"]))
+        if report is None or report["no_data"] or time.time() < report["ready_at"]:
+            return Response("Not Found", status_code=404)
+        content = await run_in_threadpool(build_report_zip, slug, report["start"], report["end"], state.settings.rows)
+        state.stats["downloads_total"] += 1
+        state.stats["download_bytes_total"] += len(content)
+        filename = f"{slug}_report_{report['id']}.zip"
+        return Response(
+            content,
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    async def mock_stats(request: Request) -> Response:
+        return JSONResponse({**state.stats, "sessions": len(state.sessions)})
+
+    routes = [
+        Route("/glogin/", glogin, methods=["GET", "POST"]),
+        Route("/glogin/member", member_login, methods=["GET", "POST"]),
+        Route("/glogin/confirm", login_confirm, methods=["GET", "POST"]),
+        Route("/glogin/menu", login_menu),
+        Route("/mainmenu/", mainmenu, name="mainmenu"),
+        Route("/mainmenu/terms", mainmenu_terms, methods=["POST"]),
+        Route("/mainmenu/notice", mainmenu_notice, methods=["POST"]),
+        Route("/ad/{slug}/history", ad_history),
+        Route("/ad/{slug}/api/reports", api_create_report, methods=["POST"]),
+        Route("/ad/{slug}/api/download-history", api_download_history),
+        Route("/ad/{slug}/download/{report_id:int}", download),
+        Route("/ad/{slug}/{page}", ad_page),
+        Route("/_mock/stats", mock_stats),
+    ]
+    app = Starlette(routes=routes)
+    app.state.mock = state
+    return app
+
+
+def service_env(base_url: str) -> Dict[str, str]:
+    """サービスを模擬サーバーに向けるための環境変数"""
+    base_url = base_url.rstrip("/")
+    return {
+        "RMS_LOGIN_URL": f"{base_url}/glogin/",
+        "RMS_MAINMENU_URL": f"{base_url}/mainmenu/",
+        "RMS_AD_BASE_URL": f"{base_url}/ad",
+    }
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    """模擬サーバーの設定を指定するコマンドライン引数を追加する（bench_e2e.py と共用）"""
+    parser.add_argument("--delay", type=float, default=3.0, help="レポート作成の完了までの秒数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="作成時間に加える乱数の最大秒数")
+    parser.add_argument("--rows", type=int, default=1000, help="1日あたりのCSVの行数")
+    parser.add_argument("--no-data-rate", type=float, default=0.0, help="対象データなしにする割合（0〜1）")
+    parser.add_argument("--no-data-dates", nargs="*", default=[], help="常に対象データなしにする日付 (YYYY-MM-DD)")
+    parser.add_argument("--skip-member-login", action="store_true", help="楽天会員ログイン画面を表示しない")
+    parser.add_argument("--skip-confirm", action="store_true", help="ログイン後の確認画面を表示しない")
+    parser.add_argument("--skip-terms", action="store_true", help="RMS利用規約の同意画面を表示しない")
+    parser.add_argument("--notice", action="store_true", help="メインメニュー前の確認画面を表示する")
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        delay=args.delay,
+        jitter=args.jitter,
+        rows=args.rows,
+        no_data_rate=args.no_data_rate,
+        no_data_dates={datetime.strptime(d, "%Y-%m-%d").date() for d in args.no_data_dates},
+        member_login=not args.skip_member_login,
+        confirm_screen=not args.skip_confirm,
+        terms_screen=not args.skip_terms,
+        notice_screen=args.notice,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="楽天RMSの模擬サーバーを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    base_url = f"http://{args.host}:{args.port}"
+    print("サービスを模擬サーバーに向けるには、次の環境変数を設定してください:")
+    for name, value in service_env(base_url).items():
+        print(f"  export {name}={value}")
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
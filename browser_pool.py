@@ -0,0 +1,339 @@
+"""
+ブラウザプール
+Chromiumプロセスとログイン済みBrowserContextをアプリ全体で共有し、リクエストに貸し出す
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from playwright.async_api import async_playwright
+
+from resource_policy import ResourcePolicy
+from session_store import SessionStateStore
+
+logger = logging.getLogger(__name__)
+
+BROWSER_LAUNCH_ARGS = [
+    '--lang=ja-JP,ja',
+    '--no-sandbox',
+    '--font-render-hinting=none',
+    '--disable-gpu',
+    '--disable-dev-shm-usage',
+    '--force-color-profile=srgb',
+    '--force-device-scale-factor=1'
+]
+
+CONTEXT_OPTIONS: Dict[str, Any] = {
+    "accept_downloads": True,
+    "viewport": {"width": 1920, "height": 1080},
+    "user_agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    "locale": 'ja-JP',
+}
+
+
+class BrowserPoolTimeoutError(Exception):
+    """ブラウザの貸し出し待ち、または貸し出し時間の上限を超えた場合のエラー"""
+
+
+class BrowserSlot:
+    """プール内の1ブラウザ分（Chromiumプロセス + BrowserContext）"""
+
+    def __init__(self, slot_id: int):
+        self.slot_id = slot_id
+        self.browser = None
+        self.context = None
+        self.logged_in = False
+        self.seeded = False
+        self.jobs = 0
+        self.started_at: Optional[float] = None
+        self.last_used_at: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.browser is not None and self.context is not None and self.browser.is_connected()
+
+
+class BrowserLease:
+    """リクエストに貸し出されたブラウザ。ページは返却時にまとめて閉じる"""
+
+    def __init__(self, slot: BrowserSlot, pool: "BrowserPool"):
+        self._slot = slot
+        self._pool = pool
+        self._pages: List[Any] = []
+        self.idle_seconds = time.time() - slot.last_used_at if slot.last_used_at else 0.0
+
+    @property
+    def context(self):
+        return self._slot.context
+
+    @property
+    def logged_in(self) -> bool:
+        return self._slot.logged_in
+
+    @property
+    def seeded(self) -> bool:
+        """保存済みセッションから復元したコンテキストかどうか（未検証）"""
+        return self._slot.seeded
+
+    @property
+    def needs_probe(self) -> bool:
+        """ログイン状態の確認が必要かどうか（復元直後、または一定時間使われていなかった場合）"""
+        if self._slot.seeded:
+            return True
+        probe_interval = self._pool.session_probe_interval
+        return self._slot.logged_in and probe_interval > 0 and self.idle_seconds > probe_interval
+
+    def mark_logged_in(self) -> None:
+        """ログイン完了を記録する（以降の貸し出しではログインを省略できる）"""
+        self._slot.logged_in = True
+        self._slot.seeded = False
+
+    def mark_logged_out(self) -> None:
+        """セッション切れを記録する"""
+        self._slot.logged_in = False
+        self._slot.seeded = False
+
+    async def persist_session(self) -> None:
+        """現在のコンテキストのstorage_stateを保存し、以降に起動するブラウザへ引き継ぐ"""
+        await self._pool.save_session(self._slot)
+
+    async def new_page(self):
+        page = await self._slot.context.new_page()
+        self._pages.append(page)
+        return page
+
+    async def close_pages(self) -> None:
+        for page in self._pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._pages.clear()
+
+
+class BrowserPool:
+    """
+    ウォーム状態のChromiumとログイン済みコンテキストを保持するプール
+
+    Args:
+        size (int): 同時に保持するブラウザ数
+        max_jobs_per_browser (int): この回数貸し出したらブラウザを作り直す
+        acquire_timeout (float): 空きブラウザを待つ最大秒数
+        lease_timeout (float): 1回の貸し出しで保持できる最大秒数（0以下で無制限）
+        headless (bool): ヘッドレスモードで起動するかどうか
+        prewarm (bool): 起動時に全ブラウザを立ち上げておくかどうか
+        session_store (Optional[SessionStateStore]): ログインセッションの保存先。新しいコンテキストはここから復元する
+        session_probe_interval (float): この秒数以上使われていないログイン済みコンテキストはログイン状態を確認してから使う
+        resource_policy (Optional[ResourcePolicy]): 新しいコンテキストに設定するリソースの遮断ルール
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_jobs_per_browser: int = 20,
+        acquire_timeout: float = 120.0,
+        lease_timeout: float = 900.0,
+        headless: bool = True,
+        prewarm: bool = False,
+        session_store: Optional[SessionStateStore] = None,
+        session_probe_interval: float = 300.0,
+        resource_policy: Optional[ResourcePolicy] = None
+    ):
+        self.size = max(1, size)
+        self.max_jobs_per_browser = max(1, max_jobs_per_browser)
+        self.acquire_timeout = acquire_timeout
+        self.lease_timeout = lease_timeout
+        self.headless = headless
+        self.prewarm = prewarm
+        self.session_store = session_store
+        self.session_probe_interval = session_probe_interval
+        self.resource_policy = resource_policy
+
+        self._playwright = None
+        self._slots: List[BrowserSlot] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._closed = False
+        self._stats = {
+            "leases_total": 0,
+            "launched_total": 0,
+            "recycled_total": 0,
+            "acquire_timeouts_total": 0,
+            "lease_timeouts_total": 0,
+        }
+
+    async def start(self) -> None:
+        """Playwrightを起動し、スロットを初期化する"""
+        self._playwright = await async_playwright().start()
+        self._idle = asyncio.Queue()
+        self._slots = [BrowserSlot(i) for i in range(self.size)]
+        for slot in self._slots:
+            if self.prewarm:
+                try:
+                    await self._launch(slot)
+                except Exception as e:
+                    logger.warning(f"ブラウザの事前起動に失敗しました（スロット{slot.slot_id}）: {str(e)}")
+            self._idle.put_nowait(slot)
+        logger.info(f"ブラウザプールを開始しました: サイズ={self.size}, 最大ジョブ数={self.max_jobs_per_browser}")
+
+    async def close(self) -> None:
+        """全ブラウザとPlaywrightを停止する"""
+        self._closed = True
+        for slot in self._slots:
+            await self._shutdown_slot(slot)
+        if self._playwright:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+        logger.info("ブラウザプールを停止しました")
+
+    async def _launch(self, slot: BrowserSlot) -> None:
+        slot.browser = await self._playwright.chromium.launch(
+            headless=self.headless,
+            args=BROWSER_LAUNCH_ARGS
+        )
+        storage_state = self.session_store.load() if self.session_store else None
+        if storage_state:
+            slot.context = await slot.browser.new_context(storage_state=storage_state, **CONTEXT_OPTIONS)
+        else:
+            slot.context = await slot.browser.new_context(**CONTEXT_OPTIONS)
+        if self.resource_policy:
+            await self.resource_policy.install(slot.context)
+        slot.logged_in = False
+        slot.seeded = storage_state is not None
+        slot.jobs = 0
+        slot.started_at = time.time()
+        self._stats["launched_total"] += 1
+        logger.info(f"ブラウザを起動しました（スロット{slot.slot_id}）")
+
+    async def _shutdown_slot(self, slot: BrowserSlot) -> None:
+        if slot.context:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        if slot.browser:
+            try:
+                await slot.browser.close()
+            except Exception:
+                pass
+        slot.browser = None
+        slot.context = None
+        slot.logged_in = False
+        slot.seeded = False
+        slot.jobs = 0
+        slot.started_at = None
+        slot.last_used_at = None
+
+    async def save_session(self, slot: BrowserSlot) -> None:
+        if not self.session_store or not slot.context:
+            return
+        try:
+            state = await slot.context.storage_state()
+        except Exception as e:
+            logger.warning(f"storage_stateの取得に失敗しました: {str(e)}")
+            return
+        self.session_store.save(state)
+
+    async def _recycle(self, slot: BrowserSlot, reason: str) -> None:
+        logger.info(f"ブラウザを再作成します（スロット{slot.slot_id}, 理由: {reason}）")
+        await self._shutdown_slot(slot)
+        self._stats["recycled_total"] += 1
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        ブラウザを1つ借りる
+
+        例外で抜けた場合はブラウザを破棄し、次回の貸し出し時に作り直す。
+
+        Raises:
+            BrowserPoolTimeoutError: 空きブラウザを待つ時間、または貸し出し時間の上限を超えた場合
+        """
+        if self._closed or self._idle is None:
+            raise RuntimeError("ブラウザプールが開始されていません")
+
+        try:
+            slot = await asyncio.wait_for(self._idle.get(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats["acquire_timeouts_total"] += 1
+            raise BrowserPoolTimeoutError(
+                f"空きブラウザを{self.acquire_timeout}秒以内に確保できませんでした"
+            ) from None
+
+        recycle_reason: Optional[str] = None
+        lease = BrowserLease(slot, self)
+        expired = False
+        expire_handle = None
+        try:
+            if not slot.is_ready:
+                if slot.browser is not None:
+                    await self._shutdown_slot(slot)
+                await self._launch(slot)
+
+            slot.jobs += 1
+            self._stats["leases_total"] += 1
+
+            if self.lease_timeout and self.lease_timeout > 0:
+                task = asyncio.current_task()
+
+                def _expire():
+                    nonlocal expired
+                    expired = True
+                    task.cancel()
+
+                expire_handle = asyncio.get_running_loop().call_later(self.lease_timeout, _expire)
+
+            try:
+                yield lease
+            except asyncio.CancelledError:
+                if expired:
+                    self._stats["lease_timeouts_total"] += 1
+                    recycle_reason = "貸し出し時間超過"
+                    raise BrowserPoolTimeoutError(
+                        f"ブラウザの貸し出し時間が上限（{self.lease_timeout}秒）を超えました"
+                    ) from None
+                recycle_reason = "キャンセル"
+                raise
+            except BaseException:
+                recycle_reason = "エラー"
+                raise
+
+            if slot.jobs >= self.max_jobs_per_browser:
+                recycle_reason = f"ジョブ数上限（{self.max_jobs_per_browser}）"
+        except BaseException:
+            if recycle_reason is None:
+                recycle_reason = "起動エラー"
+            raise
+        finally:
+            if expire_handle:
+                expire_handle.cancel()
+            # 後片付け中にキャンセルされてもスロットは必ずプールに返す
+            try:
+                await lease.close_pages()
+                slot.last_used_at = time.time()
+                if recycle_reason:
+                    await self._recycle(slot, recycle_reason)
+            except BaseException:
+                # 後片付けが途中で終わったブラウザは状態が不明なため、次回の貸し出し時に作り直す
+                slot.context = None
+                raise
+            finally:
+                self._idle.put_nowait(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """プールの状態を返す"""
+        idle = self._idle.qsize() if self._idle else 0
+        return {
+            "size": self.size,
+            "idle": idle,
+            "in_use": len(self._slots) - idle,
+            "running_browsers": sum(1 for s in self._slots if s.browser is not None),
+            "logged_in_contexts": sum(1 for s in self._slots if s.logged_in),
+            "max_jobs_per_browser": self.max_jobs_per_browser,
+            "resource_policy": self.resource_policy.stats() if self.resource_policy else None,
+            **self._stats,
+        }
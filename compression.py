@@ -0,0 +1,268 @@
+"""
+レスポンスの圧縮
+Accept-Encoding に従って gzip / zstd を選び、レスポンスを圧縮する
+
+キャッシュしたレポートは保存時に一度だけ圧縮しておき、リクエストごとに圧縮せずにそのまま返す。
+それ以外のレスポンスは CompressionMiddleware が送信しながら圧縮する。
+zstd の利用には zstandard が必要。
+"""
+import logging
+import os
+import tempfile
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ENCODING_GZIP = "gzip"
+ENCODING_ZSTD = "zstd"
+
+# 対応している圧縮形式（クライアントの優先度が同じ場合はこの順に選ぶ）
+SUPPORTED_ENCODINGS = (ENCODING_ZSTD, ENCODING_GZIP)
+
+# 事前に圧縮したファイルの拡張子
+ENCODING_SUFFIXES = {
+    ENCODING_GZIP: "gz",
+    ENCODING_ZSTD: "zst",
+}
+
+DEFAULT_LEVELS = {
+    ENCODING_GZIP: 6,
+    ENCODING_ZSTD: 3,
+}
+
+# 圧縮するContent-Type（Parquet・ZIPなど、それ自体が圧縮されている形式は含めない）
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/vnd.apache.arrow.stream",
+)
+
+# これ以上のチャンクは圧縮をイベントループの外で実行する
+OFFLOAD_BYTES = 64 * 1024
+
+CHUNK_BYTES = 256 * 1024
+
+
+def available_encodings(names: Iterable[str]) -> Tuple[str, ...]:
+    """指定された圧縮形式のうち、この環境で使えるものを指定された順に返す"""
+    encodings = []
+    for name in names:
+        name = name.strip().lower()
+        if name not in SUPPORTED_ENCODINGS or name in encodings:
+            continue
+        if name == ENCODING_ZSTD and zstandard is None:
+            logger.warning("zstandardがインストールされていないため、zstd圧縮は使用しません")
+            continue
+        encodings.append(name)
+    return tuple(encodings)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], encodings: Sequence[str]) -> Optional[str]:
+    """
+    Accept-Encoding から使う圧縮形式を選ぶ
+
+    q値が最も高いものを選び、同じ場合は encodings の順に選ぶ。
+    q=0 の形式と、指定されていない形式は使わない（"*" は指定されていない形式すべてにあたる）。
+
+    Returns:
+        Optional[str]: 圧縮形式。圧縮しない場合はNone
+    """
+    if not accept_encoding or not encodings:
+        return None
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[token] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    """圧縮して効果のあるContent-Typeかどうか"""
+    if not media_type:
+        return False
+    media_type = media_type.split(";", 1)[0].strip().lower()
+    return any(media_type.startswith(prefix) for prefix in COMPRESSIBLE_MEDIA_TYPES)
+
+
+def new_compressor(encoding: str, level: Optional[int] = None):
+    """compress(data) と flush() を持つ圧縮オブジェクトを返す"""
+    if level is None:
+        level = DEFAULT_LEVELS[encoding]
+    if encoding == ENCODING_GZIP:
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if encoding == ENCODING_ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"対応していない圧縮形式です: {encoding}")
+
+
+def compress_file(src_path: str, dst_path: str, encoding: str, level: Optional[int] = None) -> int:
+    """
+    ファイルを一定サイズずつ圧縮して保存する（一時ファイルに書き込んでからリネームする）
+
+    Returns:
+        int: 書き込んだバイト数
+    """
+    compressor = new_compressor(encoding, level)
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".compress_", suffix=".tmp", dir=dst_dir)
+    try:
+        with open(src_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            while True:
+                chunk = src.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.flush())
+            written = dst.tell()
+        os.replace(tmp_path, dst_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return written
+
+
+def _get_header(headers: Iterable[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Accept-Encoding に従い、レスポンスを送信しながら圧縮するASGIミドルウェア
+
+    Content-Encoding が設定済みのレスポンス（事前に圧縮したキャッシュなど）、圧縮に向かない形式、
+    部分レスポンス、minimum_size 未満の小さなレスポンスはそのまま返す。
+
+    Args:
+        app: ASGIアプリ
+        encodings (Sequence[str]): 使う圧縮形式（優先順）
+        minimum_size (int): これより小さいレスポンスは圧縮しない（バイト）
+        levels (Optional[Dict[str, int]]): 圧縮形式ごとの圧縮レベル
+        run (Optional[Callable]): 大きなチャンクの圧縮を実行するコルーチン関数（func, *args を受け取る）。
+            指定しない場合はイベントループ上で圧縮する
+    """
+
+    def __init__(
+        self,
+        app,
+        encodings: Sequence[str] = SUPPORTED_ENCODINGS,
+        minimum_size: int = 1024,
+        levels: Optional[Dict[str, int]] = None,
+        run: Optional[Callable[..., Awaitable[Any]]] = None
+    ):
+        self.app = app
+        self.encodings = tuple(encodings)
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.run = run
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(_get_header(scope.get("headers", []), b"accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(self, send, encoding))
+
+
+class _CompressingSender:
+    """1つのレスポンスの送信を受け取り、必要であれば圧縮して送る"""
+
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str):
+        self.middleware = middleware
+        self.send = send
+        self.encoding = encoding
+        self.start_message: Optional[dict] = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            if not self._should_compress(message):
+                self.passthrough = True
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.compressor = new_compressor(self.encoding, self.middleware.levels.get(self.encoding))
+            metrics.COMPRESSED_RESPONSES.inc(self.encoding, "on_the_fly")
+            await self.send({**self.start_message, "headers": self._compressed_headers()})
+
+        data = await self._run(self.compressor.compress, body) if body else b""
+        if not more_body:
+            data += await self._run(self.compressor.flush)
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _should_compress(self, message: dict) -> bool:
+        status = message.get("status", 200)
+        if status < 200 or status in (204, 206, 304):
+            return False
+        headers = message.get("headers", [])
+        if _get_header(headers, b"content-encoding") or _get_header(headers, b"content-range"):
+            return False
+        return is_compressible(_get_header(headers, b"content-type"))
+
+    def _compressed_headers(self) -> List[Tuple[bytes, bytes]]:
+        original = self.start_message.get("headers", [])
+        # 圧縮後のバイト列は元と異なるため、長さ・Rangeの対応は外し、強いETagは弱いETagにする
+        headers = [
+            (key, value) for key, value in original
+            if key.lower() not in (b"content-length", b"vary", b"accept-ranges", b"etag")
+        ]
+        etag = _get_header(original, b"etag")
+        if etag:
+            headers.append((b"etag", (etag if etag.startswith("W/") else f"W/{etag}").encode("latin-1")))
+        vary = _get_header(original, b"vary")
+        if vary and "accept-encoding" not in vary.lower():
+            vary = f"{vary}, Accept-Encoding"
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        headers.append((b"vary", (vary or "Accept-Encoding").encode("latin-1")))
+        return headers
+
+    async def _run(self, func: Callable[..., bytes], *args: Any) -> bytes:
+        if self.middleware.run is not None and sum(len(a) for a in args) >= OFFLOAD_BYTES:
+            return await self.middleware.run(func, *args)
+        return func(*args)
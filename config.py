@@ -7,69 +7,79 @@ import os
 from pathlib import Path
 from typing import Dict
 
-# .envファイルの読み込み（存在する場合）
-try:
-    from dotenv import load_dotenv
-    import sys
-    import os
-    
-    # .envファイルを探す（複数の場所をチェック）
-    env_paths = []
-    
-    # 実行ファイルの場合と通常のPython実行の場合でパスを調整
-    if getattr(sys, 'frozen', False):
-        # Nuitkaでコンパイルされた実行ファイルの場合
-        executable_path = Path(sys.executable)
+from resource_policy import DEFAULT_ALLOWED_HOSTS, DEFAULT_BLOCKED_HOSTS
+
+
+def load_env_file() -> None:
+    """
+    .envファイルを読み込む（存在する場合）
+    起動時に自動で呼ばれる。設定変更を反映するために再度呼び出すこともできる
+    """
+    try:
+        from dotenv import load_dotenv
+        import sys
+        import os
+    
+        # .envファイルを探す（複数の場所をチェック）
+        env_paths = []
+    
+        # 実行ファイルの場合と通常のPython実行の場合でパスを調整
+        if getattr(sys, 'frozen', False):
+            # Nuitkaでコンパイルされた実行ファイルの場合
+            executable_path = Path(sys.executable)
         
-        # ワンファイルモードの場合、一時ディレクトリではなく元の実行ファイルの場所を探す
-        # sys.executableは一時ディレクトリ内のパスになるため、元のパスを取得
-        if hasattr(sys, '_MEIPASS'):
-            # PyInstallerの場合
-            base_path = Path(sys.executable).parent
-        else:
-            # Nuitkaの場合
-            # 実行ファイルの実際のパスを取得（シンボリックリンクを解決）
-            try:
-                real_executable = os.path.realpath(sys.executable)
-                base_path = Path(real_executable).parent
-            except:
+            # ワンファイルモードの場合、一時ディレクトリではなく元の実行ファイルの場所を探す
+            # sys.executableは一時ディレクトリ内のパスになるため、元のパスを取得
+            if hasattr(sys, '_MEIPASS'):
+                # PyInstallerの場合
                 base_path = Path(sys.executable).parent
-    else:
-        # 通常のPython実行の場合
-        base_path = Path(__file__).parent
-    
-    # .envファイルを探す場所のリスト
-    env_paths = [
-        base_path / '.env',  # 実行ファイル/スクリプトと同じディレクトリ
-        base_path.parent / '.env',  # 親ディレクトリ（プロジェクトルート）
-        Path.cwd() / '.env',  # カレントディレクトリ（実行時の作業ディレクトリ）
-    ]
-    
-    # ワンファイルモードの場合、元の実行ファイルの場所も追加でチェック
-    if getattr(sys, 'frozen', False) and not hasattr(sys, '_MEIPASS'):
-        # Nuitkaワンファイルモードの場合、環境変数から元のパスを取得
-        original_executable = os.environ.get('NUITKA_ORIGINAL_EXECUTABLE')
-        if original_executable:
-            env_paths.insert(0, Path(original_executable).parent / '.env')
-    
-    # カレントディレクトリを最優先でチェック（実行時の作業ディレクトリ）
-    # これにより、cd dist && ./rms-rpp-api のように実行した場合に dist/.env を読み込める
-    cwd_env = Path.cwd() / '.env'
-    if cwd_env.exists() and cwd_env.is_file():
-        load_dotenv(cwd_env, override=True)
-    else:
-        # .envファイルを読み込む（最初に見つかったものを使用）
-        for env_path in env_paths:
-            if env_path.exists() and env_path.is_file():
-                load_dotenv(env_path, override=True)
-                break
-except ImportError:
-    pass  # python-dotenvがインストールされていない場合はスキップ
-except Exception as e:
-    # エラーが発生しても処理を続行（環境変数が直接設定されている場合もあるため）
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.debug(f".envファイルの読み込み中にエラーが発生しました: {str(e)}")
+            else:
+                # Nuitkaの場合
+                # 実行ファイルの実際のパスを取得（シンボリックリンクを解決）
+                try:
+                    real_executable = os.path.realpath(sys.executable)
+                    base_path = Path(real_executable).parent
+                except:
+                    base_path = Path(sys.executable).parent
+        else:
+            # 通常のPython実行の場合
+            base_path = Path(__file__).parent
+    
+        # .envファイルを探す場所のリスト
+        env_paths = [
+            base_path / '.env',  # 実行ファイル/スクリプトと同じディレクトリ
+            base_path.parent / '.env',  # 親ディレクトリ（プロジェクトルート）
+            Path.cwd() / '.env',  # カレントディレクトリ（実行時の作業ディレクトリ）
+        ]
+    
+        # ワンファイルモードの場合、元の実行ファイルの場所も追加でチェック
+        if getattr(sys, 'frozen', False) and not hasattr(sys, '_MEIPASS'):
+            # Nuitkaワンファイルモードの場合、環境変数から元のパスを取得
+            original_executable = os.environ.get('NUITKA_ORIGINAL_EXECUTABLE')
+            if original_executable:
+                env_paths.insert(0, Path(original_executable).parent / '.env')
+    
+        # カレントディレクトリを最優先でチェック（実行時の作業ディレクトリ）
+        # これにより、cd dist && ./rms-rpp-api のように実行した場合に dist/.env を読み込める
+        cwd_env = Path.cwd() / '.env'
+        if cwd_env.exists() and cwd_env.is_file():
+            load_dotenv(cwd_env, override=True)
+        else:
+            # .envファイルを読み込む（最初に見つかったものを使用）
+            for env_path in env_paths:
+                if env_path.exists() and env_path.is_file():
+                    load_dotenv(env_path, override=True)
+                    break
+    except ImportError:
+        pass  # python-dotenvがインストールされていない場合はスキップ
+    except Exception as e:
+        # エラーが発生しても処理を続行（環境変数が直接設定されている場合もあるため）
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.debug(f".envファイルの読み込み中にエラーが発生しました: {str(e)}")
+
+
+load_env_file()
 
 
 def get_rms_credentials() -> Dict[str, str]:
@@ -159,3 +169,220 @@ def get_oauth_settings() -> Dict[str, str]:
         "access_token_expire_minutes": int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     }
 
+
+def get_admin_settings() -> Dict[str, object]:
+    """
+    管理者の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（users）
+            users は /admin/* エンドポイントを利用できるユーザー名（パスワード認証のユーザーのみ）
+    """
+    return {
+        "users": [u.strip() for u in os.getenv("ADMIN_USERS", "admin").split(",") if u.strip()],
+    }
+
+
+def get_browser_pool_settings() -> Dict[str, object]:
+    """
+    ブラウザプール設定を取得する
+    
+    Returns:
+        Dict[str, object]: ブラウザプール設定（size, max_jobs_per_browser, acquire_timeout, lease_timeout, headless, prewarm）
+    """
+    return {
+        "size": int(os.getenv("BROWSER_POOL_SIZE", "2")),
+        "max_jobs_per_browser": int(os.getenv("BROWSER_POOL_MAX_JOBS", "20")),
+        "acquire_timeout": float(os.getenv("BROWSER_POOL_ACQUIRE_TIMEOUT", "120")),
+        "lease_timeout": float(os.getenv("BROWSER_POOL_LEASE_TIMEOUT", "900")),
+        "headless": os.getenv("BROWSER_HEADLESS", "true").lower() != "false",
+        "prewarm": os.getenv("BROWSER_POOL_PREWARM", "false").lower() == "true",
+    }
+
+
+def get_session_state_settings() -> Dict[str, object]:
+    """
+    ログインセッション永続化の設定を取得する
+    
+    Returns:
+        Dict[str, object]: セッション保存設定（enabled, path, secret, max_age_seconds, probe_interval）
+    """
+    return {
+        "enabled": os.getenv("SESSION_STATE_ENABLED", "true").lower() != "false",
+        "path": os.getenv("SESSION_STATE_PATH", "data/rms_session_state.enc"),
+        # 専用の鍵がなければJWT用のSECRET_KEYから導出する
+        "secret": os.getenv("SESSION_STATE_KEY") or os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production"),
+        "max_age_seconds": float(os.getenv("SESSION_STATE_MAX_AGE_HOURS", "12")) * 3600,
+        "probe_interval": float(os.getenv("SESSION_PROBE_IDLE_SECONDS", "300")),
+    }
+
+
+def get_report_cache_settings() -> Dict[str, object]:
+    """
+    レポートキャッシュ設定を取得する
+    
+    Returns:
+        Dict[str, object]: キャッシュ設定（enabled, cache_dir, immutable_after_days, recent_ttl_seconds, max_bytes）
+    """
+    return {
+        "enabled": os.getenv("REPORT_CACHE_ENABLED", "true").lower() != "false",
+        "cache_dir": os.getenv("REPORT_CACHE_DIR", "data/report_cache"),
+        "immutable_after_days": int(os.getenv("REPORT_CACHE_IMMUTABLE_DAYS", "7")),
+        "recent_ttl_seconds": float(os.getenv("REPORT_CACHE_TTL_SECONDS", "3600")),
+        "max_bytes": int(float(os.getenv("REPORT_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+    }
+
+
+def get_report_store_settings() -> Dict[str, object]:
+    """
+    レポートの蓄積（SQLite）の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（enabled, db_path, max_rows）
+            max_rows は検索結果として返す最大行数
+    """
+    return {
+        "enabled": os.getenv("REPORT_STORE_ENABLED", "true").lower() != "false",
+        "db_path": os.getenv("REPORT_STORE_PATH", "data/report_store.sqlite3"),
+        "max_rows": int(os.getenv("REPORT_STORE_MAX_ROWS", "100000")),
+    }
+
+
+def get_report_range_settings() -> Dict[str, object]:
+    """
+    期間レポートの設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（limit_days）
+            limit_days は1回のリクエストで指定できる最大日数（ポータルの上限を超える分は分割して取得する）
+    """
+    return {
+        "limit_days": int(os.getenv("REPORT_RANGE_LIMIT_DAYS", "366")),
+    }
+
+
+def get_report_batch_settings() -> Dict[str, object]:
+    """
+    バッチ取得の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（max_items）
+            max_items は1回のバッチで取得できる最大件数（種別数 × 日付数）
+    """
+    return {
+        "max_items": int(os.getenv("REPORT_BATCH_MAX_ITEMS", "60")),
+    }
+
+
+def get_job_settings() -> Dict[str, object]:
+    """
+    非同期ジョブの設定を取得する
+    
+    Returns:
+        Dict[str, object]: ジョブ設定（db_path, result_dir, retention_seconds, max_concurrency）
+    """
+    return {
+        "db_path": os.getenv("JOB_DB_PATH", "data/jobs.sqlite3"),
+        "result_dir": os.getenv("JOB_RESULT_DIR", "data/job_results"),
+        "retention_seconds": float(os.getenv("JOB_RESULT_RETENTION_HOURS", "24")) * 3600,
+        "max_concurrency": int(os.getenv("JOB_MAX_CONCURRENCY", "4")),
+    }
+
+
+def get_file_executor_settings() -> Dict[str, object]:
+    """
+    ファイル処理ワーカーとイベントループ遅延計測の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（max_workers, transcode_processes, lag_interval, lag_warn_threshold）
+    """
+    return {
+        "max_workers": int(os.getenv("FILE_WORKERS", "4")),
+        "transcode_processes": int(os.getenv("TRANSCODE_PROCESSES", "0")),
+        "lag_interval": float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5")),
+        "lag_warn_threshold": float(os.getenv("EVENT_LOOP_LAG_WARN_MS", "200")) / 1000,
+    }
+
+
+def get_resource_policy_settings() -> Dict[str, object]:
+    """
+    リソースポリシー（ブラウザで読み込まないリソース）の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（mode, blocked_hosts, allowed_hosts）
+    """
+    def _hosts(name: str, default) -> list:
+        value = os.getenv(name)
+        return [h.strip() for h in value.split(",") if h.strip()] if value is not None else list(default)
+    
+    return {
+        "mode": os.getenv("RESOURCE_POLICY", "standard").lower(),
+        "blocked_hosts": _hosts("RESOURCE_POLICY_BLOCK_HOSTS", DEFAULT_BLOCKED_HOSTS),
+        "allowed_hosts": _hosts("RESOURCE_POLICY_ALLOW_HOSTS", DEFAULT_ALLOWED_HOSTS),
+    }
+
+
+def get_prefetch_settings() -> Dict[str, object]:
+    """
+    前日レポートの事前取得の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（report_types, run_at, max_attempts, retry_interval, cache_ttl_seconds）
+            report_types が空の場合は事前取得を行わない
+    """
+    return {
+        "report_types": [t.strip() for t in os.getenv("PREFETCH_REPORT_TYPES", "").split(",") if t.strip()],
+        "run_at": os.getenv("PREFETCH_TIME", "07:00"),
+        "max_attempts": int(os.getenv("PREFETCH_MAX_ATTEMPTS", "8")),
+        "retry_interval": float(os.getenv("PREFETCH_RETRY_MINUTES", "15")) * 60,
+        "cache_ttl_seconds": float(os.getenv("PREFETCH_CACHE_TTL_HOURS", "12")) * 3600,
+    }
+
+
+def get_admission_settings() -> Dict[str, object]:
+    """
+    ブラウザを使う取得処理の受付制御の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（max_concurrent, per_client_limit, max_queue, queue_timeout）
+            max_concurrent の既定値はブラウザプールのサイズ
+    """
+    return {
+        "max_concurrent": int(os.getenv("ADMISSION_MAX_CONCURRENT") or os.getenv("BROWSER_POOL_SIZE", "2")),
+        "per_client_limit": int(os.getenv("ADMISSION_PER_CLIENT", "2")),
+        "max_queue": int(os.getenv("ADMISSION_MAX_QUEUE", "10")),
+        "queue_timeout": float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "120")),
+    }
+
+
+def get_compression_settings() -> Dict[str, object]:
+    """
+    レスポンス圧縮の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（enabled, encodings, minimum_size, precompress, levels）
+            encodings は優先順。zstd はzstandardがインストールされている場合のみ使う
+    """
+    return {
+        "enabled": os.getenv("COMPRESSION_ENABLED", "true").lower() != "false",
+        "encodings": [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "zstd,gzip").split(",") if e.strip()],
+        "minimum_size": int(os.getenv("COMPRESSION_MIN_BYTES", "1024")),
+        "precompress": os.getenv("COMPRESSION_PRECOMPRESS", "true").lower() != "false",
+        "levels": {
+            "gzip": int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+            "zstd": int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3")),
+        },
+    }
+
+
+def get_metrics_settings() -> Dict[str, object]:
+    """
+    メトリクス（/metrics）の設定を取得する
+    
+    Returns:
+        Dict[str, object]: 設定（token）
+            token を設定しない場合は認証なしで公開する
+    """
+    return {
+        "token": os.getenv("METRICS_TOKEN") or None,
+    }
@@ -0,0 +1,154 @@
+"""
+CSVストリーミング変換
+Shift_JISのレポートCSVを一定サイズずつデコードし、UTF-8のチャンクとして送出する
+ファイル全体をメモリに読み込まないため、レポートの大きさに関わらずメモリ使用量は一定になる
+ダウンロードしたZIPはディスクに展開せず、対象のメンバーを直接読み込む
+"""
+import io
+import logging
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# レポート先頭のメタ情報・注意書きの行数
+SKIP_HEADER_LINES = 6
+
+# 1回にデコードする文字数 / ファイルから読み込むバイト数
+CHUNK_CHARS = 64 * 1024
+CHUNK_BYTES = 256 * 1024
+
+
+def iter_converted_csv(
+    src: BinaryIO,
+    skip_lines: int = SKIP_HEADER_LINES,
+    chunk_chars: int = CHUNK_CHARS
+) -> Iterator[bytes]:
+    """
+    Shift_JISのCSVをUTF-8（BOMなし）に変換しながらチャンクを返す
+
+    従来の一括変換と同じく、改行はLFに統一し、行数が skip_lines を超える場合のみ先頭 skip_lines 行を取り除く。
+    デコードできないバイトは置換文字に置き換える。
+
+    Args:
+        src: 読み込み元（バイナリモード）
+        skip_lines: 先頭から取り除く行数
+        chunk_chars: 1回にデコードする文字数
+
+    Yields:
+        bytes: UTF-8のチャンク
+    """
+    # TextIOWrapperはインクリメンタルデコーダーを使うため、マルチバイト文字がチャンク境界で分断されても正しく復号できる
+    text = io.TextIOWrapper(src, encoding="shift_jis", errors="replace", newline=None)
+    try:
+        head = []
+        for _ in range(skip_lines + 1):
+            line = text.readline()
+            if not line:
+                break
+            head.append(line)
+        if len(head) > skip_lines:
+            head = head[skip_lines:]
+        if head:
+            yield "".join(head).encode("utf-8")
+
+        while True:
+            chunk = text.read(chunk_chars)
+            if not chunk:
+                break
+            yield chunk.encode("utf-8")
+    finally:
+        # 読み込み元のクローズは呼び出し元に任せる
+        text.detach()
+
+
+def find_report_member(zf: zipfile.ZipFile, report_slug: Optional[str] = None) -> zipfile.ZipInfo:
+    """
+    ZIP内のレポートCSVを特定する（ファイル名にレポート種別スラッグを含むものを優先する）
+
+    Raises:
+        ValueError: ZIP内にCSVファイルがない場合
+    """
+    members = [
+        info for info in zf.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(".csv")
+    ]
+    if not members:
+        raise ValueError("ZIPファイル内にCSVファイルが見つかりませんでした。")
+    if report_slug:
+        matched = [info for info in members if report_slug in os.path.basename(info.filename).lower()]
+        if matched:
+            return matched[0]
+        logger.warning("レポート種別名を含むCSVが見つからなかったため、最初のCSVを使用します。")
+    return members[0]
+
+
+@contextmanager
+def open_report_csv(path: str, report_slug: Optional[str] = None) -> Iterator[BinaryIO]:
+    """
+    ダウンロードしたレポートのCSVを開く
+    ZIPの場合は対象のメンバーを展開せずに読み込み、それ以外はファイルをそのまま開く
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            info = find_report_member(zf, report_slug)
+            logger.info(f"ZIP内のCSVを読み込みます: {info.filename} ({info.file_size}バイト)")
+            with zf.open(info) as member:
+                yield member
+    else:
+        with open(path, "rb") as f:
+            yield f
+
+
+def convert_csv_file(src_path: str, dst_path: str, report_slug: Optional[str] = None) -> int:
+    """
+    ダウンロードしたレポート（ZIPまたはShift_JISのCSV）をUTF-8のCSVに変換して保存する
+    （一時ファイルに書き込んでからリネームする）
+
+    Returns:
+        int: 書き込んだバイト数
+    """
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".convert_", suffix=".tmp", dir=dst_dir)
+    written = 0
+    try:
+        with open_report_csv(src_path, report_slug) as src, os.fdopen(fd, "wb") as dst:
+            for chunk in iter_converted_csv(src):
+                dst.write(chunk)
+                written += len(chunk)
+        os.replace(tmp_path, dst_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return written
+
+
+def iter_file_range(f: BinaryIO, start: int, length: int, chunk_size: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """開いたファイルの start から length バイトを一定サイズずつ返し、最後に閉じる（Rangeリクエスト用）"""
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def iter_file_chunks(f: BinaryIO, chunk_size: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """開いたファイルを一定サイズずつ返し、最後に閉じる"""
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
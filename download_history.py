@@ -0,0 +1,218 @@
+"""
+ダウンロード履歴APIの解析
+履歴ページ（Reactアプリ）が一覧の取得に使うXHRのJSONから、最新行の状態を読み取る
+
+APIの形式は公開されていないため、よく使われるキー名を順に探す寛容な解析にしている。
+読み取れない場合はNoneを返し、呼び出し元は従来どおりDOMから状態を読む。
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin
+
+# 履歴APIとみなすレスポンスのURL
+DEFAULT_HISTORY_URL_PATTERN = r"(?i)download[-_]?history|/history"
+
+NO_DATA_TEXT = "対象データがありません"
+
+_STATUS_KEYS = ("status", "statusName", "status_name", "state", "jobStatus", "processStatus", "statusLabel")
+_URL_KEYS = ("downloadUrl", "download_url", "downloadURL", "fileUrl", "file_url", "url", "link", "href")
+_NO_DATA_FLAG_KEYS = ("noData", "no_data", "isNoData", "isEmpty", "empty")
+_HAS_DATA_FLAG_KEYS = ("dataExists", "hasData", "has_data", "existsData")
+_COMPLETED_VALUES = {"完了", "complete", "completed", "done", "success", "succeeded", "finished"}
+_PERIOD_KEYS = ("period", "targetPeriod", "target_period", "term", "dateRange", "date_range")
+_CREATED_KEYS = ("createdAt", "created_at", "createdDate", "requestedAt", "requested_at", "registeredAt")
+
+# 日付（直後に時刻がないもの）は集計期間、日付と時刻の組は作成日時とみなす
+_PERIOD_DATE_RE = re.compile(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})(?![\d\s]*\d{1,2}:\d{2})")
+_DATETIME_RE = re.compile(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})[ T]+(\d{1,2}):(\d{2})(?::(\d{2}))?")
+
+# 作成日時を依頼時刻と比べる際に許容する、ポータルとの時計のずれ
+CREATED_AT_TOLERANCE = timedelta(seconds=5)
+
+
+class HistoryStatus:
+    """ダウンロード履歴の最新行の状態"""
+
+    def __init__(
+        self,
+        status: str,
+        completed: bool,
+        no_data: bool,
+        download_url: Optional[str],
+        period: Optional[Tuple[date, date]] = None,
+        created_at: Optional[datetime] = None
+    ):
+        self.status = status
+        self.completed = completed
+        self.no_data = no_data
+        self.download_url = download_url
+        self.period = period
+        self.created_at = created_at
+
+    def __repr__(self) -> str:
+        return (
+            f"HistoryStatus(status={self.status!r}, completed={self.completed}, "
+            f"no_data={self.no_data}, download_url={self.download_url!r}, "
+            f"period={self.period!r}, created_at={self.created_at!r})"
+        )
+
+
+def parse_period(text: str) -> Optional[Tuple[date, date]]:
+    """
+    行のテキストから集計期間（最初と最後の日付）を読み取る
+    作成日時のように時刻が続く日付は期間に含めない
+
+    Returns:
+        Optional[Tuple[date, date]]: 日付がない場合はNone
+    """
+    dates = []
+    for match in _PERIOD_DATE_RE.finditer(text or ""):
+        try:
+            dates.append(date(int(match.group(1)), int(match.group(2)), int(match.group(3))))
+        except ValueError:
+            continue
+    if not dates:
+        return None
+    return dates[0], dates[-1]
+
+
+def parse_created_at(text: str) -> Optional[datetime]:
+    """行のテキストから作成日時（日付と時刻の組のうち最初のもの。ポータルの時刻のまま）を読み取る"""
+    match = _DATETIME_RE.search(text or "")
+    if match is None:
+        return None
+    try:
+        return datetime(*(int(g) for g in match.groups(default="0")))
+    except ValueError:
+        return None
+
+
+def is_requested_row(
+    period: Optional[Tuple[date, date]],
+    created_at: Optional[datetime],
+    expected_period: Optional[Tuple[date, date]],
+    requested_at: Optional[datetime]
+) -> bool:
+    """
+    履歴の行が今回依頼したレポートのものかを判定する
+    期間を読み取れる場合は期間で、読み取れない場合は作成日時が依頼時刻以降かで判定する。
+    どちらも判定できない場合は今回の行とみなす
+
+    Args:
+        period: 行の集計期間
+        created_at: 行の作成日時
+        expected_period: 依頼した期間（期間を指定しない種別ではNone）
+        requested_at: 依頼した時刻（ポータルと同じタイムゾーンの naive な日時）
+    """
+    if expected_period is not None and period is not None:
+        return period == expected_period
+    if requested_at is not None and created_at is not None:
+        return created_at >= requested_at - CREATED_AT_TOLERANCE
+    return True
+
+
+def _row_text(value: Any) -> str:
+    if isinstance(value, dict):
+        return " ".join(_row_text(v) for v in value.values())
+    if isinstance(value, list):
+        return " ".join(_row_text(v) for v in value)
+    return value if isinstance(value, str) else ""
+
+
+def _iter_row_lists(payload: Any, depth: int = 0) -> Iterator[List[Dict[str, Any]]]:
+    """JSON内の「オブジェクトの配列」を浅い順に返す"""
+    if depth > 5:
+        return
+    if isinstance(payload, list):
+        if payload and all(isinstance(item, dict) for item in payload):
+            yield payload
+        return
+    if isinstance(payload, dict):
+        nested = []
+        for value in payload.values():
+            if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                yield value
+            elif isinstance(value, (dict, list)):
+                nested.append(value)
+        for value in nested:
+            yield from _iter_row_lists(value, depth + 1)
+
+
+def _first_value(row: Dict[str, Any], keys) -> Any:
+    for key in keys:
+        if key in row and row[key] not in (None, ""):
+            return row[key]
+    return None
+
+
+def _contains_text(value: Any, text: str) -> bool:
+    if isinstance(value, str):
+        return text in value
+    if isinstance(value, dict):
+        return any(_contains_text(v, text) for v in value.values())
+    if isinstance(value, list):
+        return any(_contains_text(v, text) for v in value)
+    return False
+
+
+def parse_history_row(row: Dict[str, Any], base_url: Optional[str] = None) -> Optional[HistoryStatus]:
+    """
+    履歴1行分のオブジェクトを解析する
+
+    Returns:
+        Optional[HistoryStatus]: 状態を読み取れない場合はNone
+    """
+    status = _first_value(row, _STATUS_KEYS)
+    if isinstance(status, dict):
+        status = _first_value(status, ("name", "label", "value", "code"))
+    if status is None:
+        return None
+    status = str(status).strip()
+
+    no_data = _contains_text(row, NO_DATA_TEXT)
+    flag = _first_value(row, _NO_DATA_FLAG_KEYS)
+    if isinstance(flag, bool):
+        no_data = no_data or flag
+    flag = _first_value(row, _HAS_DATA_FLAG_KEYS)
+    if isinstance(flag, bool):
+        no_data = no_data or not flag
+
+    download_url = _first_value(row, _URL_KEYS)
+    if not isinstance(download_url, str) or not re.match(r"^(https?://|/)", download_url):
+        download_url = None
+    elif base_url:
+        download_url = urljoin(base_url, download_url)
+
+    period_value = _first_value(row, _PERIOD_KEYS)
+    created_value = _first_value(row, _CREATED_KEYS)
+    period = parse_period(period_value if isinstance(period_value, str) else _row_text(row))
+    created_at = parse_created_at(created_value if isinstance(created_value, str) else _row_text(row))
+
+    completed = status.lower() in _COMPLETED_VALUES
+    return HistoryStatus(
+        status=status,
+        completed=completed,
+        no_data=no_data,
+        download_url=download_url,
+        period=period,
+        created_at=created_at
+    )
+
+
+def parse_history_payload(payload: Any, base_url: Optional[str] = None) -> Optional[HistoryStatus]:
+    """
+    履歴APIのレスポンスから最新行（先頭行）の状態を読み取る
+
+    Args:
+        payload: レスポンスのJSON
+        base_url: 相対パスのダウンロードURLを解決する基準（レスポンスのURL）
+
+    Returns:
+        Optional[HistoryStatus]: 状態を読み取れない場合はNone
+    """
+    for rows in _iter_row_lists(payload):
+        parsed = parse_history_row(rows[0], base_url)
+        if parsed is not None:
+            return parsed
+    return None
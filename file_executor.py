@@ -0,0 +1,174 @@
+"""
+ファイル処理用のワーカー
+ZIPの読み込み・文字コード変換・一時ディレクトリの削除などの重いファイル処理を
+イベントループの外で実行し、処理中も他のリクエスト（/token やステータス確認）が止まらないようにする
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileExecutor:
+    """
+    ファイル処理を上限付きのスレッドプール（変換はプロセスプールも可）で実行する
+
+    start() を呼ぶまでは、イベントループの既定のエグゼキューターで実行する。
+
+    Args:
+        name (str): ログ・スレッド名に使う名前
+    """
+
+    def __init__(self, name: str = "file"):
+        self.name = name
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._max_workers = 0
+        self._transcode_processes = 0
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._stats = {
+            "tasks_total": 0,
+            "transcode_total": 0,
+            "errors_total": 0,
+        }
+
+    def start(self, max_workers: int = 4, transcode_processes: int = 0) -> None:
+        """
+        Args:
+            max_workers (int): ファイル処理を同時に実行するスレッド数
+            transcode_processes (int): 文字コード変換を実行するプロセス数（0の場合はスレッドプールで実行する）
+        """
+        self._max_workers = max(1, max_workers)
+        self._threads = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=f"{self.name}-worker")
+        self._transcode_processes = max(0, transcode_processes)
+        if self._transcode_processes:
+            # スレッドを持つプロセスからforkすると子プロセスがロックを引き継ぐ場合があるためspawnで起動する
+            self._processes = ProcessPoolExecutor(
+                max_workers=self._transcode_processes,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        logger.info(
+            f"ファイル処理ワーカーを開始しました: {self.name} "
+            f"(スレッド数={self._max_workers}, 変換プロセス数={self._transcode_processes})"
+        )
+
+    def close(self) -> None:
+        if self._threads:
+            self._threads.shutdown(wait=True)
+            self._threads = None
+        if self._processes:
+            self._processes.shutdown(wait=True)
+            self._processes = None
+
+    def _track(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return func(*args)
+        except Exception:
+            with self._lock:
+                self._stats["errors_total"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> Future:
+        """完了を待たずにスレッドプールで実行する（削除処理など、結果を使わないもの向け）"""
+        with self._lock:
+            self._queued += 1
+            self._stats["tasks_total"] += 1
+        if self._threads is None:
+            return asyncio.get_running_loop().run_in_executor(None, self._track, func, *args)
+        return self._threads.submit(self._track, func, *args)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """スレッドプールで実行して結果を待つ"""
+        with self._lock:
+            self._queued += 1
+            self._stats["tasks_total"] += 1
+        return await asyncio.get_running_loop().run_in_executor(self._threads, self._track, func, *args)
+
+    async def run_transcode(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        CPU負荷の高い変換処理を実行する
+        プロセスプールが有効な場合はそちらで実行する（funcと引数はpickle可能であること）
+        """
+        with self._lock:
+            self._stats["transcode_total"] += 1
+        if self._processes is None:
+            return await self.run(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._processes, func, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self._max_workers,
+                "transcode_processes": self._transcode_processes,
+                "active": self._active,
+                "queued": max(0, self._queued),
+                **self._stats,
+            }
+
+
+class EventLoopLagMonitor:
+    """
+    一定間隔でスリープし、予定より遅れて再開した時間をイベントループの遅延として記録する
+
+    Args:
+        interval (float): 計測間隔（秒）
+        warn_threshold (float): この秒数以上遅れた場合に警告ログを出す
+        window (int): 平均・最大値の計算に使う直近の計測数
+    """
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.2, window: int = 120):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._samples: Deque[float] = deque(maxlen=max(1, window))
+        self._max_lag = 0.0
+        self._slow_total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._samples.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+            if lag >= self.warn_threshold:
+                self._slow_total += 1
+                logger.warning(f"イベントループが{lag * 1000:.0f}ms遅延しました")
+
+    def stats(self) -> Dict[str, Any]:
+        samples = list(self._samples)
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "last_ms": round(samples[-1] * 1000, 1) if samples else None,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 1) if samples else None,
+            "window_max_ms": round(max(samples) * 1000, 1) if samples else None,
+            "max_ms": round(self._max_lag * 1000, 1),
+            "slow_total": self._slow_total,
+            "warn_threshold_ms": round(self.warn_threshold * 1000, 1),
+        }
@@ -0,0 +1,135 @@
+"""
+HTTPキャッシュ
+レポートのダウンロードに付ける ETag / Last-Modified / Cache-Control の生成と、
+条件付きGET（If-None-Match / If-Modified-Since）・Range（If-Range）の判定を行う
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple
+
+# 確定済みの日付のレポートをクライアントが再検証せずに使える秒数
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class RangeNotSatisfiableError(Exception):
+    """Rangeで指定された範囲がファイル内にない（416を返す）"""
+
+
+def make_etag(digest: str, *variants: Optional[str]) -> str:
+    """
+    強いETagを作る
+
+    Args:
+        digest: 変換済みCSVの内容のハッシュ
+        variants: 表現ごとに区別する値（出力形式・圧縮形式など。Noneは無視する）
+    """
+    return '"' + "-".join([digest, *(v for v in variants if v)]) + '"'
+
+
+def _opaque_tag(etag: str) -> str:
+    """弱い比較のため W/ を取り除く"""
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _split_etags(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def etag_matches(if_none_match: Optional[str], etags: Iterable[str]) -> bool:
+    """
+    If-None-Match がいずれかのETagに一致するかどうか（弱い比較。"*" はすべてに一致する）
+    送信しながら圧縮したレスポンスには弱いETag（W/）が付くため、それも一致とみなす
+    """
+    if not if_none_match:
+        return False
+    requested = _split_etags(if_none_match)
+    if "*" in requested:
+        return True
+    requested_tags = {_opaque_tag(tag) for tag in requested}
+    return any(_opaque_tag(etag) in requested_tags for etag in etags)
+
+
+def format_http_date(timestamp: float) -> str:
+    """UNIX時刻をHTTPの日付（Last-Modified など）にする"""
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    """HTTPの日付をUNIX時刻にする（読めない場合はNone）"""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: float) -> bool:
+    """If-Modified-Since 以降に更新されていないかどうか（HTTPの日付は秒単位のため切り捨てて比較する）"""
+    since = parse_http_date(if_modified_since)
+    return since is not None and int(last_modified) <= since
+
+
+def cache_control(immutable: bool, expires_at: Optional[float], now: float) -> str:
+    """
+    日付の古さに応じた Cache-Control を返す
+
+    確定済みの日付は長期間、それより新しい日付はサーバーのキャッシュが期限切れになるまでの間だけ再検証なしで使わせる。
+    キャッシュに保存していないレスポンス（bypass など）は毎回再検証させる。
+    """
+    if immutable:
+        return f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    if expires_at is None:
+        return "private, no-cache"
+    return f"private, max-age={max(0, int(expires_at - now))}"
+
+
+def if_range_matches(if_range: Optional[str], etag: str, last_modified: float) -> bool:
+    """
+    If-Range の条件を満たすかどうか（満たさない場合はRangeを無視して全体を返す）
+    ETagは強い比較、日付は Last-Modified と秒単位で一致する場合のみ
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        return not if_range.startswith("W/") and if_range == etag
+    since = parse_http_date(if_range)
+    return since is not None and int(last_modified) == int(since)
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Range ヘッダーから返す範囲を求める（1つの範囲のみ対応）
+
+    Returns:
+        Optional[Tuple[int, int]]: 開始位置と終了位置（両端を含む）。
+            Rangeがない、形式が正しくない、複数の範囲が指定された、空のファイルの場合はNone（全体を返す）
+
+    Raises:
+        RangeNotSatisfiableError: 範囲がファイル内にない場合
+    """
+    if not range_header or size <= 0:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # bytes=-500 は末尾の500バイト
+            suffix_length = int(last)
+            if suffix_length <= 0:
+                raise RangeNotSatisfiableError(f"範囲が正しくありません: {range_header}")
+            return max(0, size - suffix_length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiableError(f"範囲がファイルの大きさ（{size}バイト）を超えています: {range_header}")
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
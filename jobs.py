@@ -0,0 +1,315 @@
+"""
+非同期ジョブ
+時間のかかるレポート取得をバックグラウンドで実行し、状態をSQLiteに保存する
+"""
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+from file_executor import FileExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    idempotency_key TEXT,
+    report_type TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    cache_mode TEXT NOT NULL DEFAULT 'default',
+    status TEXT NOT NULL,
+    phase TEXT,
+    error TEXT,
+    result_path TEXT,
+    result_bytes INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_idempotency ON jobs (owner, idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at);
+"""
+
+# ジョブを実行する関数: (ジョブ, フェーズ通知) -> 変換済みCSV（開いたファイル。読み終えたらマネージャーが閉じる）
+JobRunner = Callable[[Dict[str, Any], Callable[[str], None]], Awaitable[BinaryIO]]
+
+
+class JobStore:
+    """ジョブの状態を保存するSQLiteストア"""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create(
+        self,
+        owner: str,
+        report_type: str,
+        report_date: str,
+        cache_mode: str = "default",
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """ジョブを登録する。同じ所有者・冪等キーのジョブがあればそれを返す"""
+        with self._lock:
+            if idempotency_key:
+                existing = self._conn.execute(
+                    "SELECT * FROM jobs WHERE owner = ? AND idempotency_key = ?",
+                    (owner, idempotency_key)
+                ).fetchone()
+                if existing:
+                    return {**dict(existing), "created": False}
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (id, owner, idempotency_key, report_type, report_date, cache_mode, status, phase, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, idempotency_key, report_type, report_date, cache_mode,
+                 JOB_STATUS_QUEUED, JOB_STATUS_QUEUED, now, now)
+            )
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return {**dict(row), "created": True}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        if not fields:
+            return
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def list_unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_finished_before(self, cutoff: float) -> List[Dict[str, Any]]:
+        """cutoffより前に終了したジョブを削除し、削除したジョブを返す"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+            ).fetchall()
+            self._conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        return [dict(row) for row in rows]
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class JobManager:
+    """
+    ジョブの実行と結果の保持期間を管理する
+
+    Args:
+        store (JobStore): ジョブの保存先
+        runner (JobRunner): ジョブを実行する関数
+        result_dir (str): 結果ファイルの保存先ディレクトリ
+        retention_seconds (float): 終了したジョブと結果を保持する秒数
+        max_concurrency (int): 同時に実行するジョブ数
+        file_executor (Optional[FileExecutor]): ジョブの保存先（SQLite）の読み書きと、結果ファイルの書き込み・削除を実行するワーカー
+            （省略時はイベントループの既定のエグゼキューター）
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        runner: JobRunner,
+        result_dir: str,
+        retention_seconds: float = 86400,
+        max_concurrency: int = 4,
+        file_executor: Optional[FileExecutor] = None
+    ):
+        self.store = store
+        self.runner = runner
+        self.result_dir = Path(result_dir)
+        self.result_dir.mkdir(parents=True, exist_ok=True)
+        self.retention_seconds = retention_seconds
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._purge_task: Optional[asyncio.Task] = None
+        self._file_executor = file_executor
+
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._file_executor is not None:
+            return await self._file_executor.run(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def start(self) -> None:
+        """再起動前に終わっていなかったジョブを再開し、期限切れ結果の削除を開始する"""
+        for job in await self._run_blocking(self.store.list_unfinished):
+            logger.info(f"未完了のジョブを再開します: {job['id']} ({job['report_type']} {job['report_date']})")
+            await self._run_blocking(self._update, job["id"], {"status": JOB_STATUS_QUEUED, "phase": JOB_STATUS_QUEUED})
+            self._schedule(job)
+        self._purge_task = asyncio.ensure_future(self._purge_loop())
+
+    async def close(self) -> None:
+        if self._purge_task:
+            self._purge_task.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        # 実行中だったジョブは queued/running のまま残り、次回起動時に再開される
+        self.store.close()
+
+    async def submit(
+        self,
+        owner: str,
+        report_type: str,
+        report_date: str,
+        cache_mode: str = "default",
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        ジョブを登録して実行を開始する
+
+        Returns:
+            Dict[str, Any]: ジョブ。冪等キーが一致する既存ジョブがある場合は created=False
+        """
+        job = await self._run_blocking(self.store.create, owner, report_type, report_date, cache_mode, idempotency_key)
+        if job["created"]:
+            self._schedule(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run_blocking(self.store.get, job_id)
+
+    def _update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        self.store.update(job_id, **fields)
+
+    def _schedule(self, job: Dict[str, Any]) -> None:
+        task = asyncio.ensure_future(self._run(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _t, job_id=job["id"]: self._tasks.pop(job_id, None))
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        async with self._semaphore:
+            await self._run_blocking(self._update, job_id, {"status": JOB_STATUS_RUNNING, "phase": "starting"})
+
+            # フェーズはイベントループから同期的に通知されるため、書き込みは1つのタスクで順に行う
+            # （書き込み中に届いたフェーズは最新のものだけを書く）
+            latest_phase: List[Optional[str]] = [None]
+            phase_writer: List[Optional[asyncio.Task]] = [None]
+
+            async def write_phases() -> None:
+                written = None
+                while latest_phase[0] != written:
+                    written = latest_phase[0]
+                    try:
+                        await self._run_blocking(self._update, job_id, {"phase": written})
+                    except Exception as e:
+                        logger.warning(f"ジョブのフェーズを記録できませんでした: {job_id}, エラー: {str(e)}")
+
+            def on_phase(phase: str) -> None:
+                latest_phase[0] = phase
+                if phase_writer[0] is None or phase_writer[0].done():
+                    phase_writer[0] = asyncio.ensure_future(write_phases())
+
+            async def finish(fields: Dict[str, Any]) -> None:
+                # 途中のフェーズが最終的な状態を上書きしないよう、書き込みを待ってから記録する
+                if phase_writer[0] is not None:
+                    await phase_writer[0]
+                await self._run_blocking(self._update, job_id, fields)
+
+            try:
+                src = await self.runner(job, on_phase)
+                result_path = self.result_dir / f"{job_id}.csv"
+                with src:
+                    result_bytes = await self._run_blocking(self._write_result, result_path, src)
+                await finish({
+                    "status": JOB_STATUS_SUCCEEDED,
+                    "phase": "done",
+                    "result_path": str(result_path),
+                    "result_bytes": result_bytes,
+                    "finished_at": time.time(),
+                })
+                logger.info(f"ジョブが完了しました: {job_id} ({result_bytes}バイト)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                logger.error(f"ジョブが失敗しました: {job_id}, エラー: {detail}")
+                await finish({
+                    "status": JOB_STATUS_FAILED,
+                    "phase": "failed",
+                    "error": str(detail),
+                    "finished_at": time.time(),
+                })
+
+    def _write_result(self, path: Path, src: BinaryIO) -> int:
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=str(path.parent))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(src, f)
+                written = f.tell()
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return written
+
+    def purge_expired(self) -> int:
+        """保持期間を過ぎたジョブと結果ファイルを削除する"""
+        expired = self.store.delete_finished_before(time.time() - self.retention_seconds)
+        for job in expired:
+            if job.get("result_path"):
+                try:
+                    Path(job["result_path"]).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"ジョブ結果の削除に失敗しました: {job['result_path']}, エラー: {str(e)}")
+        if expired:
+            logger.info(f"保持期間を過ぎたジョブを{len(expired)}件削除しました")
+        return len(expired)
+
+    async def _purge_loop(self) -> None:
+        interval = max(60.0, min(3600.0, self.retention_seconds / 4))
+        while True:
+            try:
+                await self._run_blocking(self.purge_expired)
+            except Exception as e:
+                logger.warning(f"期限切れジョブの削除中にエラーが発生しました: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "running_tasks": len(self._tasks),
+            "by_status": await self._run_blocking(self.store.count_by_status),
+            "retention_seconds": self.retention_seconds,
+        }
@@ -2,21 +2,100 @@
 楽天RMS RPPレポートAPI
 日付パラメータを受け取り、その日付のCSVファイルを返すAPI
 """
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Depends, Request, Form
-from fastapi.responses import Response, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Form, Header
+from fastapi.responses import Response, JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBasic, HTTPBasicCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, date, timedelta
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from pydantic import BaseModel
+import asyncio
+import json
 import logging
-from typing import Optional
+from typing import Awaitable, BinaryIO, Callable, Dict, Hashable, List, Optional, Tuple
 import os
+import signal
 import tempfile
 import shutil
 import base64
+import time
 
-from rpp_service import get_rpp_report_csv as fetch_rpp_report_csv
-from config import get_rms_credentials, get_rakuten_credentials
+from rpp_service import (
+    PhaseCallback,
+    get_rpp_report_csv as fetch_rpp_report_csv,
+    get_report_batch,
+    get_report_slug,
+    get_max_range_days,
+    supports_date_range,
+    close_http_client
+)
+from browser_pool import BrowserPool, BrowserPoolTimeoutError
+from admission import AdmissionController, AdmissionRejectedError
+import metrics
+from single_flight import SingleFlight
+from report_cache import ReportCache, CACHE_MODES, file_sha256
+from report_range import iter_date_chunks, merge_csv_files, split_csv_file
+from report_format import (
+    FORMAT_CSV,
+    FORMAT_EXTENSIONS,
+    FORMAT_MEDIA_TYPES,
+    REPORT_FORMATS,
+    convert_report_format,
+    is_format_available,
+)
+from report_query import ReportQuery, QueryCursor
+from report_store import ReportStore
+from csv_stream import convert_csv_file, iter_file_chunks, iter_file_range
+from zip_stream import iter_zip_stream
+from http_cache import (
+    RangeNotSatisfiableError,
+    cache_control,
+    etag_matches,
+    format_http_date,
+    if_range_matches,
+    make_etag,
+    not_modified_since,
+    parse_range,
+)
+from compression import (
+    CompressionMiddleware,
+    ENCODING_SUFFIXES,
+    available_encodings,
+    compress_file,
+    is_compressible,
+    negotiate_encoding,
+)
+from file_executor import FileExecutor, EventLoopLagMonitor
+from jobs import JobManager, JobStore, JOB_STATUS_QUEUED, JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED
+from session_store import SessionStateStore
+from resource_policy import ResourcePolicy
+from prefetch import (
+    PrefetchScheduler,
+    PREFETCH_STATUS_CACHED,
+    PREFETCH_STATUS_NO_DATA,
+    PREFETCH_STATUS_OK,
+    parse_run_time
+)
+from config import (
+    get_rms_credentials,
+    get_rakuten_credentials,
+    get_browser_pool_settings,
+    get_session_state_settings,
+    get_report_cache_settings,
+    get_report_store_settings,
+    get_report_range_settings,
+    get_report_batch_settings,
+    get_job_settings,
+    get_file_executor_settings,
+    get_resource_policy_settings,
+    get_prefetch_settings,
+    get_admission_settings,
+    get_compression_settings,
+    get_metrics_settings,
+    load_env_file
+)
 from auth import (
     authenticate_user,
     authenticate_client,
@@ -24,8 +103,10 @@ from auth import (
     create_refresh_token,
     verify_token,
     get_current_active_user,
+    get_current_admin_user,
     get_users_db,
     get_clients_db,
+    load_auth_databases,
     Token,
     User,
     Client,
@@ -39,10 +120,136 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def reload_auth_configuration() -> dict:
+    """.envを読み直し、ユーザー・クライアントデータベースを再構築する"""
+    load_env_file()
+    load_auth_databases()
+    return {"users": len(get_users_db()), "clients": len(get_clients_db())}
+
+
+def _install_reload_signal_handler() -> None:
+    """SIGHUPで認証設定を再読み込みする（対応していないプラットフォームでは何もしない）"""
+    loop = asyncio.get_running_loop()
+
+    def _on_sighup():
+        logger.info("SIGHUPを受信しました。認証設定を再読み込みします")
+        loop.run_in_executor(None, reload_auth_configuration)
+
+    try:
+        loop.add_signal_handler(signal.SIGHUP, _on_sighup)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        logger.info("SIGHUPによる設定再読み込みはこの環境では利用できません")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリ起動時に認証DBとブラウザプールを準備し、終了時に停止する"""
+    # bcryptハッシュ化はここで一度だけ行う
+    await run_in_threadpool(load_auth_databases)
+    _install_reload_signal_handler()
+
+    executor_settings = get_file_executor_settings()
+    file_executor.start(
+        max_workers=executor_settings["max_workers"],
+        transcode_processes=executor_settings["transcode_processes"]
+    )
+    loop_monitor = EventLoopLagMonitor(
+        interval=executor_settings["lag_interval"],
+        warn_threshold=executor_settings["lag_warn_threshold"]
+    )
+    loop_monitor.start()
+    app.state.loop_monitor = loop_monitor
+
+    session_settings = get_session_state_settings()
+    session_store = None
+    if session_settings["enabled"]:
+        session_store = SessionStateStore(
+            path=session_settings["path"],
+            secret=session_settings["secret"],
+            max_age_seconds=session_settings["max_age_seconds"]
+        )
+    browser_pool = BrowserPool(
+        **get_browser_pool_settings(),
+        session_store=session_store,
+        session_probe_interval=session_settings["probe_interval"],
+        resource_policy=ResourcePolicy(**get_resource_policy_settings())
+    )
+    await browser_pool.start()
+    app.state.browser_pool = browser_pool
+    app.state.admission = AdmissionController(**get_admission_settings())
+
+    cache_settings = get_report_cache_settings()
+    app.state.report_cache = None
+    if cache_settings.pop("enabled"):
+        # 起動時のキャッシュ走査もイベントループの外で行う
+        app.state.report_cache = await file_executor.run(lambda: ReportCache(**cache_settings))
+
+    store_settings = get_report_store_settings()
+    app.state.report_store = None
+    if store_settings.pop("enabled"):
+        app.state.report_store = await file_executor.run(lambda: ReportStore(**store_settings))
+
+    job_settings = get_job_settings()
+    job_manager = JobManager(
+        store=JobStore(job_settings["db_path"]),
+        runner=lambda job, on_phase: run_report_job(app.state, job, on_phase),
+        result_dir=job_settings["result_dir"],
+        retention_seconds=job_settings["retention_seconds"],
+        max_concurrency=job_settings["max_concurrency"],
+        file_executor=file_executor
+    )
+    await job_manager.start()
+    app.state.job_manager = job_manager
+
+    app.state.prefetch = None
+    prefetch_settings = get_prefetch_settings()
+    if prefetch_settings["report_types"]:
+        if app.state.report_cache is None:
+            logger.warning("レポートキャッシュが無効のため、事前取得は行いません（REPORT_CACHE_ENABLED）")
+        else:
+            report_types = []
+            for report_type in prefetch_settings["report_types"]:
+                try:
+                    if not supports_date_range(report_type):
+                        # 日付ごとにキャッシュしない種別は、事前取得しても使われない
+                        logger.warning(f"事前取得の対象から除外します（期間を指定できない種別）: {report_type}")
+                        continue
+                    report_types.append(report_type)
+                except ValueError as e:
+                    logger.warning(f"事前取得の対象から除外します: {str(e)}")
+            cache_ttl = prefetch_settings["cache_ttl_seconds"]
+            app.state.prefetch = PrefetchScheduler(
+                fetch=lambda report_type, target_date: prefetch_report(app.state, report_type, target_date, cache_ttl),
+                report_types=report_types,
+                run_at=parse_run_time(prefetch_settings["run_at"]),
+                max_attempts=prefetch_settings["max_attempts"],
+                retry_interval=prefetch_settings["retry_interval"]
+            )
+            app.state.prefetch.start()
+    try:
+        yield
+    finally:
+        if app.state.prefetch:
+            await app.state.prefetch.close()
+        await job_manager.close()
+        if app.state.report_store:
+            await file_executor.run(app.state.report_store.close)
+        await browser_pool.close()
+        await close_http_client()
+        await loop_monitor.close()
+        await run_in_threadpool(file_executor.close)
+
+
+# ZIPの読み込み・文字コード変換・一時ファイルの削除などを実行するワーカー（設定はlifespanで反映する）
+file_executor = FileExecutor("report-files")
+
+
 app = FastAPI(
     title="楽天RMS RPPレポートAPI",
     description="日付パラメータを受け取り、その日付のCSVファイルを返すAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定（n8nなどの外部ツールからのアクセスを許可）
@@ -55,12 +262,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# レスポンス圧縮（キャッシュしたレポートは保存時に圧縮しておき、それ以外は送信しながら圧縮する）
+compression_settings = get_compression_settings()
+COMPRESSION_ENCODINGS = available_encodings(compression_settings["encodings"]) if compression_settings["enabled"] else ()
+COMPRESSION_LEVELS = compression_settings["levels"]
+COMPRESSION_MIN_BYTES = compression_settings["minimum_size"]
+COMPRESSION_PRECOMPRESS = compression_settings["precompress"]
+if COMPRESSION_ENCODINGS:
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=COMPRESSION_ENCODINGS,
+        minimum_size=COMPRESSION_MIN_BYTES,
+        levels=COMPRESSION_LEVELS,
+        run=file_executor.run
+    )
+
 
 class RefreshTokenRequest(BaseModel):
     """リフレッシュトークンリクエストモデル"""
     refresh_token: str
 
 
+class JobRequest(BaseModel):
+    """ジョブ登録リクエストモデル"""
+    date: str
+    report_type: str = "rpp"
+    cache: str = "default"
+
+
+class BatchReportRequest(BaseModel):
+    """バッチ取得リクエストモデル"""
+    report_types: List[str]
+    dates: List[str]
+    cache: str = "default"
+
+
 @app.get("/")
 async def root():
     """APIのルートエンドポイント"""
@@ -72,7 +308,15 @@ async def root():
             "/token/info": "トークン情報を取得",
             "/.well-known/oauth-authorization-server": "OAuth2メタデータ",
             "/rpp-report": "日付パラメータを受け取り、CSVファイルを返す（認証必要）",
-            "/users/me": "現在のユーザー情報を取得"
+            "/rpp-report/range": "期間を指定してCSVファイル（または日別CSVのZIP）を返す（認証必要）",
+            "/rpp-report/batch": "複数種別・複数日付のCSVを1回のログインで取得し、ZIPで返す（認証必要）",
+            "/rpp-report/history": "蓄積したレポートを日付をまたいで検索・集計し、CSVで返す（認証必要）",
+            "/jobs": "レポート取得ジョブを登録し、ジョブIDを即時に返す（認証必要）",
+            "/jobs/{job_id}": "ジョブの状態・フェーズを取得（認証必要）",
+            "/jobs/{job_id}/result": "完了したジョブのCSVを取得（認証必要）",
+            "/users/me": "現在のユーザー情報を取得",
+            "/status": "ブラウザプールなどの稼働状況を取得（認証必要）",
+            "/admin/reload-auth": "認証設定を再読み込み（管理者のみ）"
         }
     }
 
@@ -277,8 +521,67 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 
+@app.post("/admin/reload-auth")
+async def reload_auth(current_user: User = Depends(get_current_admin_user)):
+    """認証設定（ユーザー・クライアント）を環境変数/.envから再読み込みする（管理者のみ）"""
+    counts = await run_in_threadpool(reload_auth_configuration)
+    logger.info(f"認証設定を再読み込みしました（実行者: {current_user.username}）")
+    return {"reloaded": True, **counts}
+
+
+@app.get("/status")
+async def get_status(request: Request, current_user: User = Depends(get_current_active_user)):
+    """ブラウザプールなどの稼働状況を取得"""
+    report_store: Optional[ReportStore] = request.app.state.report_store
+    return {
+        "browser_pool": request.app.state.browser_pool.stats(),
+        "admission": request.app.state.admission.stats(),
+        "single_flight": report_flight.stats(),
+        "report_cache": request.app.state.report_cache.stats() if request.app.state.report_cache else None,
+        "report_store": await file_executor.run(report_store.stats) if report_store else None,
+        "jobs": await request.app.state.job_manager.stats(),
+        "file_executor": file_executor.stats(),
+        "event_loop": request.app.state.loop_monitor.stats(),
+        "prefetch": request.app.state.prefetch.status() if request.app.state.prefetch else None
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request, authorization: Optional[str] = Header(None)):
+    """
+    Prometheusのテキスト形式でメトリクスを返す
+    METRICS_TOKEN を設定した場合は Authorization: Bearer <METRICS_TOKEN> が必要
+    """
+    metrics_token = get_metrics_settings()["token"]
+    if metrics_token and authorization != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=401, detail="認証情報を検証できませんでした", headers={"WWW-Authenticate": "Bearer"})
+    
+    # 現在値は出力時に各コンポーネントから読む
+    state = request.app.state
+    pool_stats = state.browser_pool.stats()
+    metrics.BROWSERS_RUNNING.set(pool_stats["running_browsers"])
+    metrics.BROWSERS_IN_USE.set(pool_stats["in_use"])
+    admission_stats = state.admission.stats()
+    metrics.ADMISSION_RUNNING.set(admission_stats["running"])
+    metrics.ADMISSION_QUEUE_DEPTH.set(admission_stats["queue_depth"])
+    job_counts = await file_executor.run(state.job_manager.store.count_by_status)
+    metrics.JOBS_QUEUED.set(job_counts.get(JOB_STATUS_QUEUED, 0))
+    lag_ms = state.loop_monitor.stats()["last_ms"]
+    metrics.EVENT_LOOP_LAG_SECONDS.set((lag_ms or 0) / 1000)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/prefetch/status")
+async def get_prefetch_status(request: Request, current_user: User = Depends(get_current_active_user)):
+    """前日レポートの事前取得の設定と、最後の実行結果を取得する"""
+    prefetch: Optional[PrefetchScheduler] = request.app.state.prefetch
+    if prefetch is None:
+        return {"enabled": False}
+    return {"enabled": True, **prefetch.status()}
+
+
 def cleanup_temp_directory(temp_dir: str):
-    """一時ディレクトリを削除するバックグラウンドタスク"""
+    """一時ディレクトリを削除する"""
     try:
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
@@ -287,8 +590,640 @@ def cleanup_temp_directory(temp_dir: str):
         logger.warning(f"一時ディレクトリの削除に失敗しました: {temp_dir}, エラー: {str(e)}")
 
 
+async def fetch_report_file(
+    report_type: str,
+    target_date: date,
+    browser_pool: BrowserPool,
+    output_path: str,
+    end_date: Optional[date] = None,
+    on_phase: Optional[PhaseCallback] = None
+) -> int:
+    """
+    ブラウザでレポートを取得し、UTF-8に変換したCSVを output_path に書き込む
+    end_dateを指定した場合は target_date から end_date までの期間レポートを取得する
+    対象データがない場合は空のファイルを書き込む
+
+    Returns:
+        int: 書き込んだバイト数
+    """
+    report_slug = get_report_slug(report_type)
+    # フェーズごとの所要時間をメトリクスに記録する
+    phase_timer = metrics.PhaseTimer(report_slug, on_phase)
+    
+    # 一時ディレクトリを作成
+    temp_dir = tempfile.mkdtemp(prefix="rpp_report_")
+    download_dir = os.path.join(temp_dir, "downloads")
+    
+    try:
+        # 認証情報を取得
+        try:
+            rms_credentials = get_rms_credentials()
+            rakuten_credentials = get_rakuten_credentials()
+        except ValueError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"認証情報の取得に失敗しました: {str(e)}"
+            )
+        
+        # レポートを取得
+        report_file_path = await fetch_rpp_report_csv(
+            rms_credentials=rms_credentials,
+            rakuten_credentials=rakuten_credentials,
+            target_date=target_date,
+            download_dir=download_dir,
+            headless=True,
+            report_type=report_type,
+            pool=browser_pool,
+            end_date=end_date,
+            on_phase=phase_timer
+        )
+        
+        # 対象データがない場合は空のCSVファイルを返す
+        if not report_file_path or not os.path.exists(report_file_path):
+            logger.info(f"指定された日付 ({target_date}{f' - {end_date}' if end_date else ''}) のレポートにデータがありません。空のCSVファイルを返します。")
+            metrics.REPORT_NO_DATA.inc(report_slug)
+            open(output_path, "wb").close()
+            return 0
+        
+        logger.info(f"CSVファイルを変換します: {report_file_path}")
+        phase_timer("converting")
+        # ZIP内のCSVを展開せずに読み込み、Shift_JISからUTF-8へ一定サイズずつ変換する（先頭6行のメタ情報・注意書きは削除）
+        written = await file_executor.run_transcode(
+            convert_csv_file, report_file_path, output_path, report_slug
+        )
+        logger.info(f"CSVファイルをShift_JISからUTF-8に変換しました: {written}バイト")
+        return written
+    finally:
+        phase_timer.finish()
+        await file_executor.run(cleanup_temp_directory, temp_dir)
+
+
+# キャッシュに保存しない取得結果を残しておく秒数
+# （合流した呼び出し元がファイルを開くまでの猶予。開いた後は削除されても読み続けられる）
+TEMP_RESULT_TTL_SECONDS = 60
+
+
+def remove_temp_path(path: str) -> None:
+    """一時ファイル、または一時ディレクトリを削除する"""
+    if os.path.isdir(path):
+        cleanup_temp_directory(path)
+        return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"一時ファイルの削除に失敗しました: {path}, エラー: {str(e)}")
+
+
+def _schedule_cleanup(path: str) -> None:
+    """取得結果の一時ファイル・ディレクトリを猶予時間の経過後に削除する"""
+    asyncio.get_running_loop().call_later(TEMP_RESULT_TTL_SECONDS, file_executor.submit, remove_temp_path, path)
+
+
+async def fetch_report_temp_file(
+    report_type: str,
+    target_date: date,
+    browser_pool: BrowserPool,
+    end_date: Optional[date] = None,
+    on_phase: Optional[PhaseCallback] = None
+) -> str:
+    """レポートを取得して一時ファイルに書き込み、そのパスを返す（ファイルは猶予時間の経過後に削除される）"""
+    result_dir = tempfile.mkdtemp(prefix="rpp_result_")
+    output_path = os.path.join(result_dir, "report.csv")
+    try:
+        await fetch_report_file(report_type, target_date, browser_pool, output_path, end_date, on_phase)
+    except BaseException:
+        await file_executor.run(cleanup_temp_directory, result_dir)
+        raise
+    _schedule_cleanup(result_dir)
+    return output_path
+
+
+# 同じ種別・日付のレポート取得を1回のブラウザセッションにまとめる
+report_flight = SingleFlight("rpp-report")
+
+# 実行中の取得ごとのフェーズの通知先と現在のフェーズ（合流した呼び出し元にもフェーズを通知する）
+_flight_phase_listeners: Dict[Hashable, List[PhaseCallback]] = {}
+_flight_phases: Dict[Hashable, str] = {}
+
+
+def _notify_flight_phase(flight_key: Hashable, phase: str) -> None:
+    _flight_phases[flight_key] = phase
+    for callback in list(_flight_phase_listeners.get(flight_key, ())):
+        try:
+            callback(phase)
+        except Exception as e:
+            logger.warning(f"フェーズ通知の処理に失敗しました（{phase}）: {str(e)}")
+
+
+async def run_flight_with_phases(flight_key: Hashable, fetch: Callable[[PhaseCallback], Awaitable[str]]) -> str:
+    """report_flight で実行する取得処理。フェーズは合流したすべての呼び出し元に通知する"""
+    try:
+        return await fetch(lambda phase: _notify_flight_phase(flight_key, phase))
+    finally:
+        _flight_phases.pop(flight_key, None)
+
+
+@contextmanager
+def flight_phase_listener(flight_key: Hashable, on_phase: Optional[PhaseCallback]):
+    """取得が終わるまで on_phase にフェーズを通知する（実行中の取得に合流する場合は現在のフェーズから）"""
+    if on_phase is None:
+        yield
+        return
+    _flight_phase_listeners.setdefault(flight_key, []).append(on_phase)
+    current = _flight_phases.get(flight_key)
+    if current is not None:
+        on_phase(current)
+    try:
+        yield
+    finally:
+        listeners = _flight_phase_listeners.get(flight_key, [])
+        if on_phase in listeners:
+            listeners.remove(on_phase)
+        if not listeners:
+            _flight_phase_listeners.pop(flight_key, None)
+
+
+# 事前取得の実行枠を数えるクライアント名
+PREFETCH_CLIENT_ID = "prefetch"
+
+
+def admission_slot(app_state, client_id: str, flight_key=None, wait: bool = False):
+    """
+    ブラウザを使う取得処理の実行枠を確保する
+    同じ取得が実行中で合流するだけの場合は制限しない
+    wait=True の場合（ジョブ・事前取得）は受付を断らず、枠が空くまで待つ
+    """
+    admission: Optional[AdmissionController] = app_state.admission
+    if admission is None:
+        return nullcontext()
+    if flight_key is not None and report_flight.is_in_flight(flight_key):
+        return nullcontext()
+    return admission.slot(client_id, wait=wait)
+
+
+def admission_rejected(e: AdmissionRejectedError) -> HTTPException:
+    """受付できなかった場合のレスポンス（429）"""
+    metrics.ADMISSION_REJECTED.inc(e.reason)
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+# 圧縮中のキャッシュファイル（同じファイルの圧縮を重複して予約しない）
+_precompress_pending = set()
+
+
+def precompress_report(
+    report_cache: ReportCache,
+    report_slug: str,
+    target_date: date,
+    extension: str,
+    source_path: str,
+    source_inode: int
+) -> None:
+    """
+    キャッシュしたファイルを有効な圧縮形式ごとに圧縮し、<日付>.<拡張子>.gz などとして横に保存する
+    （ファイル処理ワーカーで実行する。圧縮中にCSVが取得し直された場合は保存しない）
+    """
+    for encoding in COMPRESSION_ENCODINGS:
+        suffix = f"{extension}.{ENCODING_SUFFIXES[encoding]}"
+        if not report_cache.is_current(report_slug, target_date, source_inode):
+            return
+        if report_cache.get_variant(report_slug, target_date, suffix) is not None:
+            continue
+        staging_path = report_cache.new_staging_path()
+        stored = None
+        try:
+            compress_file(source_path, staging_path, encoding, COMPRESSION_LEVELS.get(encoding))
+            stored = report_cache.put_variant(report_slug, target_date, suffix, staging_path, source_inode)
+        except Exception as e:
+            logger.warning(f"キャッシュしたレポートの圧縮に失敗しました: {report_slug} {target_date} {suffix}, エラー: {str(e)}")
+        if stored is None:
+            remove_temp_path(staging_path)
+
+
+def schedule_precompress(
+    report_cache: ReportCache,
+    report_slug: str,
+    target_date: date,
+    extension: str,
+    source_path: str,
+    source_inode: Optional[int] = None
+) -> None:
+    """
+    キャッシュしたファイルの圧縮を予約する（完了を待たない）
+    source_inodeは変換元のCSVのinode番号（省略した場合は source_path をCSVとみなす）
+    """
+    if not COMPRESSION_PRECOMPRESS or not COMPRESSION_ENCODINGS:
+        return
+    try:
+        if os.path.getsize(source_path) < COMPRESSION_MIN_BYTES:
+            return
+        if source_inode is None:
+            source_inode = os.stat(source_path).st_ino
+    except OSError:
+        return
+    key = (report_slug, target_date.isoformat(), extension, source_inode)
+    if key in _precompress_pending:
+        return
+    _precompress_pending.add(key)
+    future = file_executor.submit(
+        precompress_report, report_cache, report_slug, target_date, extension, source_path, source_inode
+    )
+    future.add_done_callback(lambda _: _precompress_pending.discard(key))
+
+
+def open_precompressed(
+    report_cache: Optional[ReportCache],
+    report_file: BinaryIO,
+    report_slug: str,
+    target_date: date,
+    report_format: str,
+    encoding: str,
+    source_inode: int
+) -> Optional[BinaryIO]:
+    """
+    事前に圧縮したキャッシュファイルがあれば開く
+    ない場合（圧縮が終わっていない、この機能の導入前にキャッシュされたなど）は圧縮を予約してNoneを返す
+    """
+    if report_cache is None:
+        return None
+    extension = FORMAT_EXTENSIONS[report_format]
+    variant_path = report_cache.get_variant(report_slug, target_date, f"{extension}.{ENCODING_SUFFIXES[encoding]}")
+    if variant_path is not None:
+        try:
+            return open(variant_path, "rb")
+        except FileNotFoundError:
+            pass
+    if report_cache.is_current(report_slug, target_date, source_inode):
+        schedule_precompress(report_cache, report_slug, target_date, extension, report_file.name, source_inode)
+    return None
+
+
+def ingest_report(report_store: ReportStore, report_slug: str, target_date: date, csv_path: Optional[str]) -> None:
+    """取得したレポートを蓄積する（ファイル処理ワーカーで実行する。失敗してもレスポンスには影響させない）"""
+    try:
+        report_store.ingest(report_slug, target_date, csv_path)
+    except Exception as e:
+        logger.warning(f"レポートの蓄積に失敗しました: {report_slug} {target_date}, エラー: {str(e)}")
+
+
+def schedule_ingest(
+    report_store: Optional[ReportStore],
+    report_slug: str,
+    target_date: date,
+    csv_path: str
+) -> None:
+    """
+    取得したレポートの蓄積を予約する（完了を待たない）
+    対象データがない場合は、取得し直す前の行が残らないようその日付の行を削除する
+    期間を指定できない種別は取得した日付のレポートとは限らないため蓄積しない
+    """
+    if report_store is None or not supports_date_range(report_slug):
+        return
+    try:
+        empty = not os.path.getsize(csv_path)
+    except OSError:
+        return
+    file_executor.submit(ingest_report, report_store, report_slug, target_date, None if empty else csv_path)
+
+
+async def fetch_and_cache_report(
+    report_type: str,
+    report_slug: str,
+    target_date: date,
+    browser_pool: BrowserPool,
+    report_cache: Optional[ReportCache],
+    on_phase: Optional[PhaseCallback] = None,
+    cache_ttl: Optional[float] = None,
+    report_store: Optional[ReportStore] = None
+) -> str:
+    """
+    レポートを取得し、キャッシュが有効であれば保存する
+    cache_ttlを指定すると、このエントリの有効期間をキャッシュの既定値から変更する
+    report_storeを指定すると、取得したレポートを蓄積する（キャッシュの有無に関わらない）
+
+    Returns:
+        str: 変換済みCSVのパス（キャッシュファイル、または一時ファイル）
+    """
+    if report_cache is None:
+        csv_path = await fetch_report_temp_file(report_type, target_date, browser_pool, on_phase=on_phase)
+        schedule_ingest(report_store, report_slug, target_date, csv_path)
+        return csv_path
+    
+    staging_path = report_cache.new_staging_path()
+    try:
+        await fetch_report_file(report_type, target_date, browser_pool, staging_path, on_phase=on_phase)
+    except BaseException:
+        await file_executor.run(remove_temp_path, staging_path)
+        raise
+    try:
+        entry = await file_executor.run(report_cache.put_file, report_slug, target_date, staging_path, cache_ttl)
+        schedule_precompress(report_cache, report_slug, target_date, FORMAT_EXTENSIONS[FORMAT_CSV], str(entry.path))
+        schedule_ingest(report_store, report_slug, target_date, str(entry.path))
+        return str(entry.path)
+    except Exception as e:
+        logger.warning(f"レポートのキャッシュ保存に失敗しました: {str(e)}")
+        _schedule_cleanup(staging_path)
+        schedule_ingest(report_store, report_slug, target_date, staging_path)
+        return staging_path
+
+
+async def load_report(
+    app_state,
+    report_type: str,
+    report_slug: str,
+    target_date: date,
+    cache_mode: str = "default",
+    on_phase: Optional[PhaseCallback] = None,
+    client_id: str = "-",
+    wait_admission: bool = False
+) -> Tuple[BinaryIO, str]:
+    """
+    キャッシュの使い方に従ってレポートを取得する
+    ブラウザを使う取得は client_id ごとに受付制御（同時実行数・待ち行列）の対象になる
+    wait_admission=True の場合（ジョブ）は受付を断らず、枠が空くまで待つ
+    
+    Returns:
+        Tuple[BinaryIO, str]: 変換済みCSVを開いたファイル（閉じるのは呼び出し元）と、キャッシュの利用結果（HIT / MISS / BYPASS）
+    
+    Raises:
+        HTTPException: cache=only でキャッシュがない場合（404。期間を指定できない種別はキャッシュしない）
+        AdmissionRejectedError: 待ち行列が満杯などで受付できなかった場合（wait_admission=False のみ）
+    """
+    report_cache: Optional[ReportCache] = app_state.report_cache
+    # 期間を指定できない種別はポータルの既定の期間のレポートになるため、日付ごとにキャッシュしない
+    cacheable = supports_date_range(report_type)
+    if not cacheable:
+        report_cache = None
+    if report_cache is not None and cache_mode in ("default", "only"):
+        # メタ情報の読み込み・stat・更新日時の書き換えを行うため、イベントループの外で確認する
+        entry = await file_executor.run(report_cache.get, report_slug, target_date)
+        if entry is not None:
+            logger.info(f"キャッシュからレポートを返します: {report_slug} {target_date}")
+            metrics.REPORT_CACHE_LOOKUPS.inc(report_slug, "HIT")
+            return await file_executor.run(entry.open), "HIT"
+    if cache_mode == "only":
+        raise HTTPException(
+            status_code=404,
+            detail=f"キャッシュにレポートがありません: {report_slug} {target_date}"
+        )
+    
+    browser_pool = app_state.browser_pool
+    write_cache = report_cache if cache_mode != "bypass" else None
+    # キャッシュに保存する取得と保存しない取得は合流させない
+    flight_key = (report_slug, target_date.isoformat(), write_cache is not None)
+    with flight_phase_listener(flight_key, on_phase):
+        async with admission_slot(app_state, client_id, flight_key, wait=wait_admission):
+            csv_path = await report_flight.do(
+                flight_key,
+                lambda: run_flight_with_phases(
+                    flight_key,
+                    lambda notify: fetch_and_cache_report(
+                        report_type, report_slug, target_date, browser_pool, write_cache, notify,
+                        report_store=app_state.report_store
+                    )
+                )
+            )
+    # 合流した呼び出し元それぞれがすぐに開いておく（以降にキャッシュの入れ替えや一時ファイルの削除があっても読み続けられる）
+    cache_status = "BYPASS" if cache_mode == "bypass" or not cacheable else "MISS"
+    metrics.REPORT_CACHE_LOOKUPS.inc(report_slug, cache_status)
+    return open(csv_path, "rb"), cache_status
+
+
+# 同じCSVから同じ形式への変換を1回にまとめる
+format_flight = SingleFlight("report-format")
+
+
+async def convert_report_output(
+    csv_path: str,
+    report_slug: str,
+    target_date: date,
+    report_format: str,
+    report_cache: Optional[ReportCache],
+    source_inode: int
+) -> str:
+    """
+    変換済みCSVを指定の形式に変換する
+    report_cacheを指定した場合は変換結果をCSVの横に保存する
+
+    Returns:
+        str: 変換したファイルのパス（キャッシュファイル、または一時ファイル）
+    """
+    extension = FORMAT_EXTENSIONS[report_format]
+    if report_cache is None:
+        result_dir = tempfile.mkdtemp(prefix="rpp_format_")
+        output_path = os.path.join(result_dir, f"report.{extension}")
+        try:
+            await file_executor.run_transcode(convert_report_format, csv_path, output_path, report_format)
+        except BaseException:
+            await file_executor.run(cleanup_temp_directory, result_dir)
+            raise
+        _schedule_cleanup(result_dir)
+        return output_path
+
+    staging_path = report_cache.new_staging_path()
+    try:
+        await file_executor.run_transcode(convert_report_format, csv_path, staging_path, report_format)
+    except BaseException:
+        await file_executor.run(remove_temp_path, staging_path)
+        raise
+    try:
+        stored = await file_executor.run(
+            report_cache.put_variant, report_slug, target_date, extension, staging_path, source_inode
+        )
+    except Exception as e:
+        logger.warning(f"変換したレポートのキャッシュ保存に失敗しました: {str(e)}")
+        stored = None
+    if stored is None:
+        # 変換元のCSVがキャッシュにない（bypass・保存失敗）か、変換中に取得し直された場合
+        _schedule_cleanup(staging_path)
+        return staging_path
+    if is_compressible(FORMAT_MEDIA_TYPES[report_format]):
+        schedule_precompress(report_cache, report_slug, target_date, extension, str(stored), source_inode)
+    return str(stored)
+
+
+async def load_report_format(
+    app_state,
+    csv_file: BinaryIO,
+    report_slug: str,
+    target_date: date,
+    report_format: str,
+    cache_mode: str = "default"
+) -> BinaryIO:
+    """
+    load_report で開いた変換済みCSVを、指定の形式に変換して開き直す（csv_fileは閉じる）
+    キャッシュに変換結果があればそれを使い、なければ変換してキャッシュに保存する
+
+    Returns:
+        BinaryIO: 変換したファイル（閉じるのは呼び出し元）
+    """
+    report_cache: Optional[ReportCache] = app_state.report_cache
+    if cache_mode == "bypass":
+        report_cache = None
+    try:
+        if report_cache is not None:
+            variant_path = await file_executor.run(
+                report_cache.get_variant, report_slug, target_date, FORMAT_EXTENSIONS[report_format]
+            )
+            if variant_path is not None:
+                try:
+                    return await file_executor.run(open, variant_path, "rb")
+                except FileNotFoundError:
+                    pass
+        
+        source_inode = os.fstat(csv_file.fileno()).st_ino
+        with metrics.REPORT_PHASE_SECONDS.time(report_slug, "formatting"):
+            output_path = await format_flight.do(
+                (report_slug, target_date.isoformat(), report_format, source_inode),
+                lambda: convert_report_output(
+                    csv_file.name, report_slug, target_date, report_format, report_cache, source_inode
+                )
+            )
+        return open(output_path, "rb")
+    finally:
+        csv_file.close()
+
+
+async def report_validators(
+    app_state,
+    csv_file: BinaryIO,
+    report_slug: str,
+    target_date: date,
+    cache_mode: str = "default"
+) -> dict:
+    """
+    ETag / Last-Modified / Cache-Control の元になる情報を返す
+    キャッシュしたCSVは保存時に記録したハッシュを使い、それ以外（bypass・保存失敗）はここで計算する
+
+    Returns:
+        dict: sha256, fetched_at, expires_at（キャッシュしていない場合・不変の日付はNone）, immutable
+    """
+    report_cache: Optional[ReportCache] = app_state.report_cache
+    if report_cache is not None and cache_mode != "bypass":
+        meta = await file_executor.run(
+            report_cache.get_meta, report_slug, target_date, os.fstat(csv_file.fileno()).st_ino
+        )
+        if meta is not None:
+            return meta
+    return {
+        "sha256": await file_executor.run(file_sha256, csv_file),
+        "fetched_at": time.time(),
+        "expires_at": None,
+        "immutable": False,
+    }
+
+
+def report_file_response(
+    request: Request,
+    report_file: BinaryIO,
+    media_type: str,
+    headers: dict,
+    etag: str,
+    last_modified: float
+) -> StreamingResponse:
+    """
+    ファイルを一定サイズずつ返す
+    Range が指定され、If-Range の条件を満たす場合は指定された範囲のみを返す（206）
+
+    Raises:
+        HTTPException: 範囲がファイル内にない場合（416）
+    """
+    size = os.fstat(report_file.fileno()).st_size
+    headers = {**headers, "ETag": etag, "Last-Modified": format_http_date(last_modified), "Accept-Ranges": "bytes"}
+    byte_range = None
+    if if_range_matches(request.headers.get("if-range"), etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiableError as e:
+            report_file.close()
+            raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return StreamingResponse(
+            iter_file_chunks(report_file),
+            media_type=media_type,
+            headers={**headers, "Content-Length": str(size)}
+        )
+    
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(report_file, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)}
+    )
+
+
+async def prefetch_report(app_state, report_type: str, target_date: date, cache_ttl: float) -> Tuple[str, int]:
+    """
+    事前取得: レポートを取得してキャッシュに保存する（有効なキャッシュがあれば取得しない）
+    対象データがない場合は、後で作成されたデータを返せるよう空の結果をキャッシュに残さない
+    """
+    report_cache: ReportCache = app_state.report_cache
+    report_slug = get_report_slug(report_type)
+    entry = await file_executor.run(report_cache.get, report_slug, target_date)
+    if entry is not None and entry.size:
+        return PREFETCH_STATUS_CACHED, entry.size
+    
+    # /rpp-report の default と同じく、キャッシュに保存する取得として合流する
+    flight_key = (report_slug, target_date.isoformat(), True)
+    # 事前取得もブラウザを使うため、全体の同時実行数に含める（断らずに順番を待つ）
+    async with admission_slot(app_state, PREFETCH_CLIENT_ID, flight_key, wait=True):
+        csv_path = await report_flight.do(
+            flight_key,
+            lambda: run_flight_with_phases(
+                flight_key,
+                lambda notify: fetch_and_cache_report(
+                    report_type, report_slug, target_date, app_state.browser_pool, report_cache, notify,
+                    cache_ttl=cache_ttl, report_store=app_state.report_store
+                )
+            )
+        )
+    size = await file_executor.run(os.path.getsize, csv_path)
+    if not size:
+        await file_executor.run(report_cache.delete, report_slug, target_date.isoformat())
+        return PREFETCH_STATUS_NO_DATA, 0
+    return PREFETCH_STATUS_OK, size
+
+
+async def report_query_response(
+    csv_file: BinaryIO,
+    query: ReportQuery,
+    report_type: str,
+    date: str,
+    headers: dict,
+    etag: str,
+    last_modified: float
+) -> StreamingResponse:
+    """
+    変換済みCSVにクエリを実行した結果を返す
+    結果の大きさは読み終えるまでわからないため、Content-Length・Rangeは付けずに送信しながら返す
+    """
+    try:
+        cursor = await file_executor.run(QueryCursor, csv_file, query)
+    except ValueError as e:
+        csv_file.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        csv_file.close()
+        raise
+    headers = {
+        **headers,
+        "Content-Disposition": f'attachment; filename="{report_type}_report_{date}_query.csv"',
+        "ETag": etag,
+        "Last-Modified": format_http_date(last_modified),
+    }
+    return StreamingResponse(
+        cursor.iter_csv(),
+        media_type=FORMAT_MEDIA_TYPES[FORMAT_CSV],
+        headers=headers
+    )
+
+
 @app.get("/rpp-report")
 async def get_rpp_report_csv(
+    request: Request,
     date: str = Query(
         ...,
         description="取得するレポートの日付 (YYYY-MM-DD形式)",
@@ -299,19 +1234,63 @@ async def get_rpp_report_csv(
         description="取得するレポート種別。rpp または rpp-exp",
         example="rpp-exp"
     ),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
+    cache: str = Query(
+        "default",
+        description="キャッシュの使い方。default: 有効なキャッシュがあれば使う / bypass: キャッシュを読み書きしない / refresh: 取得し直してキャッシュを更新 / only: キャッシュのみ（なければ404）"
+    ),
+    format: str = Query(
+        FORMAT_CSV,
+        description="出力形式。csv / ndjson / parquet / arrow（Arrow IPCストリーム）。csv以外は数値・日付を型付けして返す"
+    ),
+    columns: Optional[str] = Query(
+        None,
+        description="返す列（カンマ区切り）。例: 商品管理番号,クリック数,売上金額",
+        example="商品管理番号,クリック数"
+    ),
+    where: Optional[List[str]] = Query(
+        None,
+        description="行の条件（列名 演算子 値。複数指定はすべてを満たす行）。演算子: = != > >= < <= ~（部分一致）。= は | 区切りで複数の値を指定できる",
+        example="商品管理番号=abc-001"
+    ),
+    group_by: Optional[str] = Query(
+        None,
+        description="グループにする列（カンマ区切り）。グループごとに sum の列の合計と件数を返す",
+        example="商品管理番号"
+    ),
+    sum_columns: Optional[str] = Query(
+        None,
+        alias="sum",
+        description="合計する列（カンマ区切り）。group_by を指定しない場合は全体の合計を返す",
+        example="クリック数,実績額(合計)"
+    ),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     指定された日付のRPPレポートCSVを取得する（認証が必要）
     
+    同じ種別・日付のリクエストが同時に来た場合は、1回の取得結果を共有する。
+    取得結果はキャッシュに保存し、確定済みの日付は以降ブラウザを使わずに返す。
+    csv以外の形式に変換した結果もCSVの横にキャッシュする。
+    
+    変換済みCSVのハッシュをETagとして返し、If-None-Match / If-Modified-Since が一致すれば304を返す
+    （キャッシュが有効であればブラウザは使わない）。Range を指定すると一部のみを返す（206）。
+    
+    columns / where / group_by / sum を指定した場合は、変換済みCSVを1回読みながら
+    列の絞り込み・行の条件・グループごとの合計を行い、結果のCSVのみを返す（csv形式のみ。Rangeは使えない）。
+    
     Args:
         date: 取得するレポートの日付 (YYYY-MM-DD形式)
         report_type: 取得するレポート種別（rpp / rpp-exp / rppexp / cpnadv / tda / tdaexp / cpa）
+        cache: キャッシュの使い方（default / bypass / refresh / only）
+        format: 出力形式（csv / ndjson / parquet / arrow）
+        columns: 返す列（カンマ区切り）
+        where: 行の条件（列名 演算子 値）
+        group_by: グループにする列（カンマ区切り）
+        sum_columns: 合計する列（カンマ区切り）
         current_user: 現在の認証済みユーザー
     
     Returns:
-        CSVファイルのレスポンス
+        CSVファイル（または指定した形式のファイル）のレスポンス
     """
     try:
         # 日付の検証
@@ -323,92 +1302,144 @@ async def get_rpp_report_csv(
                 detail=f"無効な日付形式です。YYYY-MM-DD形式で指定してください。例: 2024-01-01"
             )
         
-        logger.info(f"レポート取得リクエスト: 日付={target_date}, 種別={report_type}")
+        # レポート種別の検証
+        try:
+            report_slug = get_report_slug(report_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # 一時ディレクトリを作成
-        temp_dir = tempfile.mkdtemp(prefix="rpp_report_")
-        download_dir = os.path.join(temp_dir, "downloads")
+        if cache not in CACHE_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"無効なcacheパラメータです: {cache}. 利用可能: {', '.join(CACHE_MODES)}"
+            )
+        
+        if format not in REPORT_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"無効なformatパラメータです: {format}. 利用可能: {', '.join(REPORT_FORMATS)}"
+            )
+        if not is_format_available(format):
+            raise HTTPException(
+                status_code=400,
+                detail=f"pyarrowがインストールされていないため、{format}形式では出力できません"
+            )
         
         try:
-            # 認証情報を取得
-            try:
-                rms_credentials = get_rms_credentials()
-                rakuten_credentials = get_rakuten_credentials()
-            except ValueError as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"認証情報の取得に失敗しました: {str(e)}"
-                )
-            
-            # レポートを取得
-            try:
-                csv_file_path = await fetch_rpp_report_csv(
-                    rms_credentials=rms_credentials,
-                    rakuten_credentials=rakuten_credentials,
-                    target_date=target_date,
-                    download_dir=download_dir,
-                    headless=True,
-                    report_type=report_type
-                )
-            except ValueError as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=str(e)
-                )
-            
-            # ファイル名を生成
-            filename = f"{report_type}_report_{date}.csv"
-            
-            # 対象データがない場合は空のCSVファイルを返す
-            if not csv_file_path or not os.path.exists(csv_file_path):
-                logger.info(f"指定された日付 ({date}) のレポートにデータがありません。空のCSVファイルを返します。")
-                csv_content = b""  # 空のCSVファイル
-            else:
-                logger.info(f"CSVファイルを返します: {csv_file_path}")
-                # CSVファイルをShift_JISからUTF-8に変換して読み込む
-                try:
-                    with open(csv_file_path, 'r', encoding='shift_jis', errors='replace') as f:
-                        lines = f.readlines()
-                    
-                    # 最初の6行を削除（メタ情報と注意書き）
-                    if len(lines) > 6:
-                        lines = lines[6:]
-                        logger.info("CSVファイルの最初の6行（メタ情報）を削除しました")
-                    
-                    # 行を結合してUTF-8にエンコード（BOMなし）
-                    csv_text = ''.join(lines)
-                    csv_content = csv_text.encode('utf-8')
-                    logger.info("CSVファイルをShift_JISからUTF-8に変換しました")
-                except UnicodeDecodeError:
-                    # Shift_JISで読み込めない場合は、元のファイルをそのまま返す
-                    logger.warning("Shift_JISとして読み込めませんでした。元のエンコーディングで返します")
-                    with open(csv_file_path, 'rb') as f:
-                        csv_content = f.read()
-            
-            # バックグラウンドタスクで一時ディレクトリを削除
-            background_tasks.add_task(cleanup_temp_directory, temp_dir)
-            
-            # CSVファイルを返す
-            return Response(
-                content=csv_content,
-                media_type="text/csv",
-                headers={
-                    "Content-Disposition": f'attachment; filename="{filename}"'
-                }
+            query = ReportQuery.from_params(columns, where, group_by, sum_columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if query is not None and format != FORMAT_CSV:
+            raise HTTPException(
+                status_code=400,
+                detail="columns / where / group_by / sum は format=csv の場合のみ指定できます"
+            )
+        
+        logger.info(
+            f"レポート取得リクエスト: 日付={target_date}, 種別={report_type}, キャッシュ={cache}, 形式={format}"
+            + (f", クエリ={query.describe()}" if query is not None else "")
+        )
+        
+        # ファイル名を生成
+        filename = f"{report_type}_report_{date}.{FORMAT_EXTENSIONS[format]}"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+        
+        try:
+            csv_file, cache_status = await load_report(
+                request.app.state, report_type, report_slug, target_date, cache, client_id=current_user.username
+            )
+        except HTTPException:
+            raise
+        except AdmissionRejectedError as e:
+            raise admission_rejected(e)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=str(e)
+            )
+        except BrowserPoolTimeoutError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": "30"}
             )
-            
         except Exception as e:
             logger.error(f"レポート取得中にエラーが発生しました: {str(e)}")
-            # エラー時も一時ディレクトリをクリーンアップ
-            if os.path.exists(temp_dir):
-                try:
-                    shutil.rmtree(temp_dir)
-                except Exception:
-                    pass
             raise HTTPException(
                 status_code=500,
                 detail=f"レポート取得中にエラーが発生しました: {str(e)}"
             )
+        
+        if cache_status == "BYPASS":
+            # キャッシュしていないCSVのため、検証情報・形式の変換にもキャッシュを使わない
+            cache = "bypass"
+        source_inode = os.fstat(csv_file.fileno()).st_ino
+        media_type = FORMAT_MEDIA_TYPES[format]
+        try:
+            validators = await report_validators(request.app.state, csv_file, report_slug, target_date, cache)
+        except BaseException:
+            csv_file.close()
+            raise
+        format_variant = format if format != FORMAT_CSV else None
+        if query is not None:
+            # クエリの結果は内容と条件で決まるため、条件ごとに異なるETagにする
+            format_variant = f"query.{query.fingerprint()}"
+        etag = make_etag(validators["sha256"], format_variant)
+        headers.update({
+            "X-Cache": cache_status,
+            "Cache-Control": cache_control(validators["immutable"], validators["expires_at"], time.time()),
+        })
+        if is_compressible(media_type) and COMPRESSION_ENCODINGS:
+            headers["Vary"] = "Accept-Encoding"
+        
+        # クライアントが持っている内容から変わっていなければ、形式の変換やファイルの送信をせずに304を返す
+        # （事前に圧縮したファイルのETagも同じ内容を表すため一致とみなす）
+        known_etags = [etag] + [
+            make_etag(validators["sha256"], format_variant, ENCODING_SUFFIXES[encoding])
+            for encoding in COMPRESSION_ENCODINGS
+            if query is None
+        ]
+        if_none_match = request.headers.get("if-none-match")
+        if etag_matches(if_none_match, known_etags) or (
+            not if_none_match and not_modified_since(request.headers.get("if-modified-since"), validators["fetched_at"])
+        ):
+            csv_file.close()
+            headers.pop("Content-Disposition", None)
+            headers.update({"ETag": etag, "Last-Modified": format_http_date(validators["fetched_at"])})
+            return Response(status_code=304, headers=headers)
+        
+        if query is not None:
+            return await report_query_response(csv_file, query, report_type, date, headers, etag, validators["fetched_at"])
+        
+        report_file = csv_file
+        if format != FORMAT_CSV:
+            try:
+                report_file = await load_report_format(
+                    request.app.state, csv_file, report_slug, target_date, format, cache
+                )
+            except Exception as e:
+                logger.error(f"レポートの形式変換中にエラーが発生しました: {str(e)}")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"レポートの形式変換中にエラーが発生しました: {str(e)}"
+                )
+        
+        # 事前に圧縮したキャッシュがあればそのまま返す（ない場合は CompressionMiddleware が送信しながら圧縮する）
+        encoding = None
+        if is_compressible(media_type) and cache != "bypass":
+            encoding = negotiate_encoding(request.headers.get("accept-encoding"), COMPRESSION_ENCODINGS)
+        if encoding:
+            compressed_file = open_precompressed(
+                request.app.state.report_cache, report_file, report_slug, target_date, format, encoding, source_inode
+            )
+            if compressed_file is not None:
+                report_file.close()
+                report_file = compressed_file
+                headers["Content-Encoding"] = encoding
+                etag = make_etag(validators["sha256"], format_variant, ENCODING_SUFFIXES[encoding])
+                metrics.COMPRESSED_RESPONSES.inc(encoding, "precompressed")
+        
+        return report_file_response(request, report_file, media_type, headers, etag, validators["fetched_at"])
             
     except HTTPException:
         raise
@@ -420,6 +1451,646 @@ async def get_rpp_report_csv(
         )
 
 
+@app.get("/rpp-report/range")
+async def get_rpp_report_range(
+    request: Request,
+    start: str = Query(
+        ...,
+        description="期間の開始日 (YYYY-MM-DD形式)",
+        example="2024-01-01"
+    ),
+    end: str = Query(
+        ...,
+        description="期間の終了日 (YYYY-MM-DD形式、開始日を含む)",
+        example="2024-01-31"
+    ),
+    report_type: str = Query(
+        "rpp",
+        description="取得するレポート種別。rpp または rpp-exp",
+        example="rpp-exp"
+    ),
+    split: bool = Query(
+        False,
+        description="trueの場合、日付ごとのCSVに分割してZIPで返す"
+    ),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    期間を指定してレポートを取得する（認証が必要）
+    
+    ポータルに期間レポートを1回で作成させるため、日数分のログイン・レポート作成を行わずに済む。
+    ポータルの最大期間を超える場合は区間に分割して取得し、結合する。
+    
+    Args:
+        start: 期間の開始日 (YYYY-MM-DD形式)
+        end: 期間の終了日 (YYYY-MM-DD形式)
+        report_type: 取得するレポート種別
+        split: 日付ごとのCSVに分割してZIPで返すかどうか
+        current_user: 現在の認証済みユーザー
+    
+    Returns:
+        CSVファイル、またはsplit=trueの場合は日別CSVを含むZIPファイルのレスポンス
+    """
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="無効な日付形式です。YYYY-MM-DD形式で指定してください。例: 2024-01-01"
+        )
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="開始日は終了日以前の日付を指定してください")
+    range_limit_days = get_report_range_settings()["limit_days"]
+    if (end_date - start_date).days + 1 > range_limit_days:
+        raise HTTPException(
+            status_code=400,
+            detail=f"期間が長すぎます。最大{range_limit_days}日まで指定できます"
+        )
+    
+    try:
+        report_slug = get_report_slug(report_type)
+        max_days = get_max_range_days(report_type)
+        range_supported = supports_date_range(report_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not range_supported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"期間を指定できないレポート種別です: {report_type}"
+        )
+    
+    chunks = list(iter_date_chunks(start_date, end_date, max_days))
+    logger.info(f"期間レポート取得リクエスト: {start_date} - {end_date}, 種別={report_type}, 区間数={len(chunks)}")
+    
+    browser_pool = request.app.state.browser_pool
+    sources: List[BinaryIO] = []
+    temp_dir = tempfile.mkdtemp(prefix="rpp_range_")
+    try:
+        try:
+            async with admission_slot(request.app.state, current_user.username):
+                for chunk_start, chunk_end in chunks:
+                    chunk_path = await report_flight.do(
+                        (report_slug, f"{chunk_start.isoformat()}..{chunk_end.isoformat()}"),
+                        lambda s=chunk_start, e=chunk_end: fetch_report_temp_file(report_type, s, browser_pool, end_date=e)
+                    )
+                    sources.append(open(chunk_path, "rb"))
+        except HTTPException:
+            raise
+        except AdmissionRejectedError as e:
+            raise admission_rejected(e)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except BrowserPoolTimeoutError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+        except Exception as e:
+            logger.error(f"期間レポート取得中にエラーが発生しました: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"レポート取得中にエラーが発生しました: {str(e)}"
+            )
+        
+        merged_path = os.path.join(temp_dir, "merged.csv")
+        await file_executor.run(merge_csv_files, sources, merged_path)
+        base_name = f"{report_type}_report_{start_date.isoformat()}_{end_date.isoformat()}"
+        
+        if not split:
+            return FileResponse(
+                merged_path,
+                media_type="text/csv",
+                filename=f"{base_name}.csv",
+                background=BackgroundTask(file_executor.run, cleanup_temp_directory, temp_dir)
+            )
+        
+        daily_dir = os.path.join(temp_dir, "daily")
+        os.makedirs(daily_dir)
+        try:
+            daily_paths = await file_executor.run(split_csv_file, merged_path, daily_dir)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        members = (
+            (f"{report_type}_report_{day.isoformat()}.csv", iter_file_chunks(open(path, "rb")))
+            for day, path in daily_paths.items()
+        )
+        return StreamingResponse(
+            iter_zip_stream(members),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{base_name}.zip"'},
+            background=BackgroundTask(file_executor.run, cleanup_temp_directory, temp_dir)
+        )
+    except BaseException:
+        await file_executor.run(cleanup_temp_directory, temp_dir)
+        raise
+    finally:
+        for f in sources:
+            f.close()
+
+
+def _report_store(request: Request) -> ReportStore:
+    report_store: Optional[ReportStore] = request.app.state.report_store
+    if report_store is None:
+        raise HTTPException(
+            status_code=404,
+            detail="レポートの蓄積が無効です（REPORT_STORE_ENABLED）"
+        )
+    return report_store
+
+
+@app.get("/rpp-report/history")
+async def get_rpp_report_history(
+    request: Request,
+    report_type: str = Query(
+        "rpp",
+        description="検索するレポート種別",
+        example="rpp-exp"
+    ),
+    start: Optional[str] = Query(
+        None,
+        description="期間の開始日 (YYYY-MM-DD形式、省略した場合は最初から)",
+        example="2024-01-01"
+    ),
+    end: Optional[str] = Query(
+        None,
+        description="期間の終了日 (YYYY-MM-DD形式、開始日を含む。省略した場合は最後まで)",
+        example="2024-03-31"
+    ),
+    columns: Optional[str] = Query(
+        None,
+        description="返す列（カンマ区切り）。report_date はレポートの日付",
+        example="report_date,商品管理番号,クリック数"
+    ),
+    where: Optional[List[str]] = Query(
+        None,
+        description="行の条件（/rpp-report と同じ形式）",
+        example="商品管理番号=abc-001"
+    ),
+    group_by: Optional[str] = Query(
+        None,
+        description="グループにする列（カンマ区切り）",
+        example="商品管理番号"
+    ),
+    sum_columns: Optional[str] = Query(
+        None,
+        alias="sum",
+        description="合計する列（カンマ区切り）",
+        example="実績額(合計)"
+    ),
+    limit: Optional[int] = Query(
+        None,
+        ge=1,
+        description="返す最大行数（REPORT_STORE_MAX_ROWS を超える値は切り詰める）"
+    ),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    蓄積したレポートを日付をまたいで検索・集計する（認証が必要）
+    
+    取得したレポートは種別ごとのテーブルに蓄積されるため、過去の期間の集計（商品ごとの90日間の実績額など）を
+    ポータルから取得し直さずに行える。結果はCSVで返す。
+    
+    Args:
+        report_type: 検索するレポート種別
+        start: 期間の開始日 (YYYY-MM-DD形式)
+        end: 期間の終了日 (YYYY-MM-DD形式)
+        columns: 返す列（カンマ区切り）
+        where: 行の条件（列名 演算子 値）
+        group_by: グループにする列（カンマ区切り）
+        sum_columns: 合計する列（カンマ区切り）
+        limit: 返す最大行数
+        current_user: 現在の認証済みユーザー
+    
+    Returns:
+        検索結果のCSVのレスポンス
+    """
+    report_store = _report_store(request)
+    try:
+        report_slug = get_report_slug(report_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="無効な日付形式です。YYYY-MM-DD形式で指定してください。例: 2024-01-01"
+        )
+    try:
+        query = ReportQuery.from_params(columns, where, group_by, sum_columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        cursor = await file_executor.run(report_store.open_query, report_slug, query, start_date, end_date, limit)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    period = f"{start or 'first'}_{end or 'last'}"
+    return StreamingResponse(
+        cursor.iter_csv(),
+        media_type=FORMAT_MEDIA_TYPES[FORMAT_CSV],
+        headers={
+            "Content-Disposition": f'attachment; filename="{report_type}_history_{period}.csv"',
+            "Cache-Control": "private, no-cache"
+        }
+    )
+
+
+@app.get("/rpp-report/history/dates")
+async def get_rpp_report_history_dates(
+    request: Request,
+    report_type: Optional[str] = Query(
+        None,
+        description="レポート種別（省略した場合はすべて）"
+    ),
+    current_user: User = Depends(get_current_active_user)
+):
+    """蓄積済みのレポート種別・日付と行数の一覧を取得する"""
+    report_store = _report_store(request)
+    try:
+        report_slug = get_report_slug(report_type) if report_type else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ingests = await file_executor.run(report_store.list_ingests, report_slug)
+    return {
+        "items": [
+            {
+                "report_type": item["report_slug"],
+                "date": item["report_date"],
+                "rows": item["row_count"],
+                "ingested_at": datetime.utcfromtimestamp(item["ingested_at"]).isoformat() + "Z"
+            }
+            for item in ingests
+        ]
+    }
+
+
+async def convert_batch_item(app_state, item: dict, mode: str, output_path: str) -> Tuple[str, int]:
+    """
+    バッチで取得した1件を変換し、キャッシュが有効であれば保存する
+
+    Args:
+        item: get_report_batch の結果の1件
+        mode: キャッシュの使い方
+        output_path: キャッシュに保存しない場合の書き込み先
+
+    Returns:
+        Tuple[str, int]: 変換済みCSVのパスと、書き込んだバイト数
+    """
+    report_cache: Optional[ReportCache] = app_state.report_cache
+    use_cache = report_cache is not None and mode != "bypass" and supports_date_range(item["slug"])
+    if use_cache:
+        output_path = report_cache.new_staging_path()
+    try:
+        if item["report_path"]:
+            with metrics.REPORT_PHASE_SECONDS.time(item["slug"], "converting"):
+                written = await file_executor.run_transcode(
+                    convert_csv_file, item["report_path"], output_path, item["slug"]
+                )
+        else:
+            await file_executor.run(lambda: open(output_path, "wb").close())
+            written = 0
+    except BaseException:
+        await file_executor.run(remove_temp_path, output_path)
+        raise
+    if use_cache:
+        try:
+            entry = await file_executor.run(report_cache.put_file, item["slug"], item["date"], output_path)
+            output_path = str(entry.path)
+            schedule_precompress(
+                report_cache, item["slug"], item["date"], FORMAT_EXTENSIONS[FORMAT_CSV], output_path
+            )
+        except Exception as e:
+            logger.warning(f"レポートのキャッシュ保存に失敗しました: {str(e)}")
+            _schedule_cleanup(output_path)
+    schedule_ingest(app_state.report_store, item["slug"], item["date"], output_path)
+    return output_path, written
+
+
+@app.post("/rpp-report/batch")
+async def get_rpp_report_batch(
+    request: Request,
+    batch_request: BatchReportRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    複数種別・複数日付のレポートを1回のログインで取得し、ZIPで返す（認証が必要）
+    
+    種別ごとに同じブラウザコンテキストの別タブで並行に取得する。
+    ZIPには各CSVと、項目ごとの取得結果を記載した manifest.json を含める。
+    1件が失敗しても他の項目は返す。
+    
+    Args:
+        batch_request: 取得するレポート種別と日付のリスト、キャッシュの使い方
+        current_user: 現在の認証済みユーザー
+    
+    Returns:
+        ZIPファイルのストリーミングレスポンス
+    """
+    if not batch_request.report_types or not batch_request.dates:
+        raise HTTPException(status_code=400, detail="report_types と dates を1件以上指定してください")
+    if batch_request.cache not in CACHE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"無効なcacheパラメータです: {batch_request.cache}. 利用可能: {', '.join(CACHE_MODES)}"
+        )
+    try:
+        target_dates = sorted({datetime.strptime(d, '%Y-%m-%d').date() for d in batch_request.dates})
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="無効な日付形式です。YYYY-MM-DD形式で指定してください。例: 2024-01-01"
+        )
+    
+    # 種別を正規化（同じスラッグは1回のみ）
+    report_types = {}
+    try:
+        for report_type in batch_request.report_types:
+            report_types.setdefault(get_report_slug(report_type), report_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    batch_max_items = get_report_batch_settings()["max_items"]
+    if len(report_types) * len(target_dates) > batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"取得件数が多すぎます。1回のバッチは最大{batch_max_items}件までです"
+        )
+    
+    logger.info(f"バッチ取得リクエスト: 種別={list(report_types.values())}, 日付={[d.isoformat() for d in target_dates]}")
+    
+    report_cache: Optional[ReportCache] = request.app.state.report_cache
+    mode = batch_request.cache
+    manifest = []
+    members = []
+    # ZIPに入れるために開いたファイル（レスポンスを返す前に失敗した場合は閉じる）
+    opened_files: List[BinaryIO] = []
+    cleanup_task = None
+    
+    try:
+        # キャッシュ済みの項目はブラウザを使わずに返す
+        pending_types = set()
+        pending_dates = set()
+        for report_slug, report_type in report_types.items():
+            for target_date in target_dates:
+                entry = None
+                cacheable = supports_date_range(report_slug)
+                if report_cache is not None and cacheable and mode in ("default", "only"):
+                    entry = await file_executor.run(report_cache.get, report_slug, target_date)
+                if entry is not None:
+                    metrics.REPORT_CACHE_LOOKUPS.inc(report_slug, "HIT")
+                    filename = f"{report_type}_report_{target_date.isoformat()}.csv"
+                    f = await file_executor.run(entry.open)
+                    opened_files.append(f)
+                    members.append((filename, iter_file_chunks(f)))
+                    manifest.append({
+                        "report_type": report_type,
+                        "date": target_date.isoformat(),
+                        "status": "ok" if entry.size else "no_data",
+                        "file": filename,
+                        "bytes": entry.size,
+                        "cache": "HIT",
+                        "error": None
+                    })
+                elif mode == "only":
+                    manifest.append({
+                        "report_type": report_type,
+                        "date": target_date.isoformat(),
+                        "status": "error",
+                        "file": None,
+                        "bytes": 0,
+                        "cache": "MISS" if cacheable else "BYPASS",
+                        "error": "キャッシュにレポートがありません"
+                    })
+                else:
+                    pending_types.add(report_slug)
+                    pending_dates.add(target_date)
+        
+        if pending_types:
+            try:
+                rms_credentials = get_rms_credentials()
+                rakuten_credentials = get_rakuten_credentials()
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"認証情報の取得に失敗しました: {str(e)}"
+                )
+            
+            temp_dir = tempfile.mkdtemp(prefix="rpp_batch_")
+            try:
+                try:
+                    async with admission_slot(request.app.state, current_user.username):
+                        items = await get_report_batch(
+                            rms_credentials=rms_credentials,
+                            rakuten_credentials=rakuten_credentials,
+                            report_types=[report_types[slug] for slug in sorted(pending_types)],
+                            target_dates=sorted(pending_dates),
+                            download_dir=os.path.join(temp_dir, "downloads"),
+                            pool=request.app.state.browser_pool
+                        )
+                except AdmissionRejectedError as e:
+                    raise admission_rejected(e)
+                except BrowserPoolTimeoutError as e:
+                    raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+                except Exception as e:
+                    logger.error(f"バッチ取得中にエラーが発生しました: {str(e)}")
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"レポート取得中にエラーが発生しました: {str(e)}"
+                    )
+                
+                converted_dir = os.path.join(temp_dir, "converted")
+                os.makedirs(converted_dir)
+                done_keys = {(m["report_type"], m["date"]) for m in manifest}
+                for item in items:
+                    report_type = report_types[item["slug"]]
+                    date_str = item["date"].isoformat()
+                    if (report_type, date_str) in done_keys:
+                        continue
+                    cache_status = "BYPASS" if mode == "bypass" or not supports_date_range(item["slug"]) else "MISS"
+                    metrics.REPORT_CACHE_LOOKUPS.inc(item["slug"], cache_status)
+                    if item["status"] == "no_data":
+                        metrics.REPORT_NO_DATA.inc(item["slug"])
+                    record = {
+                        "report_type": report_type,
+                        "date": date_str,
+                        "status": item["status"],
+                        "file": None,
+                        "bytes": 0,
+                        "cache": cache_status,
+                        "error": item["error"]
+                    }
+                    if item["status"] != "error":
+                        filename = f"{report_type}_report_{date_str}.csv"
+                        try:
+                            output_path, written = await convert_batch_item(
+                                request.app.state, item, mode, os.path.join(converted_dir, filename)
+                            )
+                            f = await file_executor.run(open, output_path, "rb")
+                        except Exception as e:
+                            # 壊れたZIPなど1件の変換失敗で他の項目を失わないよう、この項目だけをエラーにする
+                            logger.error(f"バッチの変換中にエラーが発生しました: {item['slug']} {date_str}, エラー: {str(e)}")
+                            record.update({"status": "error", "error": f"レポートの変換に失敗しました: {str(e)}"})
+                        else:
+                            opened_files.append(f)
+                            members.append((filename, iter_file_chunks(f)))
+                            record.update({"file": filename, "bytes": written})
+                    manifest.append(record)
+            except BaseException:
+                await file_executor.run(cleanup_temp_directory, temp_dir)
+                raise
+            # 変換済みファイルはZIPの送信が終わってから削除する
+            cleanup_task = BackgroundTask(file_executor.run, cleanup_temp_directory, temp_dir)
+    except BaseException:
+        for f in opened_files:
+            f.close()
+        raise
+    
+    manifest.sort(key=lambda m: (m["report_type"], m["date"]))
+    members.append((
+        "manifest.json",
+        json.dumps({"created_at": datetime.utcnow().isoformat() + "Z", "items": manifest}, ensure_ascii=False, indent=2).encode("utf-8")
+    ))
+    
+    first_date, last_date = target_dates[0].isoformat(), target_dates[-1].isoformat()
+    filename = f"reports_{first_date}.zip" if first_date == last_date else f"reports_{first_date}_{last_date}.zip"
+    return StreamingResponse(
+        iter_zip_stream(members),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=cleanup_task
+    )
+
+
+async def run_report_job(app_state, job: dict, on_phase: PhaseCallback) -> BinaryIO:
+    """ジョブとしてレポートを取得する（/rpp-report と同じキャッシュ・合流処理を使う）"""
+    target_date = datetime.strptime(job["report_date"], '%Y-%m-%d').date()
+    report_slug = get_report_slug(job["report_type"])
+    # ジョブも所有者の実行枠として数える（HTTPと同じ上限。ジョブは失敗させずに順番を待つ）
+    csv_file, _ = await load_report(
+        app_state, job["report_type"], report_slug, target_date, job["cache_mode"], on_phase,
+        client_id=job["owner"], wait_admission=True
+    )
+    return csv_file
+
+
+def _job_response(job: dict) -> dict:
+    """ジョブをレスポンス用の形式に変換する"""
+    def _iso(ts):
+        return datetime.utcfromtimestamp(ts).isoformat() + "Z" if ts else None
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "phase": job["phase"],
+        "report_type": job["report_type"],
+        "date": job["report_date"],
+        "cache": job["cache_mode"],
+        "error": job["error"],
+        "result_bytes": job["result_bytes"],
+        "result_url": f"/jobs/{job['id']}/result" if job["status"] == JOB_STATUS_SUCCEEDED else None,
+        "created_at": _iso(job["created_at"]),
+        "updated_at": _iso(job["updated_at"]),
+        "finished_at": _iso(job["finished_at"])
+    }
+
+
+async def _get_owned_job(request: Request, job_id: str, current_user: User) -> dict:
+    job = await request.app.state.job_manager.get(job_id)
+    if not job or job["owner"] != current_user.username:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    request: Request,
+    job_request: JobRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    レポート取得ジョブを登録する（認証が必要）
+    
+    接続を保持せずにジョブIDを即時に返す。進捗は GET /jobs/{job_id}、結果は GET /jobs/{job_id}/result で取得する。
+    Idempotency-Key ヘッダーが同じリクエストは、新しいジョブを作らず既存のジョブを返す。
+    
+    Args:
+        job_request: 取得するレポートの日付・種別・キャッシュの使い方
+        idempotency_key: 冪等キー（任意）
+        current_user: 現在の認証済みユーザー
+    
+    Returns:
+        ジョブの状態（新規登録時は202、既存ジョブの場合は200）
+    """
+    try:
+        target_date = datetime.strptime(job_request.date, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="無効な日付形式です。YYYY-MM-DD形式で指定してください。例: 2024-01-01"
+        )
+    try:
+        get_report_slug(job_request.report_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job_request.cache not in CACHE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"無効なcacheパラメータです: {job_request.cache}. 利用可能: {', '.join(CACHE_MODES)}"
+        )
+    
+    job = await request.app.state.job_manager.submit(
+        owner=current_user.username,
+        report_type=job_request.report_type,
+        report_date=target_date.isoformat(),
+        cache_mode=job_request.cache,
+        idempotency_key=idempotency_key
+    )
+    if job["created"]:
+        logger.info(f"ジョブを登録しました: {job['id']} ({job_request.report_type} {target_date}, ユーザー: {current_user.username})")
+    return JSONResponse(
+        status_code=202 if job["created"] else 200,
+        content=_job_response(job),
+        headers={"Location": f"/jobs/{job['id']}"}
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    request: Request,
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """ジョブの状態とフェーズを取得する（認証が必要）"""
+    return _job_response(await _get_owned_job(request, job_id, current_user))
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(
+    request: Request,
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """完了したジョブのCSVを取得する（認証が必要）"""
+    job = await _get_owned_job(request, job_id, current_user)
+    if job["status"] == JOB_STATUS_FAILED:
+        raise HTTPException(status_code=409, detail=f"ジョブは失敗しました: {job['error']}")
+    if job["status"] != JOB_STATUS_SUCCEEDED:
+        raise HTTPException(
+            status_code=409,
+            detail=f"ジョブはまだ完了していません（状態: {job['status']}, フェーズ: {job['phase']}）",
+            headers={"Retry-After": "10"}
+        )
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        raise HTTPException(status_code=410, detail="ジョブの結果は保持期間を過ぎたため削除されました")
+    
+    filename = f"{job['report_type']}_report_{job['report_date']}.csv"
+    return FileResponse(job["result_path"], media_type="text/csv", filename=filename)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,255 @@
+"""
+メトリクス
+処理フェーズごとの所要時間や、対象データなし・タイムアウト・キャッシュヒットの件数を集計し、
+Prometheusのテキスト形式で出力する
+
+記録はイベントループ上での辞書の更新のみで、ロックやI/Oは行わない。
+ブラウザ数・待ち行列などの現在値は、出力時に各コンポーネントの stats() から読む。
+"""
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# フェーズの所要時間のバケット（秒）。変換は数秒、レポート作成待ちは数分かかる
+PHASE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labelvalues: Sequence[str]) -> LabelValues:
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} のラベル数が一致しません: {labelvalues}")
+        return tuple(str(v) for v in labelvalues)
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._samples(),
+        ]
+
+
+class Counter(_Metric):
+    """増加のみの件数"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        key = self._key(labelvalues)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """現在値（出力の直前に設定する）"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[self._key(labelvalues)] = value
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """所要時間などの分布"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = PHASE_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルごとに [バケットごとの件数..., +Infの件数], 合計値
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        key = self._key(labelvalues)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        """with ブロックの所要時間を記録する"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def _samples(self) -> Iterable[str]:
+        names = self.labelnames + ("le",)
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(self._sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """出力するメトリクスの一覧"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REPORT_PHASE_SECONDS = REGISTRY.register(Histogram(
+    "rms_report_phase_seconds",
+    "Time spent in each report fetch phase (lease, login, navigate, date_entry, waiting, downloading, converting, formatting).",
+    ("report_type", "phase")
+))
+REPORT_NO_DATA = REGISTRY.register(Counter(
+    "rms_report_no_data_total",
+    "Reports for which the portal had no data.",
+    ("report_type",)
+))
+REPORT_TIMEOUTS = REGISTRY.register(Counter(
+    "rms_report_timeouts_total",
+    "Report fetches that failed with a timeout, by kind (browser_pool, report_wait, playwright).",
+    ("report_type", "kind")
+))
+REPORT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "rms_report_cache_lookups_total",
+    "Report requests by cache result (HIT, MISS, BYPASS).",
+    ("report_type", "result")
+))
+COMPRESSED_RESPONSES = REGISTRY.register(Counter(
+    "rms_compressed_responses_total",
+    "Compressed responses by encoding and mode (precompressed from the cache, or on_the_fly).",
+    ("encoding", "mode")
+))
+SCREENSHOTS = REGISTRY.register(Counter(
+    "rms_screenshots_total",
+    "Diagnostic screenshots taken by the browser automation."
+))
+BROWSERS_RUNNING = REGISTRY.register(Gauge(
+    "rms_browsers_running",
+    "Chromium processes currently running in the browser pool."
+))
+BROWSERS_IN_USE = REGISTRY.register(Gauge(
+    "rms_browsers_in_use",
+    "Browsers currently leased to a fetch."
+))
+ADMISSION_RUNNING = REGISTRY.register(Gauge(
+    "rms_admission_running",
+    "Browser fetches currently admitted."
+))
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "rms_admission_queue_depth",
+    "Browser fetches waiting in the admission queue."
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "rms_admission_rejected_total",
+    "Browser fetches rejected with 429, by reason (queue_full, client_limit, timeout).",
+    ("reason",)
+))
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    "rms_jobs_queued",
+    "Asynchronous jobs waiting to run."
+))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.register(Gauge(
+    "rms_event_loop_lag_seconds",
+    "Most recent event loop lag sample."
+))
+
+
+# 処理フェーズの通知先（rpp_service.PhaseCallback と同じ形）
+PhaseCallback = Callable[[str], None]
+
+
+class PhaseTimer:
+    """
+    フェーズの開始通知を受け取り、前のフェーズの所要時間を記録する
+    on_phase の代わりに渡し、最後に finish() を呼ぶ
+
+    Args:
+        report_type (str): ラベルに使うレポート種別（スラッグ）
+        on_phase (Optional[PhaseCallback]): 通知をそのまま転送する先
+    """
+
+    def __init__(self, report_type: str, on_phase: Optional[PhaseCallback] = None):
+        self.report_type = report_type
+        self.on_phase = on_phase
+        self._phase: Optional[str] = None
+        self._started = 0.0
+
+    def __call__(self, phase: str) -> None:
+        now = time.perf_counter()
+        if self._phase is not None:
+            REPORT_PHASE_SECONDS.observe(now - self._started, self.report_type, self._phase)
+        self._phase = phase
+        self._started = now
+        if self.on_phase:
+            self.on_phase(phase)
+
+    def finish(self) -> None:
+        """実行中のフェーズの所要時間を記録する（例外で終了した場合も呼ぶ）"""
+        if self._phase is not None:
+            REPORT_PHASE_SECONDS.observe(time.perf_counter() - self._started, self.report_type, self._phase)
+            self._phase = None
@@ -0,0 +1,167 @@
+"""
+前日レポートの事前取得
+毎日決まった時刻（日本時間）に前日分のレポートを取得してキャッシュに保存し、
+朝に集中するリクエストをブラウザを使わずに返せるようにする
+"""
+import asyncio
+import logging
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from report_cache import JST, today_jst
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_STATUS_OK = "ok"
+PREFETCH_STATUS_CACHED = "cached"
+PREFETCH_STATUS_NO_DATA = "no_data"
+PREFETCH_STATUS_ERROR = "error"
+PREFETCH_STATUS_PENDING = "pending"
+
+# 1件を取得する関数: (レポート種別, 日付) -> (状態, バイト数)
+# 状態は ok / cached / no_data のいずれか。失敗した場合は例外を送出する
+PrefetchFetcher = Callable[[str, date], Awaitable[Tuple[str, int]]]
+
+
+def parse_run_time(value: str) -> dt_time:
+    """'HH:MM' 形式の時刻を読み取る"""
+    try:
+        return datetime.strptime(value.strip(), "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"無効な時刻です: {value}. HH:MM形式で指定してください")
+
+
+class PrefetchScheduler:
+    """
+    毎日 run_at（日本時間）に前日分のレポートを取得する
+
+    データがまだ作成されていない（対象データなし）場合や失敗した場合は、
+    retry_interval 秒おきに max_attempts 回まで取得し直す。
+
+    Args:
+        fetch (PrefetchFetcher): 1件を取得してキャッシュに保存する関数
+        report_types (List[str]): 取得するレポート種別
+        run_at (datetime.time): 実行時刻（日本時間）
+        max_attempts (int): 1件あたりの最大試行回数
+        retry_interval (float): 再試行までの秒数
+    """
+
+    def __init__(
+        self,
+        fetch: PrefetchFetcher,
+        report_types: List[str],
+        run_at: dt_time,
+        max_attempts: int = 8,
+        retry_interval: float = 900.0
+    ):
+        self.fetch = fetch
+        self.report_types = list(report_types)
+        self.run_at = run_at
+        self.max_attempts = max(1, max_attempts)
+        self.retry_interval = retry_interval
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._next_run_at: Optional[datetime] = None
+        self._last_run: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._loop())
+        logger.info(
+            f"事前取得を開始しました: 種別={self.report_types}, 実行時刻={self.run_at.strftime('%H:%M')}（日本時間）"
+        )
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_run(self, now: datetime) -> datetime:
+        run_at = datetime.combine(now.date(), self.run_at, tzinfo=JST)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+
+    async def _loop(self) -> None:
+        # 実行時刻を過ぎてから起動した場合は、その日の分をすぐに取得する（キャッシュ済みのものは取得しない）
+        now = datetime.now(JST)
+        if now >= datetime.combine(now.date(), self.run_at, tzinfo=JST):
+            await self._run_safely()
+        while True:
+            now = datetime.now(JST)
+            self._next_run_at = self._next_run(now)
+            await asyncio.sleep((self._next_run_at - now).total_seconds())
+            await self._run_safely()
+
+    async def _run_safely(self) -> None:
+        try:
+            await self.run_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"事前取得中にエラーが発生しました: {str(e)}")
+
+    async def run_once(self, target_date: Optional[date] = None) -> Dict[str, Any]:
+        """
+        指定日（省略時は日本時間の前日）の全種別を取得する
+
+        Returns:
+            Dict[str, Any]: 実行結果（status() の last_run と同じ形式）
+        """
+        target_date = target_date or today_jst() - timedelta(days=1)
+        run = {
+            "target_date": target_date.isoformat(),
+            "started_at": datetime.now(JST).isoformat(),
+            "finished_at": None,
+            "items": {
+                report_type: {"status": PREFETCH_STATUS_PENDING, "attempts": 0, "bytes": 0, "error": None}
+                for report_type in self.report_types
+            },
+        }
+        self._last_run = run
+        self._running = True
+        logger.info(f"事前取得を実行します: {target_date}")
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                pending = [
+                    report_type for report_type, item in run["items"].items()
+                    if item["status"] in (PREFETCH_STATUS_PENDING, PREFETCH_STATUS_NO_DATA, PREFETCH_STATUS_ERROR)
+                ]
+                if not pending:
+                    break
+                if attempt > 1:
+                    logger.info(f"{self.retry_interval:.0f}秒後に事前取得を再試行します: {pending}")
+                    await asyncio.sleep(self.retry_interval)
+                for report_type in pending:
+                    item = run["items"][report_type]
+                    item["attempts"] = attempt
+                    try:
+                        status, size = await self.fetch(report_type, target_date)
+                        item.update({"status": status, "bytes": size, "error": None})
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        detail = getattr(e, "detail", None) or str(e)
+                        logger.warning(f"事前取得に失敗しました（{report_type} {target_date}, {attempt}回目）: {detail}")
+                        item.update({"status": PREFETCH_STATUS_ERROR, "error": str(detail)})
+        finally:
+            run["finished_at"] = datetime.now(JST).isoformat()
+            self._running = False
+        logger.info(
+            "事前取得が終了しました: "
+            + ", ".join(f"{rt}={item['status']}" for rt, item in run["items"].items())
+        )
+        return run
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "report_types": self.report_types,
+            "run_at": self.run_at.strftime("%H:%M"),
+            "timezone": "Asia/Tokyo",
+            "max_attempts": self.max_attempts,
+            "retry_interval_seconds": self.retry_interval,
+            "running": self._running,
+            "next_run_at": self._next_run_at.isoformat() if self._next_run_at else None,
+            "last_run": self._last_run,
+        }
@@ -0,0 +1,406 @@
+"""
+レポートキャッシュ
+UTF-8に変換済みのレポートCSVを (レポート種別スラッグ, 日付) 単位でディスクに保存する
+
+一定日数以上前の日付のレポートは確定済み（不変）として期限なしで保持し、
+それより新しい日付はポータル側で数値が修正されるためTTLを設ける。
+容量が上限を超えた場合は最後に参照された時刻が古いものから削除する（LRU）。
+CSVから作った別形式のファイル（Parquetなど）はCSVの横に保存し、CSVと一緒に置き換え・削除する。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JST = timezone(timedelta(hours=+9))
+
+CACHE_MODES = ("default", "bypass", "refresh", "only")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def today_jst() -> date:
+    """日本時間の今日の日付"""
+    return datetime.now(JST).date()
+
+
+def file_sha256(f: BinaryIO) -> str:
+    """開いたファイルの内容全体のSHA-256（16進数）を返す（読み込み位置は先頭に戻す）"""
+    digest = hashlib.sha256()
+    f.seek(0)
+    while True:
+        chunk = f.read(HASH_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    """キャッシュされたレポート1件"""
+
+    def __init__(self, slug: str, target_date: date, path: Path, fetched_at: float, size: int, immutable: bool):
+        self.slug = slug
+        self.target_date = target_date
+        self.path = path
+        self.fetched_at = fetched_at
+        self.size = size
+        self.immutable = immutable
+
+    def open(self):
+        """キャッシュファイルをバイナリモードで開く（開いた後に削除されても読み続けられる）"""
+        return open(self.path, "rb")
+
+
+class ReportCache:
+    """
+    変換済みレポートのディスクキャッシュ
+
+    イベントループ（get など）とファイル処理ワーカー（put_file・put_variant・削除）の両方から使うため、
+    インデックスの読み書きはロックの中で行う。
+
+    Args:
+        cache_dir (str): キャッシュディレクトリ
+        immutable_after_days (int): この日数以上前の日付は不変として扱う
+        recent_ttl_seconds (float): 不変でない日付のキャッシュ有効期間（秒）
+        max_bytes (int): キャッシュ全体の容量上限（バイト）
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        immutable_after_days: int = 7,
+        recent_ttl_seconds: float = 3600,
+        max_bytes: int = 2 * 1024 * 1024 * 1024
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.immutable_after_days = immutable_after_days
+        self.recent_ttl_seconds = recent_ttl_seconds
+        self.max_bytes = max_bytes
+        # (slug, 日付文字列) -> (サイズ, 最終参照時刻)
+        self._index: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        # _index を守るロック（_register から _evict・delete を呼ぶため再入可能にする）
+        self._lock = threading.RLock()
+        self._stats = {
+            "hits_total": 0,
+            "misses_total": 0,
+            "stale_total": 0,
+            "writes_total": 0,
+            "evictions_total": 0,
+        }
+        self._load_index()
+
+    def new_staging_path(self) -> str:
+        """
+        キャッシュへ書き込む前の一時ファイルのパスを返す
+        キャッシュと同じファイルシステム上に作るため、put_fileでの移動はリネームだけで済む
+        """
+        staging_dir = self.cache_dir / ".staging"
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=".report_", suffix=".tmp", dir=str(staging_dir))
+        os.close(fd)
+        return path
+
+    def _data_path(self, slug: str, date_str: str) -> Path:
+        return self.cache_dir / slug / f"{date_str}.csv"
+
+    def _meta_path(self, slug: str, date_str: str) -> Path:
+        return self.cache_dir / slug / f"{date_str}.json"
+
+    def _variant_path(self, slug: str, date_str: str, suffix: str) -> Path:
+        return self.cache_dir / slug / f"{date_str}.{suffix}"
+
+    def _variant_paths(self, slug: str, date_str: str) -> List[Path]:
+        """CSVから作った別形式のファイルの一覧"""
+        return [
+            path for path in (self.cache_dir / slug).glob(f"{date_str}.*")
+            if path.suffix not in (".csv", ".json")
+        ]
+
+    def _entry_size(self, slug: str, date_str: str) -> int:
+        """CSVと別形式のファイルの合計サイズ"""
+        total = 0
+        for path in [self._data_path(slug, date_str), *self._variant_paths(slug, date_str)]:
+            try:
+                total += path.stat().st_size
+            except OSError:
+                continue
+        return total
+
+    def _load_index(self) -> None:
+        """起動時にディスク上のキャッシュを走査してインデックスを作る"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for data_path in self.cache_dir.glob("*/*.csv"):
+            try:
+                stat = data_path.stat()
+                size = self._entry_size(data_path.parent.name, data_path.stem)
+                self._index[(data_path.parent.name, data_path.stem)] = (size, stat.st_atime)
+            except OSError:
+                continue
+        logger.info(f"レポートキャッシュを読み込みました: {len(self._index)}件, {self.total_bytes()}バイト")
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(size for size, _ in self._index.values())
+
+    def is_immutable(self, target_date: date) -> bool:
+        """確定済み（今後変わらない）日付かどうか"""
+        return (today_jst() - target_date).days >= self.immutable_after_days
+
+    def get(self, slug: str, target_date: date) -> Optional[CacheEntry]:
+        """
+        有効なキャッシュを取得する
+
+        Returns:
+            Optional[CacheEntry]: 有効なエントリ。存在しないかTTL切れの場合はNone
+        """
+        date_str = target_date.isoformat()
+        key = (slug, date_str)
+        data_path = self._data_path(slug, date_str)
+        with self._lock:
+            if key not in self._index or not data_path.exists():
+                self._index.pop(key, None)
+                self._stats["misses_total"] += 1
+                return None
+
+        ttl_seconds = self.recent_ttl_seconds
+        try:
+            meta = json.loads(self._meta_path(slug, date_str).read_text(encoding="utf-8"))
+            fetched_at = float(meta["fetched_at"])
+            ttl_seconds = float(meta.get("ttl_seconds") or ttl_seconds)
+        except Exception:
+            fetched_at = data_path.stat().st_mtime
+
+        immutable = self.is_immutable(target_date)
+        if not immutable and time.time() - fetched_at > ttl_seconds:
+            with self._lock:
+                self._stats["stale_total"] += 1
+                self._stats["misses_total"] += 1
+            return None
+
+        now = time.time()
+        with self._lock:
+            current = self._index.get(key)
+            if current is None:
+                # 確認の後に別のワーカーが削除した場合
+                self._stats["misses_total"] += 1
+                return None
+            self._index[key] = (current[0], now)
+            self._stats["hits_total"] += 1
+        try:
+            stat = data_path.stat()
+            size = stat.st_size
+            os.utime(data_path, (now, stat.st_mtime))
+        except OSError:
+            size = 0
+        return CacheEntry(slug, target_date, data_path, fetched_at, size, immutable)
+
+    def put_file(self, slug: str, target_date: date, src_path: str, ttl_seconds: Optional[float] = None) -> CacheEntry:
+        """
+        変換済みCSVファイルをキャッシュに移動する（src_pathは移動後に存在しなくなる）
+        ttl_secondsを指定すると、不変でない日付の有効期間をこのエントリだけ変更する
+        """
+        date_str = target_date.isoformat()
+        data_path = self._data_path(slug, date_str)
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        fetched_at = time.time()
+        # ETagに使うため、保存時に内容のハッシュを計算しておく
+        with open(src_path, "rb") as f:
+            sha256 = file_sha256(f)
+
+        with self._lock:
+            self._move_file(src_path, data_path)
+            # 置き換える前のCSVから作った別形式のファイルは使えないため削除する
+            self._delete_variants(slug, date_str)
+
+            size = data_path.stat().st_size
+            meta = {"slug": slug, "date": date_str, "fetched_at": fetched_at, "size": size, "sha256": sha256}
+            if ttl_seconds:
+                meta["ttl_seconds"] = ttl_seconds
+            self._atomic_write(self._meta_path(slug, date_str), json.dumps(meta).encode("utf-8"))
+            return self._register(slug, target_date, data_path, fetched_at, size)
+
+    def get_variant(self, slug: str, target_date: date, suffix: str) -> Optional[Path]:
+        """
+        CSVから作った別形式のファイル（suffixは拡張子。parquet など）を取得する
+        CSVの有効期限は確認しないため、先に get() で有効なエントリがあることを確かめておく
+
+        Returns:
+            Optional[Path]: ファイルのパス。まだ作られていない場合はNone
+        """
+        path = self._variant_path(slug, target_date.isoformat(), suffix)
+        return path if path.exists() else None
+
+    def is_current(self, slug: str, target_date: date, source_inode: Optional[int] = None) -> bool:
+        """
+        キャッシュにCSVがあり、source_inodeを指定した場合はそれが現在のCSVのinode番号と一致するかどうか
+        （別形式のファイルを作り始めた後にCSVが取得し直されていないことの確認に使う）
+        """
+        date_str = target_date.isoformat()
+        with self._lock:
+            if (slug, date_str) not in self._index:
+                return False
+        try:
+            current = self._data_path(slug, date_str).stat()
+        except OSError:
+            return False
+        return source_inode is None or current.st_ino == source_inode
+
+    def get_meta(self, slug: str, target_date: date, source_inode: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュしたCSVの検証用の情報（HTTPの ETag / Last-Modified / Cache-Control に使う）を返す
+        ハッシュを記録していないエントリ（以前のバージョンで保存したもの）は、ここで計算して記録する
+
+        Returns:
+            Optional[Dict[str, Any]]: sha256, fetched_at, expires_at（不変の日付はNone）, immutable。
+                CSVがないか、source_inodeのCSVが既に置き換えられている場合はNone
+        """
+        if not self.is_current(slug, target_date, source_inode):
+            return None
+        date_str = target_date.isoformat()
+        data_path = self._data_path(slug, date_str)
+        meta_path = self._meta_path(slug, date_str)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            meta = {"slug": slug, "date": date_str, "fetched_at": data_path.stat().st_mtime}
+        if not meta.get("sha256"):
+            with open(data_path, "rb") as f:
+                if source_inode is not None and os.fstat(f.fileno()).st_ino != source_inode:
+                    return None
+                meta["sha256"] = file_sha256(f)
+                meta["size"] = os.fstat(f.fileno()).st_size
+            self._atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+        fetched_at = float(meta["fetched_at"])
+        immutable = self.is_immutable(target_date)
+        ttl_seconds = float(meta.get("ttl_seconds") or self.recent_ttl_seconds)
+        return {
+            "sha256": meta["sha256"],
+            "fetched_at": fetched_at,
+            "expires_at": None if immutable else fetched_at + ttl_seconds,
+            "immutable": immutable,
+        }
+
+    def put_variant(
+        self,
+        slug: str,
+        target_date: date,
+        suffix: str,
+        src_path: str,
+        source_inode: Optional[int] = None
+    ) -> Optional[Path]:
+        """
+        CSVから作った別形式のファイルをCSVの横に移動する（src_pathは移動後に存在しなくなる）
+        source_inodeに変換元のCSVのinode番号を指定すると、その後にCSVが置き換えられていた場合は保存しない
+
+        Returns:
+            Optional[Path]: 保存したファイルのパス。CSVがないか置き換えられていて保存しなかった場合はNone（src_pathは残る）
+        """
+        date_str = target_date.isoformat()
+        key = (slug, date_str)
+        path = self._variant_path(slug, date_str, suffix)
+        # 確認から移動までの間にCSVが置き換え・削除されないよう、ロックの中で行う
+        with self._lock:
+            if not self.is_current(slug, target_date, source_inode):
+                return None
+            self._move_file(src_path, path)
+            _, accessed = self._index[key]
+            self._index[key] = (self._entry_size(slug, date_str), accessed)
+        logger.info(f"レポートの{suffix}形式をキャッシュに保存しました: {slug} {date_str}")
+        self._evict(keep=key)
+        return path
+
+    def _move_file(self, src_path: str, dst_path: Path) -> None:
+        """ファイルを移動する（移動先を読み込み中の側が途中の状態を見ることはない）"""
+        try:
+            os.replace(src_path, dst_path)
+        except OSError:
+            # 別のファイルシステムの場合はコピーしてからリネームする
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{dst_path.name}.", dir=str(dst_path.parent))
+            os.close(fd)
+            try:
+                shutil.copyfile(src_path, tmp_path)
+                os.replace(tmp_path, dst_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            os.unlink(src_path)
+
+    def _register(self, slug: str, target_date: date, data_path: Path, fetched_at: float, size: int) -> CacheEntry:
+        key = (slug, target_date.isoformat())
+        with self._lock:
+            self._index[key] = (self._entry_size(*key), fetched_at)
+            self._stats["writes_total"] += 1
+        logger.info(f"レポートをキャッシュに保存しました: {slug} {key[1]} ({size}バイト)")
+
+        self._evict(keep=key)
+        return CacheEntry(slug, target_date, data_path, fetched_at, size, self.is_immutable(target_date))
+
+    def _atomic_write(self, path: Path, content: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=str(path.parent))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _evict(self, keep: Optional[Tuple[str, str]] = None) -> None:
+        """容量上限を超えている間、最終参照が古いものから削除する（keepは書き込んだばかりのため残す）"""
+        with self._lock:
+            total = sum(size for size, _ in self._index.values())
+            if total <= self.max_bytes:
+                return
+            for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self.delete(*key)
+                total -= size
+                self._stats["evictions_total"] += 1
+                logger.info(f"キャッシュ容量上限のためレポートを削除しました: {key[0]} {key[1]}")
+
+    def delete(self, slug: str, date_str: str) -> None:
+        """エントリを削除する"""
+        with self._lock:
+            self._index.pop((slug, date_str), None)
+            self._remove_files([self._data_path(slug, date_str), self._meta_path(slug, date_str)])
+            self._delete_variants(slug, date_str)
+
+    def _delete_variants(self, slug: str, date_str: str) -> None:
+        self._remove_files(self._variant_paths(slug, date_str))
+
+    def _remove_files(self, paths: List[Path]) -> None:
+        for path in paths:
+            try:
+                if path.exists():
+                    path.unlink()
+            except OSError as e:
+                logger.warning(f"キャッシュファイルの削除に失敗しました: {path}, エラー: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの状態を返す"""
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+                "immutable_after_days": self.immutable_after_days,
+                "recent_ttl_seconds": self.recent_ttl_seconds,
+                **self._stats,
+            }
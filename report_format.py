@@ -0,0 +1,306 @@
+"""
+レポートの出力形式
+変換済み（UTF-8）のCSVを、数値・日付を型付けした NDJSON / Parquet / Arrow IPCストリームに変換する
+
+金額の桁区切り（1,234 / ¥1,234 / 1,234円）や率（12.34%）は数値に、日付は日付型にする（率は表示どおりの値で、12.34%は12.34）。
+1回目の走査で列ごとの型を決め、2回目の走査で一定行数ずつ列単位に変換して書き込むため、
+メモリ使用量はレポートの大きさに関わらず一定になる。
+Parquet / Arrow IPCストリームの出力にはpyarrowが必要。
+"""
+import csv
+import json
+import os
+import re
+import tempfile
+from datetime import date
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from report_range import parse_report_date
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+
+REPORT_FORMATS = (FORMAT_CSV, FORMAT_NDJSON, FORMAT_PARQUET, FORMAT_ARROW)
+
+# pyarrowが必要な形式
+ARROW_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+
+FORMAT_MEDIA_TYPES = {
+    FORMAT_CSV: "text/csv",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# ファイル名の拡張子（キャッシュに保存する際の拡張子も兼ねる）
+FORMAT_EXTENSIONS = {
+    FORMAT_CSV: "csv",
+    FORMAT_NDJSON: "ndjson",
+    FORMAT_PARQUET: "parquet",
+    FORMAT_ARROW: "arrows",
+}
+
+COLUMN_INT = "int"
+COLUMN_FLOAT = "float"
+COLUMN_DATE = "date"
+COLUMN_STRING = "string"
+
+# 1回に列単位で変換する行数
+BATCH_ROWS = 16 * 1024
+
+PARQUET_COMPRESSION = "zstd"
+
+# 値なしとみなす表記
+NULL_VALUES = frozenset(("", "-", "－", "ー", "―"))
+
+# 符号・通貨記号・桁区切り・小数・%や円の単位を含む数値
+_NUMBER_RE = re.compile(r"^([-+]?)[¥￥]?((?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?)\s*[%％円]?$")
+_INT64_MAX = 2 ** 63 - 1
+
+# レポート内の日付の種類は少ないため、表記ごとの変換結果を使い回す（strptimeは1件ごとの負荷が大きい）
+_parse_date = lru_cache(maxsize=4096)(parse_report_date)
+
+
+def is_format_available(report_format: str) -> bool:
+    """この環境で出力できる形式かどうか（Parquet / Arrow はpyarrowが必要）"""
+    return report_format in REPORT_FORMATS and (report_format not in ARROW_FORMATS or pa is not None)
+
+
+def _numeric_text(value: str) -> Optional[str]:
+    """
+    数値として読める場合は、通貨記号・円・%・桁区切りを除いた文字列を返す
+    先頭が0の複数桁（商品番号など）は数値として扱わない
+    """
+    match = _NUMBER_RE.match(value)
+    if match is None:
+        return None
+    sign, digits = match.groups()
+    if "," in digits:
+        digits = digits.replace(",", "")
+    if len(digits) > 1 and digits[0] == "0" and digits[1] != ".":
+        return None
+    return sign + digits
+
+
+def parse_number(value: str) -> Optional[Union[int, float]]:
+    """金額・件数・率などの表記を数値にする（値なし・数値として読めない場合はNone）"""
+    value = value.strip()
+    if value in NULL_VALUES:
+        return None
+    number = _numeric_text(value)
+    if number is None:
+        return None
+    return float(number) if "." in number else int(number)
+
+
+def _unique_names(header: List[str]) -> List[str]:
+    """空・重複した列名を補う（Parquet / Arrow は列名が一意である必要がある）"""
+    names: List[str] = []
+    for index, name in enumerate(header):
+        base = name.strip() or f"column_{index + 1}"
+        name, suffix = base, 1
+        while name in names:
+            suffix += 1
+            name = f"{base}_{suffix}"
+        names.append(name)
+    return names
+
+
+def infer_column_types(src_path: str) -> Tuple[List[str], List[str]]:
+    """
+    CSVを1回走査して列ごとの型を決める
+    すべての値が整数として読める列は int、小数を含む列は float、日付として読める列は date、それ以外は string になる
+
+    Returns:
+        Tuple[List[str], List[str]]: 列名（重複は補正済み）と列ごとの型。データがない場合はどちらも空
+    """
+    with open(src_path, "r", encoding="utf-8", newline="") as src:
+        reader = csv.reader(src)
+        header = next(reader, None)
+        if not header:
+            return [], []
+        width = len(header)
+        candidates = [{COLUMN_INT, COLUMN_FLOAT, COLUMN_DATE} for _ in range(width)]
+        has_value = [False] * width
+        for row in reader:
+            for index, value in enumerate(row[:width]):
+                kinds = candidates[index]
+                if not kinds:
+                    continue
+                value = value.strip()
+                if value in NULL_VALUES:
+                    continue
+                has_value[index] = True
+                if COLUMN_FLOAT in kinds:
+                    number = _numeric_text(value)
+                    if number is None:
+                        kinds.discard(COLUMN_INT)
+                        kinds.discard(COLUMN_FLOAT)
+                    elif "." in number or (len(number) > 18 and abs(int(number)) > _INT64_MAX):
+                        kinds.discard(COLUMN_INT)
+                if COLUMN_DATE in kinds and _parse_date(value) is None:
+                    kinds.discard(COLUMN_DATE)
+
+    types = []
+    for kinds, found in zip(candidates, has_value):
+        if not found:
+            types.append(COLUMN_STRING)
+        elif COLUMN_INT in kinds:
+            types.append(COLUMN_INT)
+        elif COLUMN_FLOAT in kinds:
+            types.append(COLUMN_FLOAT)
+        elif COLUMN_DATE in kinds:
+            types.append(COLUMN_DATE)
+        else:
+            types.append(COLUMN_STRING)
+    return _unique_names(header), types
+
+
+def _int_value(value: str) -> Optional[int]:
+    value = value.strip()
+    return None if value in NULL_VALUES else int(_numeric_text(value))
+
+
+def _float_value(value: str) -> Optional[float]:
+    value = value.strip()
+    return None if value in NULL_VALUES else float(_numeric_text(value))
+
+
+def _date_value(value: str) -> Optional[date]:
+    value = value.strip()
+    return None if value in NULL_VALUES else _parse_date(value)
+
+
+def _iso_date_value(value: str) -> Optional[str]:
+    parsed = _date_value(value)
+    return parsed.isoformat() if parsed else None
+
+
+def _string_value(value: str) -> Optional[str]:
+    return None if value.strip() in NULL_VALUES else value
+
+
+_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    COLUMN_INT: _int_value,
+    COLUMN_FLOAT: _float_value,
+    COLUMN_DATE: _date_value,
+    COLUMN_STRING: _string_value,
+}
+
+
+def iter_column_batches(
+    src_path: str,
+    types: List[str],
+    batch_rows: int = BATCH_ROWS,
+    json_dates: bool = False
+) -> Iterator[List[list]]:
+    """
+    ヘッダー行を除いたCSVを batch_rows 行ずつ列に組み替え、列ごとに型変換して返す
+    列数が足りない行は値なし、多い行は余分な値を切り捨てる
+
+    Args:
+        json_dates: Trueの場合、日付をISO形式の文字列にする（NDJSON用）
+
+    Yields:
+        List[list]: 列ごとの変換済みの値
+    """
+    width = len(types)
+    converters = [
+        _iso_date_value if json_dates and kind == COLUMN_DATE else _CONVERTERS[kind]
+        for kind in types
+    ]
+    with open(src_path, "r", encoding="utf-8", newline="") as src:
+        reader = csv.reader(src)
+        next(reader, None)
+        while True:
+            rows = []
+            for row in reader:
+                if len(row) != width:
+                    row = (row + [""] * width)[:width]
+                rows.append(row)
+                if len(rows) >= batch_rows:
+                    break
+            if not rows:
+                return
+            yield [
+                [convert(value) for value in column]
+                for convert, column in zip(converters, zip(*rows))
+            ]
+
+
+def _arrow_schema(names: List[str], types: List[str]):
+    arrow_types = {
+        COLUMN_INT: pa.int64(),
+        COLUMN_FLOAT: pa.float64(),
+        COLUMN_DATE: pa.date32(),
+        COLUMN_STRING: pa.string(),
+    }
+    return pa.schema([pa.field(name, arrow_types[kind]) for name, kind in zip(names, types)])
+
+
+def _write_ndjson(src_path: str, dst, names: List[str], types: List[str]) -> None:
+    for columns in iter_column_batches(src_path, types, json_dates=True):
+        lines = [
+            json.dumps(dict(zip(names, values)), ensure_ascii=False)
+            for values in zip(*columns)
+        ]
+        dst.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def _write_arrow(src_path: str, dst, names: List[str], types: List[str], report_format: str) -> None:
+    schema = _arrow_schema(names, types)
+    if report_format == FORMAT_PARQUET:
+        writer = pq.ParquetWriter(dst, schema, compression=PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(dst, schema)
+    try:
+        for columns in iter_column_batches(src_path, types):
+            arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+
+
+def convert_report_format(src_path: str, dst_path: str, report_format: str) -> int:
+    """
+    変換済みCSVを指定の形式に変換して保存する（一時ファイルに書き込んでからリネームする）
+    データがないCSV（空のファイル）は、列のない空のデータとして出力する
+
+    Returns:
+        int: 書き込んだバイト数
+
+    Raises:
+        ValueError: 対応していない、またはこの環境で出力できない形式の場合
+    """
+    if report_format == FORMAT_CSV or report_format not in REPORT_FORMATS:
+        raise ValueError(f"変換できない形式です: {report_format}")
+    if not is_format_available(report_format):
+        raise ValueError(f"pyarrowがインストールされていないため、{report_format}形式では出力できません")
+
+    names, types = infer_column_types(src_path)
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".format_", suffix=".tmp", dir=dst_dir)
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            if report_format == FORMAT_NDJSON:
+                _write_ndjson(src_path, dst, names, types)
+            else:
+                _write_arrow(src_path, dst, names, types, report_format)
+            written = dst.tell()
+        os.replace(tmp_path, dst_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return written
@@ -0,0 +1,289 @@
+"""
+レポートのクエリ
+変換済み（UTF-8）のCSVを1回読みながら、列の絞り込み・行の条件・グループごとの合計を行う
+
+結果だけを返すため、一部の列や商品・キャンペーンごとの合計だけを使うクライアントの転送量が大きく減る。
+行は読み込んだ順に処理し、保持するのはグループごとの合計のみのため、メモリ使用量はグループ数にのみ比例する。
+"""
+import csv
+import hashlib
+import io
+import json
+from datetime import date
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from report_format import parse_number
+from report_range import parse_report_date
+
+# 条件の演算子（2文字のものを先に判定する）
+FILTER_OPERATORS = ("!=", ">=", "<=", "=", ">", "<", "~")
+
+# グループごとの行数を出力する列名
+COUNT_COLUMN = "件数"
+
+# 「=」「!=」で複数の値を指定する場合の区切り
+VALUE_SEPARATOR = "|"
+
+# この行数ごとに出力する
+FLUSH_ROWS = 2000
+
+Number = Union[int, float]
+
+# 日付の比較は行ごとに行うため、表記ごとの変換結果を使い回す
+_parse_date = lru_cache(maxsize=4096)(parse_report_date)
+
+
+def _split_columns(value: Optional[str]) -> List[str]:
+    return [c.strip() for c in (value or "").split(",") if c.strip()]
+
+
+class QueryFilter:
+    """
+    行の条件（列 演算子 値）
+
+    = / != は値のいずれかと一致するか（「|」区切りで複数指定。数値は 1,234 と 1234 を同じとみなす）、
+    > / >= / < / <= は数値または日付として比較し、~ は部分一致で判定する。
+    """
+
+    def __init__(self, column: str, operator: str, value: str):
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"対応していない演算子です: {operator}")
+        self.column = column
+        self.operator = operator
+        self.value = value
+        self.values = {v.strip() for v in value.split(VALUE_SEPARATOR)} if operator in ("=", "!=") else {value.strip()}
+        self.numbers = {n for n in (parse_number(v) for v in self.values) if n is not None}
+        self.number = parse_number(value) if operator in (">", ">=", "<", "<=") else None
+        self.date = parse_report_date(value) if operator in (">", ">=", "<", "<=") and self.number is None else None
+        if operator in (">", ">=", "<", "<=") and self.number is None and self.date is None:
+            raise ValueError(f"{operator} には数値または日付を指定してください: {column}{operator}{value}")
+
+    @classmethod
+    def parse(cls, expression: str) -> "QueryFilter":
+        """
+        「列名 演算子 値」の形式の文字列を読み込む（例: 商品管理番号=abc-001 / クリック数>=10 / キャンペーン名~セール）
+
+        Raises:
+            ValueError: 演算子がない、または列名が空の場合
+        """
+        for index in range(len(expression)):
+            for operator in FILTER_OPERATORS:
+                if expression.startswith(operator, index):
+                    column = expression[:index].strip()
+                    if not column:
+                        raise ValueError(f"条件の列名がありません: {expression}")
+                    return cls(column, operator, expression[index + len(operator):])
+        raise ValueError(f"条件の形式が正しくありません（列名=値 の形式で指定してください）: {expression}")
+
+    def matches(self, cell: str) -> bool:
+        operator = self.operator
+        if operator in ("=", "!="):
+            found = cell.strip() in self.values
+            if not found and self.numbers:
+                number = parse_number(cell)
+                found = number is not None and number in self.numbers
+            return found if operator == "=" else not found
+        if operator == "~":
+            return self.value in cell
+
+        left: Optional[Union[Number, date]]
+        right: Union[Number, date]
+        if self.number is not None:
+            left, right = parse_number(cell), self.number
+        else:
+            left, right = _parse_date(cell), self.date
+        if left is None:
+            return False
+        if operator == ">":
+            return left > right
+        if operator == ">=":
+            return left >= right
+        if operator == "<":
+            return left < right
+        return left <= right
+
+    def __str__(self) -> str:
+        return f"{self.column}{self.operator}{self.value}"
+
+
+class ReportQuery:
+    """
+    レポートに対するクエリ
+
+    Args:
+        columns: 出力する列（指定しない場合はすべての列）
+        filters: 行の条件（すべてを満たす行のみを使う）
+        group_by: グループにする列。指定した場合は、グループの列・合計する列・件数を出力する
+        sums: 合計する列。group_by を指定しない場合は全体の合計を1行で出力する
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str] = (),
+        filters: Sequence[QueryFilter] = (),
+        group_by: Sequence[str] = (),
+        sums: Sequence[str] = ()
+    ):
+        if columns and (group_by or sums):
+            raise ValueError("columns は group_by / sum と同時に指定できません")
+        self.columns = list(columns)
+        self.filters = list(filters)
+        self.group_by = list(group_by)
+        self.sums = list(sums)
+
+    @classmethod
+    def from_params(
+        cls,
+        columns: Optional[str] = None,
+        where: Optional[Sequence[str]] = None,
+        group_by: Optional[str] = None,
+        sums: Optional[str] = None
+    ) -> Optional["ReportQuery"]:
+        """
+        クエリパラメータ（列はカンマ区切り、条件は繰り返し指定）からクエリを作る
+
+        Returns:
+            Optional[ReportQuery]: いずれも指定されていない場合はNone
+
+        Raises:
+            ValueError: 条件の形式が正しくない、または同時に指定できないパラメータがある場合
+        """
+        query = cls(
+            columns=_split_columns(columns),
+            filters=[QueryFilter.parse(w) for w in (where or []) if w.strip()],
+            group_by=_split_columns(group_by),
+            sums=_split_columns(sums)
+        )
+        return None if query.is_empty else query
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.columns or self.filters or self.group_by or self.sums)
+
+    @property
+    def is_aggregate(self) -> bool:
+        return bool(self.group_by or self.sums)
+
+    def fingerprint(self) -> str:
+        """クエリの内容を表す短いハッシュ（ETagの区別に使う）"""
+        spec = {
+            "columns": self.columns,
+            "filters": [str(f) for f in self.filters],
+            "group_by": self.group_by,
+            "sums": self.sums,
+        }
+        return hashlib.sha256(json.dumps(spec, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+    def describe(self) -> str:
+        parts = []
+        if self.columns:
+            parts.append(f"columns={','.join(self.columns)}")
+        parts.extend(f"where={f}" for f in self.filters)
+        if self.group_by:
+            parts.append(f"group_by={','.join(self.group_by)}")
+        if self.sums:
+            parts.append(f"sum={','.join(self.sums)}")
+        return " ".join(parts)
+
+
+class QueryCursor:
+    """
+    ヘッダー行を読み込み、クエリの列がレポートにあることを確認した状態
+    iter_csv() で結果のCSVを返す
+
+    Raises:
+        ValueError: クエリの列がレポートにない場合
+    """
+
+    def __init__(self, src: BinaryIO, query: ReportQuery):
+        self.query = query
+        self._src = src
+        self._text = io.TextIOWrapper(src, encoding="utf-8", newline="")
+        self._reader = csv.reader(self._text)
+        self.header = next(self._reader, None) or []
+        if not self.header:
+            # データがない場合は、列を確認せずに空の結果を返す
+            self._index = {}
+            return
+        self._index = {name: index for index, name in reversed(list(enumerate(self.header)))}
+        missing = [
+            c for c in [*query.columns, *(f.column for f in query.filters), *query.group_by, *query.sums]
+            if c not in self._index
+        ]
+        if missing:
+            raise ValueError(f"レポートにない列が指定されました: {', '.join(dict.fromkeys(missing))}")
+
+    def close(self) -> None:
+        self._text.close()
+
+    def _filtered_rows(self) -> Iterator[List[str]]:
+        filters = [(self._index[f.column], f) for f in self.query.filters]
+        width = len(self.header)
+        for row in self._reader:
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            if all(f.matches(row[index]) for index, f in filters):
+                yield row
+
+    def output_header(self) -> List[str]:
+        query = self.query
+        if query.is_aggregate:
+            return [*query.group_by, *query.sums, COUNT_COLUMN]
+        return list(query.columns) or list(self.header)
+
+    def _iter_rows(self) -> Iterator[Sequence[object]]:
+        query = self.query
+        if not query.is_aggregate:
+            indexes = [self._index[c] for c in query.columns] if query.columns else None
+            for row in self._filtered_rows():
+                yield [row[i] for i in indexes] if indexes is not None else row
+            return
+
+        key_indexes = [self._index[c] for c in query.group_by]
+        sum_indexes = [self._index[c] for c in query.sums]
+        groups: Dict[Tuple[str, ...], List[Number]] = {}
+        for row in self._filtered_rows():
+            key = tuple(row[i].strip() for i in key_indexes)
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = [0] * (len(sum_indexes) + 1)
+            for position, index in enumerate(sum_indexes):
+                number = parse_number(row[index])
+                if number is not None:
+                    totals[position] += number
+            totals[-1] += 1
+        if not query.group_by and not groups:
+            # 全体の合計は、条件に一致する行がなくても0の行を返す
+            groups[()] = [0] * (len(sum_indexes) + 1)
+        for key, totals in groups.items():
+            yield [*key, *(_format_number(t) for t in totals)]
+
+    def iter_csv(self) -> Iterator[bytes]:
+        """結果をUTF-8のCSVとして一定行数ずつ返す（最後に読み込み元を閉じる）"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        try:
+            if not self.header:
+                return
+            writer.writerow(self.output_header())
+            pending = 0
+            for row in self._iter_rows():
+                writer.writerow(row)
+                pending += 1
+                if pending >= FLUSH_ROWS:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+                    pending = 0
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        finally:
+            self.close()
+
+
+def _format_number(value: Number) -> str:
+    if isinstance(value, float):
+        # 浮動小数点の誤差（0.30000000000000004 など）を出力しない
+        return repr(round(value, 6))
+    return str(value)
@@ -0,0 +1,124 @@
+"""
+期間レポートの補助処理
+期間の分割、および変換済みCSVの結合・日別分割を行う
+"""
+import csv
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple
+
+# 日別に分割する際に日付列とみなす列名（先頭から順に探す）
+DATE_COLUMN_CANDIDATES = ("日付", "集計日", "日", "date", "Date")
+
+_DATE_PATTERNS = ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d", "%Y年%m月%d日")
+
+
+def iter_date_chunks(start_date: date, end_date: date, max_days: int) -> Iterator[Tuple[date, date]]:
+    """
+    期間を最大 max_days 日ずつの区間に分割する
+
+    Yields:
+        Tuple[date, date]: 区間の開始日と終了日（両端を含む）
+    """
+    max_days = max(1, max_days)
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=max_days - 1), end_date)
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def merge_csv_files(sources: List[BinaryIO], dst_path: str) -> int:
+    """
+    区間ごとに取得したCSVを1つのファイルにまとめる（行単位で書き込むためメモリ使用量は一定）
+    2つ目以降のヘッダー行は、1つ目と同じであれば取り除く
+
+    Args:
+        sources: 区間ごとの変換済みCSV（バイナリモードで開いたファイル。閉じるのは呼び出し元）
+        dst_path: 書き込み先
+
+    Returns:
+        int: 書き込んだバイト数
+    """
+    header: Optional[bytes] = None
+    with open(dst_path, "wb") as dst:
+        for src in sources:
+            first_line = src.readline()
+            if not first_line:
+                continue
+            if not first_line.endswith(b"\n"):
+                first_line += b"\n"
+            if header is None:
+                header = first_line
+                dst.write(first_line)
+            elif first_line != header:
+                dst.write(first_line)
+            last = first_line
+            for line in src:
+                dst.write(line)
+                last = line
+            if not last.endswith(b"\n"):
+                dst.write(b"\n")
+        return dst.tell()
+
+
+def parse_report_date(value: str) -> Optional[date]:
+    """レポートの日付の表記（2024-01-01 / 2024/01/01(月) / 2024年1月1日 など）を日付に変換する"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    # 「2024/01/01(月)」のような曜日付きの表記にも対応する
+    value = re.sub(r"[\(（].*$", "", value).strip()
+    for pattern in _DATE_PATTERNS:
+        try:
+            return datetime.strptime(value, pattern).date()
+        except ValueError:
+            continue
+    return None
+
+
+def split_csv_file(src_path: str, out_dir: str) -> Dict[date, str]:
+    """
+    変換済み（UTF-8）のCSVファイルを日付列の値ごとのファイルに分割する
+
+    Returns:
+        Dict[date, str]: 日付ごとのCSVファイルのパス（各ファイルにヘッダー行を付ける）
+
+    Raises:
+        ValueError: 日付列が見つからない場合
+    """
+    with open(src_path, "r", encoding="utf-8", newline="") as src:
+        reader = csv.reader(src)
+        header = next(reader, None)
+        if not header:
+            return {}
+        date_index = next(
+            (header.index(name) for name in DATE_COLUMN_CANDIDATES if name in header),
+            None
+        )
+        if date_index is None:
+            raise ValueError(
+                "レポートに日付列が見つからないため日別に分割できません。split=false を指定してください。"
+            )
+
+        paths: Dict[date, str] = {}
+        files: Dict[date, TextIO] = {}
+        writers: Dict[date, Any] = {}
+        try:
+            for row in reader:
+                if len(row) <= date_index:
+                    continue
+                row_date = parse_report_date(row[date_index])
+                if row_date is None:
+                    continue
+                if row_date not in writers:
+                    paths[row_date] = os.path.join(out_dir, f"{row_date.isoformat()}.csv")
+                    files[row_date] = open(paths[row_date], "w", encoding="utf-8", newline="")
+                    writers[row_date] = csv.writer(files[row_date], lineterminator="\n")
+                    writers[row_date].writerow(header)
+                writers[row_date].writerow(row)
+        finally:
+            for f in files.values():
+                f.close()
+    return {d: paths[d] for d in sorted(paths)}
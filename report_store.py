@@ -0,0 +1,354 @@
+"""
+レポートの蓄積
+取得した変換済みCSVをSQLiteに取り込み、過去の日付をまたいだ検索・集計に使う
+
+レポート種別ごとに1つのテーブル（report_<スラッグ>）に、日付（report_date）と行番号を付けて保存する。
+列は report_format と同じ規則で数値・日付（ISO形式）に型付けし、日付と商品・キャンペーンの列に索引を作る。
+同じ種別・日付を取り込み直すと、その日付の行はすべて置き換わる（内容が同じ場合は何もしない）。
+"""
+import csv
+import hashlib
+import io
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from report_cache import file_sha256
+from report_format import infer_column_types, iter_column_batches, parse_number
+from report_query import COUNT_COLUMN, QueryFilter, ReportQuery
+from report_range import parse_report_date
+
+logger = logging.getLogger(__name__)
+
+# レポートの日付の列名（すべてのテーブルに付ける）
+DATE_COLUMN = "report_date"
+
+# 索引を作る列（商品・キャンペーンなど、絞り込みやグループに使う列）
+KEY_COLUMNS = (
+    "商品管理番号",
+    "商品番号",
+    "商品ID",
+    "キャンペーン名",
+    "キャンペーンID",
+    "クーポンコード",
+    "広告ID",
+)
+
+# 1回に書き込む行数
+INSERT_BATCH_ROWS = 5000
+
+# この行数ごとに出力する
+FLUSH_ROWS = 2000
+
+# 対象データがない日付（空のCSV）として記録するハッシュ
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_ingests (
+    report_slug TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    sha256 TEXT,
+    ingested_at REAL NOT NULL,
+    PRIMARY KEY (report_slug, report_date)
+);
+"""
+
+
+def _quote(name: str) -> str:
+    """SQLの識別子として引用する（列名は日本語・記号を含む）"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_name(report_slug: str) -> str:
+    """レポート種別のテーブル名"""
+    return "report_" + re.sub(r"[^0-9a-z_]", "_", report_slug.lower())
+
+
+def _date_text(value: Optional[date]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+class ReportStore:
+    """
+    取得したレポートを蓄積するSQLiteストア（WALモード。検索は取り込み中でも読み取り専用の接続で行う）
+
+    Args:
+        db_path: データベースファイルのパス
+        max_rows: 検索結果として返す最大行数
+    """
+
+    def __init__(self, db_path: str, max_rows: int = 100000):
+        self.db_path = Path(db_path)
+        self.max_rows = max_rows
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _table_columns(self, table: str) -> List[str]:
+        return [row["name"] for row in self._conn.execute(f"PRAGMA table_info({_quote(table)})")]
+
+    def _ensure_table(self, table: str, names: Sequence[str]) -> None:
+        """テーブルを作成し、ない列を追加する（ポータル側で列が増えても取り込めるようにする）"""
+        existing = self._table_columns(table)
+        if not existing:
+            self._conn.execute(
+                f"CREATE TABLE {_quote(table)} ({_quote(DATE_COLUMN)} TEXT NOT NULL, row_no INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{table}_date')} ON {_quote(table)} ({_quote(DATE_COLUMN)}, row_no)"
+            )
+            existing = [DATE_COLUMN, "row_no"]
+        for name in names:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(name)}")
+                existing.append(name)
+        for position, name in enumerate(KEY_COLUMNS):
+            if name in existing:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{table}_key{position}')} "
+                    f"ON {_quote(table)} ({_quote(name)}, {_quote(DATE_COLUMN)})"
+                )
+
+    def ingest(self, report_slug: str, report_date: date, csv_path: Optional[str]) -> int:
+        """
+        変換済みCSVを取り込む（その種別・日付の行はすべて置き換える）
+        csv_path が None の場合は対象データがないものとして、その日付の行を削除する
+        前回と内容が同じ場合は書き込まない
+
+        Returns:
+            int: 取り込んだ行数
+        """
+        date_text = report_date.isoformat()
+        if csv_path is None:
+            sha256 = EMPTY_SHA256
+        else:
+            with open(csv_path, "rb") as f:
+                sha256 = file_sha256(f)
+        with self._lock:
+            current = self._conn.execute(
+                "SELECT row_count, sha256 FROM report_ingests WHERE report_slug = ? AND report_date = ?",
+                (report_slug, date_text)
+            ).fetchone()
+        if current is not None and current["sha256"] == sha256:
+            return current["row_count"]
+
+        names, types = infer_column_types(csv_path) if csv_path is not None else ([], [])
+        # 日付の列名と重なる列は別名にする
+        names = [f"{name}_" if name in (DATE_COLUMN, "row_no") else name for name in names]
+        table = table_name(report_slug)
+        started = time.monotonic()
+        rows = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 対象データがない日付のためにテーブルは作らない
+                if names:
+                    self._ensure_table(table, names)
+                if names or self._table_columns(table):
+                    self._conn.execute(f"DELETE FROM {_quote(table)} WHERE {_quote(DATE_COLUMN)} = ?", (date_text,))
+                if names:
+                    insert = (
+                        f"INSERT INTO {_quote(table)} ({_quote(DATE_COLUMN)}, row_no, {', '.join(_quote(n) for n in names)}) "
+                        f"VALUES (?, ?, {', '.join('?' for _ in names)})"
+                    )
+                    for columns in iter_column_batches(csv_path, types, batch_rows=INSERT_BATCH_ROWS, json_dates=True):
+                        batch = [
+                            (date_text, rows + index, *values)
+                            for index, values in enumerate(zip(*columns))
+                        ]
+                        self._conn.executemany(insert, batch)
+                        rows += len(batch)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO report_ingests (report_slug, report_date, row_count, sha256, ingested_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (report_slug, date_text, rows, sha256, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(
+            f"レポートを蓄積しました: {report_slug} {date_text} ({rows}行, {time.monotonic() - started:.2f}秒)"
+        )
+        return rows
+
+    def list_ingests(self, report_slug: Optional[str] = None) -> List[Dict[str, Any]]:
+        """取り込み済みの種別・日付の一覧"""
+        sql = "SELECT * FROM report_ingests"
+        params: Tuple[Any, ...] = ()
+        if report_slug is not None:
+            sql += " WHERE report_slug = ?"
+            params = (report_slug,)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY report_slug, report_date", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT report_slug, COUNT(*) AS dates, SUM(row_count) AS rows, "
+                "MIN(report_date) AS first_date, MAX(report_date) AS last_date "
+                "FROM report_ingests GROUP BY report_slug ORDER BY report_slug"
+            ).fetchall()
+        return {
+            "db_path": str(self.db_path),
+            "report_types": {row["report_slug"]: {k: row[k] for k in ("dates", "rows", "first_date", "last_date")} for row in rows},
+        }
+
+    def open_query(
+        self,
+        report_slug: str,
+        query: Optional[ReportQuery],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        limit: Optional[int] = None
+    ) -> "StoreCursor":
+        """
+        蓄積したレポートを検索する（読み取り専用の接続を開き、結果は StoreCursor.iter_csv() で返す）
+
+        Raises:
+            LookupError: その種別のレポートが蓄積されていない場合
+            ValueError: 蓄積したレポートにない列が指定された場合
+        """
+        table = table_name(report_slug)
+        with self._lock:
+            columns = self._table_columns(table)
+        if not columns:
+            raise LookupError(f"蓄積されたレポートがありません: {report_slug}")
+        limit = min(limit, self.max_rows) if limit is not None else self.max_rows
+        sql, params, header = build_select(table, columns, query or ReportQuery(), start, end, limit)
+        conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            cursor = conn.execute(sql, params)
+        except BaseException:
+            conn.close()
+            raise
+        return StoreCursor(conn, cursor, header)
+
+
+class StoreCursor:
+    """検索結果（iter_csv() で結果のCSVを返し、最後に接続を閉じる）"""
+
+    def __init__(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, header: List[str]):
+        self._conn = conn
+        self._cursor = cursor
+        self.header = header
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def iter_csv(self) -> Iterator[bytes]:
+        """結果をUTF-8のCSVとして一定行数ずつ返す"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        try:
+            writer.writerow(self.header)
+            while True:
+                rows = self._cursor.fetchmany(FLUSH_ROWS)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        finally:
+            self.close()
+
+
+def _filter_sql(column: str, condition: QueryFilter) -> Tuple[str, List[Any]]:
+    """
+    行の条件をSQLにする（report_query と同じ意味になるようにする）
+    数値は数値として、日付はISO形式の文字列として保存しているため、値も同じ形にして比べる
+    """
+    operator = condition.operator
+    if operator in ("=", "!="):
+        params: List[Any] = []
+        for value in condition.values:
+            params.append(value)
+            number = parse_number(value)
+            if number is not None:
+                params.append(number)
+            parsed = parse_report_date(value)
+            if parsed is not None:
+                params.append(parsed.isoformat())
+        placeholders = ", ".join("?" for _ in params)
+        if operator == "=":
+            return f"{column} IN ({placeholders})", params
+        return f"({column} IS NULL OR {column} NOT IN ({placeholders}))", params
+    if operator == "~":
+        return f"instr(CAST({column} AS TEXT), ?) > 0", [condition.value]
+    if condition.number is not None:
+        return f"(typeof({column}) IN ('integer', 'real') AND {column} {operator} ?)", [condition.number]
+    return f"(typeof({column}) = 'text' AND {column} {operator} ?)", [condition.date.isoformat()]
+
+
+def build_select(
+    table: str,
+    columns: Sequence[str],
+    query: ReportQuery,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: Optional[int] = None
+) -> Tuple[str, List[Any], List[str]]:
+    """
+    クエリをSQLにする
+
+    Returns:
+        Tuple[str, List[Any], List[str]]: SQL、パラメータ、結果の列名
+
+    Raises:
+        ValueError: テーブルにない列が指定された場合
+    """
+    available = [c for c in columns if c != "row_no"]
+    referenced = [*query.columns, *(f.column for f in query.filters), *query.group_by, *query.sums]
+    missing = [c for c in referenced if c not in available]
+    if missing:
+        raise ValueError(f"蓄積したレポートにない列が指定されました: {', '.join(dict.fromkeys(missing))}")
+
+    conditions: List[str] = []
+    params: List[Any] = []
+    if start is not None:
+        conditions.append(f"{_quote(DATE_COLUMN)} >= ?")
+        params.append(_date_text(start))
+    if end is not None:
+        conditions.append(f"{_quote(DATE_COLUMN)} <= ?")
+        params.append(_date_text(end))
+    for condition in query.filters:
+        sql, values = _filter_sql(_quote(condition.column), condition)
+        conditions.append(sql)
+        params.extend(values)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if query.is_aggregate:
+        keys = [_quote(c) for c in query.group_by]
+        selected = [*keys, *(f"COALESCE(SUM({_quote(c)}), 0)" for c in query.sums), "COUNT(*)"]
+        header = [*query.group_by, *query.sums, COUNT_COLUMN]
+        sql = f"SELECT {', '.join(selected)} FROM {_quote(table)}{where}"
+        if keys:
+            sql += f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+    else:
+        header = list(query.columns) or available
+        sql = (
+            f"SELECT {', '.join(_quote(c) for c in header)} FROM {_quote(table)}{where} "
+            f"ORDER BY {_quote(DATE_COLUMN)}, row_no"
+        )
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params, header
@@ -0,0 +1,148 @@
+"""
+リソースポリシー
+RMS・広告管理画面の読み込み時に、レポート取得に不要な画像・動画・フォント・計測タグを読み込まないようにする
+
+コンテキスト全体の基本ポリシーは context.route で設定し、レポート種別ごとの許可リストは
+page.route で上書きする（ページのルートはコンテキストのルートより先に評価される）。
+"""
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# off: 何もしない / standard: 画像・動画・フォント・計測タグを遮断 / strict: 許可したホストの文書・スクリプト・XHRのみ通す
+RESOURCE_POLICY_MODES = ("off", "standard", "strict")
+
+BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+
+# strictで通すリソース種別
+STRICT_ALLOWED_RESOURCE_TYPES = ("document", "script", "xhr", "fetch", "stylesheet")
+
+# 計測・広告タグのホスト（サフィックス一致）
+DEFAULT_BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "facebook.net",
+    "ads-twitter.com",
+    "criteo.com",
+    "criteo.net",
+    "adobedtm.com",
+    "omtrdc.net",
+    "demdex.net",
+    "rat.rakuten.co.jp",
+    "nr-data.net",
+    "newrelic.com",
+)
+
+# strictで通すホスト（サフィックス一致）
+DEFAULT_ALLOWED_HOSTS = ("rakuten.co.jp", "rakuten.com", "r10s.jp")
+
+
+def _host_matches(host: str, suffixes: Iterable[str]) -> bool:
+    return any(host == suffix or host.endswith("." + suffix) for suffix in suffixes)
+
+
+class ResourcePolicy:
+    """
+    ブラウザコンテキストに設定するリソースの遮断ルール
+
+    Args:
+        mode (str): off / standard / strict
+        blocked_hosts (Iterable[str]): 遮断するホスト（サフィックス一致）
+        allowed_hosts (Iterable[str]): strictで通すホスト（サフィックス一致）
+    """
+
+    def __init__(
+        self,
+        mode: str = "standard",
+        blocked_hosts: Iterable[str] = DEFAULT_BLOCKED_HOSTS,
+        allowed_hosts: Iterable[str] = DEFAULT_ALLOWED_HOSTS
+    ):
+        if mode not in RESOURCE_POLICY_MODES:
+            raise ValueError(f"無効なリソースポリシーです: {mode}. 利用可能: {', '.join(RESOURCE_POLICY_MODES)}")
+        self.mode = mode
+        self.blocked_hosts = tuple(h.strip().lower() for h in blocked_hosts if h.strip())
+        self.allowed_hosts = tuple(h.strip().lower() for h in allowed_hosts if h.strip())
+        self._stats: Dict[str, Any] = {
+            "allowed_total": 0,
+            "blocked_total": 0,
+            "blocked_by_type": {},
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def is_allowed(self, url: str, resource_type: str) -> bool:
+        """リクエストを通すかどうか"""
+        if not self.enabled:
+            return True
+        if url.startswith(("data:", "blob:", "about:")):
+            return True
+        host = (urlparse(url).hostname or "").lower()
+        if _host_matches(host, self.blocked_hosts):
+            return False
+        if resource_type in BLOCKED_RESOURCE_TYPES:
+            return False
+        if self.mode == "strict":
+            return resource_type in STRICT_ALLOWED_RESOURCE_TYPES and _host_matches(host, self.allowed_hosts)
+        return True
+
+    def _record(self, allowed: bool, resource_type: str) -> None:
+        if allowed:
+            self._stats["allowed_total"] += 1
+            return
+        self._stats["blocked_total"] += 1
+        by_type = self._stats["blocked_by_type"]
+        by_type[resource_type] = by_type.get(resource_type, 0) + 1
+
+    async def _handle(self, route, request) -> None:
+        allowed = self.is_allowed(request.url, request.resource_type)
+        self._record(allowed, request.resource_type)
+        try:
+            if allowed:
+                await route.continue_()
+            else:
+                await route.abort("blockedbyclient")
+        except Exception as e:
+            # ページを閉じた後のリクエストなどは無視する
+            logger.debug(f"リソースポリシーの適用に失敗しました: {request.url}, エラー: {str(e)}")
+
+    async def install(self, context) -> None:
+        """コンテキスト全体に基本ポリシーを設定する"""
+        if self.enabled:
+            await context.route("**/*", self._handle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "allowed_total": self._stats["allowed_total"],
+            "blocked_total": self._stats["blocked_total"],
+            "blocked_by_type": dict(self._stats["blocked_by_type"]),
+        }
+
+
+async def install_page_allowlist(page, patterns: Optional[List[str]]) -> None:
+    """
+    レポート種別ごとの許可リスト（URLの正規表現）に一致するリクエストを、基本ポリシーに関わらず通す
+    一致しないリクエストはコンテキストの基本ポリシーに委ねる
+    """
+    if not patterns:
+        return
+    compiled = [re.compile(p) for p in patterns]
+
+    async def _handle(route, request) -> None:
+        try:
+            if any(p.search(request.url) for p in compiled):
+                await route.continue_()
+            else:
+                await route.fallback()
+        except Exception as e:
+            logger.debug(f"許可リストの適用に失敗しました: {request.url}, エラー: {str(e)}")
+
+    await page.route("**/*", _handle)
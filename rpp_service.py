@@ -5,18 +5,140 @@ RPPレポート取得サービス
 import asyncio
 import logging
 import os
+import re
 import shutil
 import time
-import zipfile
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import unquote, urljoin, urlparse
 
+import httpx
 from playwright.async_api import TimeoutError as PlaywrightTimeoutError
-from playwright.async_api import async_playwright
+
+import metrics
+from browser_pool import BrowserPool, BrowserPoolTimeoutError, CONTEXT_OPTIONS
+from download_history import (
+    DEFAULT_HISTORY_URL_PATTERN,
+    HistoryStatus,
+    is_requested_row,
+    parse_created_at,
+    parse_history_payload,
+    parse_period
+)
+from resource_policy import install_page_allowlist
+from session_store import SessionStateStore
 
 logger = logging.getLogger(__name__)
 
+# 処理フェーズの通知先（ジョブの進捗表示などに使う）
+PhaseCallback = Callable[[str], None]
+
+# ポータルのURL（ローカルの模擬サーバー benchmarks/mock_rms.py に向ける場合などに環境変数で変更する）
+RMS_LOGIN_URL = os.getenv("RMS_LOGIN_URL", "https://glogin.rms.rakuten.co.jp/")
+RMS_MAINMENU_URL = os.getenv("RMS_MAINMENU_URL", "https://mainmenu.rms.rakuten.co.jp/")
+RMS_AD_BASE_URL = os.getenv("RMS_AD_BASE_URL", "https://ad.rms.rakuten.co.jp").rstrip("/")
+
+# ダウンロード履歴はアカウント単位で共有され、完了判定は最新行（1行目）で行うため、
+# 同じ種別のレポート作成〜ダウンロードはプロセス内で1つずつ実行する
+_history_locks: Dict[str, asyncio.Lock] = {}
+
+# ダウンロード履歴の確認間隔。最初は短く、待つほど長くする（秒）
+HISTORY_POLL_INITIAL_SECONDS = 0.5
+HISTORY_POLL_MAX_SECONDS = 5.0
+HISTORY_POLL_BACKOFF = 1.5
+
+# 更新ボタンを押し、履歴テーブルの変化（DOMの変更）を待つスクリプト
+# 変化が落ち着いた時点、または timeoutMs 経過で resolve する（変化があれば true）
+_HISTORY_REFRESH_AND_WAIT_JS = """
+(timeoutMs) => new Promise((resolve) => {
+    const target = document.querySelector('table.table tbody') || document.querySelector('table.table') || document.body;
+    let quietTimer = null;
+    let changed = false;
+    const finish = () => {
+        observer.disconnect();
+        clearTimeout(deadline);
+        clearTimeout(quietTimer);
+        resolve(changed);
+    };
+    const observer = new MutationObserver(() => {
+        changed = true;
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(finish, 100);
+    });
+    observer.observe(target, { childList: true, subtree: true, characterData: true });
+    const deadline = setTimeout(finish, timeoutMs);
+    const refreshButton = document.querySelector('#btnDownloadHistoryRefresh');
+    if (refreshButton) {
+        refreshButton.click();
+    }
+})
+"""
+
+# 履歴の更新ボタンを押すだけのスクリプト（結果は履歴APIのレスポンスから読む）
+_HISTORY_REFRESH_JS = """
+() => {
+    const refreshButton = document.querySelector('#btnDownloadHistoryRefresh');
+    if (refreshButton) {
+        refreshButton.click();
+    }
+}
+"""
+
+# 更新ボタンを押してから履歴APIのレスポンスを待つ最大ミリ秒
+HISTORY_RESPONSE_TIMEOUT_MS = 10000
+
+# ダウンロードボタンを押してから最初に履歴を確認するまでの秒数（ポータルが新しい行を追加するのを待つ）
+HISTORY_FIRST_CHECK_SECONDS = 4.0
+
+# 履歴APIで完了を確認できない読み取りがこの回数続いた場合は、画面（DOM）から状態を読む
+HISTORY_API_MAX_PENDING_READS = 8
+
+# 完了したレポートをブラウザのダウンロードを使わずにHTTPで直接取得する
+DIRECT_DOWNLOAD_ENABLED = os.getenv("REPORT_DIRECT_DOWNLOAD", "true").lower() == "true"
+DIRECT_DOWNLOAD_TIMEOUT = float(os.getenv("REPORT_DIRECT_DOWNLOAD_TIMEOUT", "120"))
+DIRECT_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DIRECT_DOWNLOAD_MAX_REDIRECTS = 5
+
+# 直接ダウンロードに使うHTTPクライアント（接続をプロセス内で使い回す）
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _notify_phase(on_phase: Optional[PhaseCallback], phase: str) -> None:
+    if on_phase is None:
+        return
+    try:
+        on_phase(phase)
+    except Exception as e:
+        logger.warning(f"フェーズ通知の処理に失敗しました（{phase}）: {str(e)}")
+
+
+async def take_screenshot(page, path) -> None:
+    """調査用のスクリーンショットを保存する（枚数はメトリクスに記録する）"""
+    metrics.SCREENSHOTS.inc()
+    await page.screenshot(path=path)
+
+
+def record_timeout(report_slug: str, error: BaseException) -> None:
+    """タイムアウトによる失敗をメトリクスに記録する（タイムアウト以外は何もしない）"""
+    if isinstance(error, BrowserPoolTimeoutError):
+        kind = "browser_pool"
+    elif isinstance(error, PlaywrightTimeoutError):
+        kind = "playwright"
+    elif isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        kind = "report_wait"
+    else:
+        return
+    metrics.REPORT_TIMEOUTS.inc(report_slug, kind)
+
+
+def _history_lock(report_slug: str) -> asyncio.Lock:
+    lock = _history_locks.get(report_slug)
+    if lock is None:
+        lock = _history_locks[report_slug] = asyncio.Lock()
+    return lock
+
 REPORT_TYPES: Dict[str, Dict[str, str]] = {
     "rpp": {
         "slug": "rpp",
@@ -90,6 +212,12 @@ REPORT_TYPES: Dict[str, Dict[str, str]] = {
 }
 
 
+def _mainmenu_link_fragment() -> str:
+    """ログイン後の画面でメインメニューへのリンクを探すためのURLの一部（ホスト + パス）"""
+    parsed = urlparse(RMS_MAINMENU_URL)
+    return f"{parsed.netloc}{parsed.path}".rstrip("/")
+
+
 async def login_to_rms(
     page,
     rms_creds: dict,
@@ -123,7 +251,7 @@ async def login_to_rms(
         current_url = page.url
         logger.info(f"現在のURL: {current_url}")
         
-        await page.goto("https://glogin.rms.rakuten.co.jp/", timeout=90000)
+        await page.goto(RMS_LOGIN_URL, timeout=90000)
         logger.info("RMSログインページへの移動が完了しました")
         logger.info(f"遷移後のURL: {page.url}")
         
@@ -170,7 +298,7 @@ async def login_to_rms(
             logger.info("確認画面（次へボタン）はスキップされました。")
         
         # RMSメインメニューに移動
-        rms_link_selector = 'a[href*="mainmenu.rms.rakuten.co.jp"]'
+        rms_link_selector = f'a[href*="{_mainmenu_link_fragment()}"]'
         logger.info(f"RMSメインメニューリンク ({rms_link_selector}) をクリックします...")
         try:
             await page.locator(rms_link_selector).wait_for(state="visible", timeout=60000)
@@ -182,7 +310,7 @@ async def login_to_rms(
         except Exception as e:
             logger.error("RMSメインメニューリンクが見つかりません。")
             if screenshot_dir:
-                await page.screenshot(path=screenshot_dir / f"error_rms_link_not_found_{int(time.time())}.png")
+                await take_screenshot(page, screenshot_dir / f"error_rms_link_not_found_{int(time.time())}.png")
             raise
 
         # RMS利用規約同意（表示されない場合があるため任意扱い）
@@ -230,7 +358,7 @@ async def login_to_rms(
         except Exception as e:
             logger.warning(f"確認画面の処理中にエラーが発生しましたが、処理を続行します: {str(e)}")
             if screenshot_dir:
-                await page.screenshot(path=screenshot_dir / f"warning_confirm_screen_{int(time.time())}.png")
+                await take_screenshot(page, screenshot_dir / f"warning_confirm_screen_{int(time.time())}.png")
 
         logger.info("ログイン処理が正常に完了しました")
 
@@ -238,10 +366,62 @@ async def login_to_rms(
         logger.error(f"RMSログイン中にエラーが発生しました: {str(e)}")
         logger.error(f"エラーの詳細:\n{traceback.format_exc()}")
         if screenshot_dir:
-            await page.screenshot(path=screenshot_dir / f"error_login_{int(time.time())}.png")
+            await take_screenshot(page, screenshot_dir / f"error_login_{int(time.time())}.png")
         raise
 
 
+async def is_session_active(context) -> bool:
+    """
+    コンテキストのCookieでRMSにログイン済みかを軽量に確認する
+
+    ページを描画せず、APIRequestContextでメインメニューを取得し、
+    ログイン画面へリダイレクトされないかどうかで判定する。
+    """
+    try:
+        response = await context.request.get(RMS_MAINMENU_URL, timeout=15000)
+        final_url = response.url or ""
+        active = (
+            response.ok
+            and not final_url.startswith(RMS_LOGIN_URL)
+            and "glogin" not in final_url
+            and "login.account.rakuten.com" not in final_url
+        )
+        logger.info(f"ログイン状態の確認: {'ログイン済み' if active else '未ログイン'} ({response.status} {final_url})")
+        return active
+    except Exception as e:
+        logger.warning(f"ログイン状態の確認に失敗しました: {str(e)}")
+        return False
+
+
+async def ensure_logged_in(
+    lease,
+    page,
+    rms_creds: dict,
+    rakuten_creds: dict,
+    screenshot_dir: Optional[Path] = None
+) -> None:
+    """
+    貸し出されたブラウザがログイン済みの状態になるようにする
+
+    ログイン済みならそのまま、保存済みセッションから復元した場合や長時間未使用の場合は
+    ログイン状態を確認し、無効ならフルログインを行ってセッションを保存する。
+    """
+    if lease.logged_in and not lease.needs_probe:
+        logger.info("ログイン済みのブラウザコンテキストを再利用します")
+        return
+
+    if lease.needs_probe:
+        if await is_session_active(lease.context):
+            lease.mark_logged_in()
+            return
+        logger.info("保存済みセッションが無効なため、フルログインを行います")
+        lease.mark_logged_out()
+
+    await login_to_rms(page, rms_creds, rakuten_creds, screenshot_dir)
+    lease.mark_logged_in()
+    await lease.persist_session()
+
+
 def _resolve_report_type(report_type: str) -> Dict[str, str]:
     """
     指定されたレポート種別を正規化して返す
@@ -255,6 +435,59 @@ def _resolve_report_type(report_type: str) -> Dict[str, str]:
     return resolved
 
 
+def get_max_range_days(report_type: str) -> int:
+    """
+    ポータルで1回のレポートに指定できる最大日数を返す
+    REPORT_TYPESの max_range_days、なければ環境変数 REPORT_RANGE_MAX_DAYS（デフォルト: 31）
+    """
+    report_info = _resolve_report_type(report_type)
+    return int(report_info.get("max_range_days") or os.getenv("REPORT_RANGE_MAX_DAYS", "31"))
+
+
+def get_max_wait_seconds(report_type: str) -> float:
+    """
+    レポート作成の完了を待つ最大秒数を返す
+    環境変数 REPORT_MAX_WAIT_SECONDS_<スラッグ>、REPORT_TYPESの max_wait_seconds、
+    環境変数 REPORT_MAX_WAIT_SECONDS（デフォルト: 300）の順に使う
+    """
+    report_info = _resolve_report_type(report_type)
+    per_type = os.getenv(f"REPORT_MAX_WAIT_SECONDS_{report_info['slug'].upper()}")
+    return float(per_type or report_info.get("max_wait_seconds") or os.getenv("REPORT_MAX_WAIT_SECONDS", "300"))
+
+
+def get_resource_allowlist(report_type: str) -> List[str]:
+    """
+    リソースポリシーに関わらず読み込むURL（正規表現）のリストを返す
+    環境変数 RESOURCE_ALLOWLIST_<スラッグ>（カンマ区切り）、なければREPORT_TYPESの resource_allowlist
+    """
+    report_info = _resolve_report_type(report_type)
+    value = os.getenv(f"RESOURCE_ALLOWLIST_{report_info['slug'].upper()}")
+    if value is not None:
+        return [p.strip() for p in value.split(",") if p.strip()]
+    return list(report_info.get("resource_allowlist") or [])
+
+
+def get_report_slug(report_type: str) -> str:
+    """
+    レポート種別（エイリアス含む）をポータル上のスラッグに正規化する
+
+    Raises:
+        ValueError: サポートされていないレポート種別の場合
+    """
+    return _resolve_report_type(report_type)["slug"]
+
+
+def supports_date_range(report_type: str) -> bool:
+    """
+    期間を指定してレポートを作成できる種別（期間入力欄がある種別）かどうかを返す
+
+    Raises:
+        ValueError: サポートされていないレポート種別の場合
+    """
+    report_info = _resolve_report_type(report_type)
+    return bool(report_info.get("start_placeholder") and report_info.get("end_placeholder"))
+
+
 async def navigate_to_rpp_top(
     page,
     screenshot_dir: Optional[Path] = None,
@@ -284,7 +517,7 @@ async def navigate_to_rpp_top(
         
         # RPPトップページに移動
         logger.info(f"{report_info['label']}トップページに移動します...")
-        await page.goto(f"https://ad.rms.rakuten.co.jp/{base_slug}/top", timeout=30000)
+        await page.goto(f"{RMS_AD_BASE_URL}/{base_slug}/top", timeout=30000)
         await page.wait_for_load_state('networkidle', timeout=30000)
         await asyncio.sleep(2)
         
@@ -375,7 +608,7 @@ async def navigate_to_rpp_top(
                 if start_date_value != start_date_str or end_date_value != end_date_str:
                     logger.warning("日付が正しく設定されていません。")
                     if screenshot_dir:
-                        await page.screenshot(path=screenshot_dir / f"date_not_set_{int(time.time())}.png")
+                        await take_screenshot(page, screenshot_dir / f"date_not_set_{int(time.time())}.png")
                     raise ValueError("日付の設定に失敗しました。")
                 
                 logger.info("日付の設定が完了しました。")
@@ -474,7 +707,7 @@ async def navigate_to_rpp_top(
                     error_msg = "完了状態のダウンロードリンクがタイムアウトまでに見つかりませんでした。"
                     logger.error(error_msg)
                     if screenshot_dir:
-                        await page.screenshot(path=screenshot_dir / f"error_status_timeout_{int(time.time())}.png")
+                        await take_screenshot(page, screenshot_dir / f"error_status_timeout_{int(time.time())}.png")
                     raise TimeoutError(error_msg)
                 
                 logger.info(f"ダウンロード対象行: 1行目のリンクをクリックします。")
@@ -507,39 +740,159 @@ async def navigate_to_rpp_top(
                 except Exception as e:
                     logger.error(f"ダウンロードリンクのクリック中にエラーが発生しました: {str(e)}")
                     if screenshot_dir:
-                        await page.screenshot(path=screenshot_dir / f"error_download_link_click_{int(time.time())}.png")
+                        await take_screenshot(page, screenshot_dir / f"error_download_link_click_{int(time.time())}.png")
                     raise
             
             except Exception as e:
                 logger.error(f"レポートのダウンロード処理に失敗しました: {str(e)}")
                 if screenshot_dir:
-                    await page.screenshot(path=screenshot_dir / f"error_download_{int(time.time())}.png")
+                    await take_screenshot(page, screenshot_dir / f"error_download_{int(time.time())}.png")
                 raise
         
         except Exception as e:
             logger.error(f"ナビゲーションメニューの要素のクリックまたは日付入力に失敗しました: {str(e)}")
             if screenshot_dir:
-                await page.screenshot(path=screenshot_dir / f"error_nav_click_{int(time.time())}.png")
+                await take_screenshot(page, screenshot_dir / f"error_nav_click_{int(time.time())}.png")
             raise
         
     except Exception as e:
         logger.error(f"RPPトップページへの移動中にエラーが発生しました: {str(e)}")
         if screenshot_dir:
-            await page.screenshot(path=screenshot_dir / f"error_rpp_top_{int(time.time())}.png")
+            await take_screenshot(page, screenshot_dir / f"error_rpp_top_{int(time.time())}.png")
         raise
 
 
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DIRECT_DOWNLOAD_TIMEOUT, connect=10.0),
+            # リダイレクトはダウンロードごとに追い、Cookieは各リクエストのヘッダーだけで渡す
+            # （プロセス内で共有するため、レスポンスのCookieをクライアントに保存しない）
+            follow_redirects=False,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """直接ダウンロード用のHTTPクライアントを閉じる（アプリ終了時に呼ぶ）"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _download_filename(url: str, content_disposition: Optional[str], default_name: str) -> str:
+    """Content-Disposition、URLのパスの順にファイル名を決める（パス区切りは取り除く）"""
+    name = None
+    if content_disposition:
+        match = re.search(r"filename\*=(?:UTF-8'')?([^;]+)|filename=\"?([^\";]+)\"?", content_disposition, re.IGNORECASE)
+        if match:
+            name = unquote((match.group(1) or match.group(2)).strip())
+    if not name:
+        name = unquote(os.path.basename(urlparse(url).path))
+    name = os.path.basename(name.replace("\\", "/"))
+    return name or default_name
+
+
+def _is_html_response(content_type: Optional[str]) -> bool:
+    # セッション切れの場合はログイン画面（HTML）が返る
+    return "text/html" in (content_type or "").lower()
+
+
+async def _download_via_http(context, url: str, referer: Optional[str], download_path: Path, default_name: str) -> str:
+    """ブラウザコンテキストのCookieを付けてHTTPクライアントでストリーミング取得する"""
+    client = _get_http_client()
+    for _ in range(DIRECT_DOWNLOAD_MAX_REDIRECTS + 1):
+        # Cookieはリダイレクト先ごとに、このダウンロードのコンテキストから付け直す
+        cookies = await context.cookies(url)
+        headers = {
+            "User-Agent": CONTEXT_OPTIONS.get("user_agent", ""),
+            "Accept-Language": "ja-JP,ja;q=0.9",
+        }
+        if cookies:
+            headers["Cookie"] = "; ".join(f"{c['name']}={c['value']}" for c in cookies)
+        if referer:
+            headers["Referer"] = referer
+
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.is_redirect:
+                url = urljoin(str(response.url), response.headers["location"])
+                continue
+            response.raise_for_status()
+            if _is_html_response(response.headers.get("content-type")):
+                raise ValueError(f"レポートではなくHTMLが返されました: {response.url}")
+            file_path = download_path / _download_filename(
+                str(response.url), response.headers.get("content-disposition"), default_name
+            )
+            try:
+                with open(file_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(DIRECT_DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            except BaseException:
+                file_path.unlink(missing_ok=True)
+                raise
+        return str(file_path)
+    raise ValueError(f"リダイレクトが多すぎます: {url}")
+
+
+async def download_report_file(page, url: str, download_path: Path, default_name: str) -> Optional[str]:
+    """
+    完了したレポートをブラウザのダウンロード処理を使わずに、HTTPクライアントでストリーミング取得する
+
+    Returns:
+        Optional[str]: 保存したファイルのパス。失敗した場合はNone（呼び出し元はリンクのクリックで取得する）
+    """
+    try:
+        file_path = await _download_via_http(page.context, url, page.url, download_path, default_name)
+    except Exception as e:
+        logger.warning(f"レポートの直接ダウンロードに失敗しました: {str(e)}")
+        return None
+    logger.info(f"レポートを直接ダウンロードしました: {file_path}")
+    return file_path
+
+
+async def _refresh_history_via_api(page, url_pattern: "re.Pattern", timeout_ms: int) -> Optional[HistoryStatus]:
+    """
+    履歴の更新ボタンを押し、履歴APIのレスポンス（JSON）から最新行の状態を読み取る
+
+    Returns:
+        Optional[HistoryStatus]: レスポンスが来ない・解析できない場合はNone
+    """
+    def _is_history_response(response) -> bool:
+        return response.request.resource_type in ("xhr", "fetch") and bool(url_pattern.search(response.url))
+
+    try:
+        async with page.expect_response(_is_history_response, timeout=timeout_ms) as response_info:
+            await page.evaluate(_HISTORY_REFRESH_JS)
+        response = await response_info.value
+        payload = await response.json()
+    except Exception as e:
+        logger.info(f"履歴APIのレスポンスを取得できませんでした: {str(e)}")
+        return None
+    history = parse_history_payload(payload, base_url=response.url)
+    if history is None:
+        logger.info(f"履歴APIのレスポンスを解析できませんでした: {response.url}")
+    return history
+
+
 async def navigate_to_report_top(
     page,
     screenshot_dir: Optional[Path] = None,
     download_dir: str = "temp_downloads",
     target_date: Optional[date] = None,
-    report_type: str = "rpp"
+    report_type: str = "rpp",
+    end_date: Optional[date] = None,
+    on_phase: Optional[PhaseCallback] = None
 ) -> Optional[str]:
     """
     汎用: 指定種別のトップに遷移し、レポートをダウンロードする。
     RPP系以外はセレクタが不明なため、ダウンロード/履歴リンクは
     テキストベースのフォールバックで試行する。
+    end_dateを指定した場合は target_date から end_date までの期間で1回のレポートを作成する。
+    on_phaseには navigate / date_entry / waiting / downloading の各フェーズの開始が通知される。
     """
     report_info = _resolve_report_type(report_type)
     base_slug = report_info["slug"]
@@ -554,12 +907,16 @@ async def navigate_to_report_top(
         'a:has-text("ダウンロード")'
     ]
     history_link_text = report_info.get("history_link_text", "ダウンロード履歴")
+    history_url_pattern = re.compile(
+        report_info.get("history_api_pattern") or os.getenv("HISTORY_API_PATTERN", DEFAULT_HISTORY_URL_PATTERN)
+    )
 
     download_path = Path(download_dir)
     download_path.mkdir(parents=True, exist_ok=True)
 
+    _notify_phase(on_phase, "navigate")
     logger.info(f"{report_info['label']}トップページに移動します...")
-    await page.goto(f"https://ad.rms.rakuten.co.jp/{base_slug}/{top_path}", timeout=30000)
+    await page.goto(f"{RMS_AD_BASE_URL}/{base_slug}/{top_path}", timeout=30000)
     await page.wait_for_load_state('networkidle', timeout=30000)
     await asyncio.sleep(2)
 
@@ -593,14 +950,16 @@ async def navigate_to_report_top(
 
     # 日付入力（プレースホルダがある場合のみ）
     if start_placeholder and end_placeholder:
+        _notify_phase(on_phase, "date_entry")
         if target_date:
             start_date = target_date
-            end_date = target_date
+            end_date = end_date or target_date
         else:
             jst = timezone(timedelta(hours=+9))
             today = datetime.now(jst).date()
             end_date = today - timedelta(days=1)
             start_date = end_date
+        logger.info(f"期間を設定します: {start_date} から {end_date}")
         start_date_str = start_date.strftime('%Y-%m-%d')
         end_date_str = end_date.strftime('%Y-%m-%d')
         try:
@@ -615,7 +974,11 @@ async def navigate_to_report_top(
         except Exception as e:
             logger.warning(f"日付入力に失敗しましたが続行します: {str(e)}")
 
-    # ダウンロード開始
+    # ダウンロード開始（履歴の行が今回のものかを判定するため、依頼した期間と時刻を控える）
+    expected_period = (start_date, end_date) if start_placeholder and end_placeholder else None
+    requested_at = datetime.now(timezone(timedelta(hours=+9))).replace(tzinfo=None)
+    loop = asyncio.get_running_loop()
+    first_check_at = loop.time() + HISTORY_FIRST_CHECK_SECONDS
     clicked = False
     for selector in download_button_selectors:
         try:
@@ -637,35 +1000,68 @@ async def navigate_to_report_top(
                 historyLink.dispatchEvent(new MouseEvent('click', {{ bubbles: true }}));
             }}
         }}''')
-        await asyncio.sleep(2)
+        await page.locator('table.table').first.wait_for(state="visible", timeout=10000)
     except Exception as e:
         logger.warning(f"ダウンロード履歴リンクに遷移できませんでしたが続行します: {str(e)}")
 
-    # 完了待ち
-    status_selector = 'table.table tbody tr:first-child td:nth-child(2) div.cell-content'
-    max_wait_time = 300
-    check_interval = 5
-    elapsed_time = 0
+    # 完了待ち（更新後のテーブルの変化を待ち、確認間隔は徐々に長くする）
+    # 最新行が今回の依頼より前の行（別の日付・種別の完了済みの行）の場合は、新しい行が追加されるまで待つ
+    _notify_phase(on_phase, "waiting")
+    max_wait_time = get_max_wait_seconds(report_type)
+    deadline = loop.time() + max_wait_time
+    await asyncio.sleep(max(0.0, min(first_check_at, deadline) - loop.time()))
+    poll_interval = HISTORY_POLL_INITIAL_SECONDS
     target_row_index = None
     found_no_data_row = False
+    # 履歴APIのレスポンスを読めない、または完了を確認できない読み取りが続く場合は、以降は画面（DOM）から状態を読む
+    use_history_api = True
+    pending_api_reads = 0
+    confirmed_by_api = False
+    download_url: Optional[str] = None
 
-    while elapsed_time < max_wait_time and target_row_index is None and not found_no_data_row:
+    while target_row_index is None and not found_no_data_row:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
         try:
-            await page.evaluate('''() => {
-                const refreshButton = document.querySelector('#btnDownloadHistoryRefresh');
-                if (refreshButton) {
-                    refreshButton.click();
-                    refreshButton.dispatchEvent(new MouseEvent('click', { bubbles: true }));
-                }
-            }''')
-            await asyncio.sleep(2)
+            if use_history_api:
+                history = await _refresh_history_via_api(
+                    page, history_url_pattern, int(min(HISTORY_RESPONSE_TIMEOUT_MS, remaining * 1000))
+                )
+                if history is not None:
+                    requested = is_requested_row(history.period, history.created_at, expected_period, requested_at)
+                    if not requested:
+                        logger.info(f"履歴APIの最新行は今回のレポートではありません: {history}")
+                    if requested and history.completed and history.no_data:
+                        found_no_data_row = True
+                    elif requested and history.completed:
+                        logger.info(f"履歴APIでレポートの完了を確認しました（ダウンロードURL: {history.download_url}）")
+                        target_row_index = 0
+                        confirmed_by_api = True
+                        download_url = history.download_url
+                    else:
+                        pending_api_reads += 1
+                        if pending_api_reads >= HISTORY_API_MAX_PENDING_READS:
+                            use_history_api = False
+                            logger.info("履歴APIで完了を確認できない状態が続くため、画面から完了を確認します")
+                        await asyncio.sleep(min(poll_interval, max(0.0, deadline - loop.time())))
+                    poll_interval = min(poll_interval * HISTORY_POLL_BACKOFF, HISTORY_POLL_MAX_SECONDS)
+                    continue
+                use_history_api = False
+                logger.info("履歴APIから状態を読めないため、画面から完了を確認します")
+
+            await page.evaluate(_HISTORY_REFRESH_AND_WAIT_JS, int(min(poll_interval, remaining) * 1000))
 
             first_row = page.locator('table.table tbody tr:first-child')
+            row_label = (await first_row.locator('td:nth-child(1)').text_content() or "").strip()
             row_status = (await first_row.locator('td:nth-child(2) div.cell-content').text_content() or "").strip()
             download_cell = first_row.locator('td:nth-child(3)')
             download_text = (await download_cell.text_content() or "").strip()
 
-            if row_status == "完了":
+            if not is_requested_row(parse_period(row_label), parse_created_at(row_label), expected_period, requested_at):
+                logger.info(f"最新行は今回のレポートではありません: {row_label}")
+                target_row_index = None
+            elif row_status == "完了":
                 if download_text == "対象データがありません":
                     found_no_data_row = True
                     target_row_index = None
@@ -679,81 +1075,62 @@ async def navigate_to_report_top(
                 target_row_index = None
         except Exception as e:
             logger.warning(f"ステータス確認中にエラー: {str(e)}")
+            # ページ遷移中などでスクリプトがすぐに失敗した場合に空回りしないよう待つ
+            await asyncio.sleep(min(poll_interval, max(0.0, deadline - loop.time())))
 
-        await asyncio.sleep(check_interval)
-        elapsed_time += check_interval
+        poll_interval = min(poll_interval * HISTORY_POLL_BACKOFF, HISTORY_POLL_MAX_SECONDS)
 
     if target_row_index is None:
         if found_no_data_row:
             return None
-        raise TimeoutError("完了状態のダウンロードリンクが見つかりませんでした。")
+        raise TimeoutError(f"完了状態のダウンロードリンクが{max_wait_time:.0f}秒以内に見つかりませんでした。")
+
+    _notify_phase(on_phase, "downloading")
+    default_name = f"{base_slug}_report.zip"
+    if DIRECT_DOWNLOAD_ENABLED and download_url:
+        file_path = await download_report_file(page, download_url, download_path, default_name)
+        if file_path:
+            return file_path
 
     download_cell = page.locator('table.table tbody tr:first-child td:nth-child(3)')
     download_action_locator = download_cell.locator('a:has-text("ダウンロード"), button:has-text("ダウンロード")')
+    if confirmed_by_api:
+        # APIの応答後に画面へ反映されるまで待つ
+        try:
+            await download_action_locator.first.wait_for(state="visible", timeout=10000)
+        except PlaywrightTimeoutError:
+            pass
     if await download_action_locator.count() == 0:
         logger.warning("完了行にクリック可能な要素が見つかりません。")
         return None
     download_action = download_action_locator.first
+
+    # 履歴APIからURLを取得できなかった場合はリンクのhrefを使う
+    if DIRECT_DOWNLOAD_ENABLED and not download_url:
+        href = await download_action.get_attribute("href")
+        if href and not href.startswith(("#", "javascript:")):
+            file_path = await download_report_file(page, urljoin(page.url, href), download_path, default_name)
+            if file_path:
+                return file_path
+
+    # 最後の手段としてブラウザのダウンロードを使う
     async with page.expect_download() as download_info:
         await download_action.click()
         download = await download_info.value
         await download.save_as(download_path / download.suggested_filename)
         return str(download_path / download.suggested_filename)
 
-async def extract_zip_file(zip_file_path: str, extract_dir: str = "temp_downloads", report_slug: str = "rpp") -> str:
-    """
-    ZIPファイルを展開する
-    
-    Args:
-        zip_file_path (str): ZIPファイルのパス
-        extract_dir (str): 展開先ディレクトリ
-        
-    Returns:
-        str: 展開されたCSVファイルのパス
-    """
-    logger.info(f"ZIPファイルを展開します: {zip_file_path}")
-    
-    try:
-        # 展開先ディレクトリの作成
-        extract_path = Path(extract_dir)
-        extract_path.mkdir(parents=True, exist_ok=True)
-        
-        # ZIPファイルを展開
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
-        
-        # 展開されたファイルのパスを取得
-        extracted_files = list(extract_path.glob('*.csv'))
-        if not extracted_files:
-            raise Exception("ZIPファイル内にCSVファイルが見つかりませんでした。")
-        
-        # 対象レポートのCSVファイルを特定
-        target_csv_files = [f for f in extracted_files if report_slug in f.name.lower()]
-        if not target_csv_files:
-            logger.warning("レポート種別名を含むCSVが見つからなかったため、最初のCSVを使用します。")
-            target_csv_files = extracted_files
-        
-        csv_file_path = str(target_csv_files[0])
-        logger.info(f"ZIPファイルを展開しました: {csv_file_path}")
-        
-        # 元のZIPファイルを削除
-        Path(zip_file_path).unlink()
-        logger.info(f"元のZIPファイルを削除しました: {zip_file_path}")
-        
-        return csv_file_path
-        
-    except Exception as e:
-        logger.error(f"ZIPファイルの展開中にエラーが発生しました: {str(e)}")
-        raise
-
-
 async def get_rpp_report_csv(
     rms_credentials: dict,
     rakuten_credentials: dict,
     target_date: Optional[date] = None,
     download_dir: str = "temp_downloads",
     headless: bool = True,
-    report_type: str = "rpp"
+    report_type: str = "rpp",
+    pool: Optional[BrowserPool] = None,
+    session_store: Optional[SessionStateStore] = None,
+    end_date: Optional[date] = None,
+    on_phase: Optional[PhaseCallback] = None
 ) -> Optional[str]:
     """
     楽天RMSから指定種別のレポートをダウンロードしてCSVファイルを取得する
@@ -763,88 +1140,159 @@ async def get_rpp_report_csv(
         rakuten_credentials (dict): 楽天会員の認証情報
         target_date (Optional[date]): 取得するレポートの日付（指定しない場合は昨日）
         download_dir (str): ダウンロード先ディレクトリ
-        headless (bool): ブラウザをヘッドレスモードで実行するかどうか
+        headless (bool): ブラウザをヘッドレスモードで実行するかどうか（poolを指定しない場合のみ）
         report_type (str): 取得するレポート種別（rpp / rpp-exp / rppexp / cpnadv / tda / tdaexp / cpa）
+        pool (Optional[BrowserPool]): 共有ブラウザプール。指定しない場合はこの呼び出し専用に起動する
+        session_store (Optional[SessionStateStore]): poolを指定しない場合に使うログインセッションの保存先
+        end_date (Optional[date]): 期間レポートの終了日（target_dateから end_date までを1回で取得する）
+        on_phase (Optional[PhaseCallback]): 処理フェーズ（lease / login / navigate / ... / downloading）の開始通知先
     
     Returns:
-        Optional[str]: CSVファイルのパス。取得できない場合はNone。
+        Optional[str]: ダウンロードしたレポートファイル（ZIP）のパス。取得できない場合はNone。
+            展開はせず、csv_stream.convert_csv_file で対象のCSVを直接読み込んで変換する
     """
     report_info = _resolve_report_type(report_type)
     report_slug = report_info["slug"]
-    p = await async_playwright().start()
-    browser = None
-    context = None
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = BrowserPool(size=1, max_jobs_per_browser=1, lease_timeout=0, headless=headless, session_store=session_store)
+        await pool.start()
+
     page = None
-    
+    screenshot_dir = None
+
     try:
-        browser = await p.chromium.launch(
-            headless=headless,
-            args=[
-                '--lang=ja-JP,ja',
-                '--no-sandbox',
-                '--font-render-hinting=none',
-                '--disable-gpu',
-                '--disable-dev-shm-usage',
-                '--force-color-profile=srgb',
-                '--force-device-scale-factor=1'
-            ]
-        )
-        
-        context = await browser.new_context(
-            accept_downloads=True,
-            viewport={"width": 1920, "height": 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            locale='ja-JP'
-        )
-        
-        page = await context.new_page()
-        
-        # スクリーンショット保存用ディレクトリの作成
-        screenshot_dir = Path(download_dir) / "screenshots"
-        screenshot_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 共通ログイン処理を実行
-        await login_to_rms(page, rms_credentials, rakuten_credentials, screenshot_dir)
-        
-        # 指定種別トップページに遷移しダウンロード
-        zip_file_path = await navigate_to_report_top(page, screenshot_dir, download_dir, target_date, report_type=report_type)
+        _notify_phase(on_phase, "lease")
+        async with pool.lease() as lease:
+            try:
+                page = await lease.new_page()
+                await install_page_allowlist(page, get_resource_allowlist(report_type))
+
+                # スクリーンショット保存用ディレクトリの作成
+                screenshot_dir = Path(download_dir) / "screenshots"
+                screenshot_dir.mkdir(parents=True, exist_ok=True)
+
+                # 共通ログイン処理を実行（ログイン済み・セッション復元済みのコンテキストでは省略）
+                _notify_phase(on_phase, "login")
+                await ensure_logged_in(lease, page, rms_credentials, rakuten_credentials, screenshot_dir)
+
+                # 指定種別トップページに遷移しダウンロード
+                async with _history_lock(report_slug):
+                    zip_file_path = await navigate_to_report_top(
+                        page, screenshot_dir, download_dir, target_date, report_type=report_type,
+                        end_date=end_date, on_phase=on_phase
+                    )
+            except Exception as e:
+                logger.error(f"RPPレポート取得中にエラーが発生しました: {str(e)}")
+                if page and screenshot_dir:
+                    try:
+                        await take_screenshot(page, str(screenshot_dir / f"error_{int(time.time())}.png"))
+                    except Exception:
+                        pass
+                raise
 
         if not zip_file_path:
-            logger.info("ダウンロード対象がなかったためZIP展開処理をスキップします。")
+            logger.info("ダウンロード対象がありませんでした。")
             return None
         
-        # ZIPファイルを展開
-        csv_file_path = await extract_zip_file(zip_file_path, download_dir, report_slug)
-        
-        return csv_file_path
-        
-    except Exception as e:
-        logger.error(f"RPPレポート取得中にエラーが発生しました: {str(e)}")
-        if page and screenshot_dir:
-            try:
-                await page.screenshot(path=str(screenshot_dir / f"error_{int(time.time())}.png"))
-            except Exception:
-                pass
+        return zip_file_path
+    except BaseException as e:
+        record_timeout(report_slug, e)
         raise
     finally:
-        if page:
-            try:
-                await page.close()
-            except Exception:
-                pass
-        if context:
-            try:
-                await context.close()
-            except Exception:
-                pass
-        if browser:
-            try:
-                await browser.close()
-            except Exception:
-                pass
-        if p:
+        if owns_pool:
+            await pool.close()
+
+
+async def get_report_batch(
+    rms_credentials: dict,
+    rakuten_credentials: dict,
+    report_types: List[str],
+    target_dates: List[date],
+    download_dir: str,
+    pool: BrowserPool
+) -> List[Dict[str, Any]]:
+    """
+    1回のログインで複数種別・複数日付のレポートを取得する
+
+    種別ごとに同じコンテキスト内の別タブを開いて並行に処理する（同じ種別の日付は順番に処理する）。
+    1件の失敗が他の取得に影響しないよう、結果は項目ごとのステータスとして返す。
+
+    Args:
+        rms_credentials (dict): RMSの認証情報
+        rakuten_credentials (dict): 楽天会員の認証情報
+        report_types (List[str]): 取得するレポート種別のリスト
+        target_dates (List[date]): 取得する日付のリスト
+        download_dir (str): ダウンロード先ディレクトリ
+        pool (BrowserPool): 共有ブラウザプール
+
+    Returns:
+        List[Dict[str, Any]]: 項目ごとの結果
+            （report_type, slug, date, status: ok / no_data / error, report_path, error）
+            report_path はダウンロードしたレポートファイル（ZIP）のパス
+
+    Raises:
+        ValueError: サポートされていないレポート種別が含まれる場合
+    """
+    # 同じスラッグ（rpp-exp と rppexp など）は1回だけ取得する
+    targets: Dict[str, str] = {}
+    for report_type in report_types:
+        targets.setdefault(_resolve_report_type(report_type)["slug"], report_type)
+
+    screenshot_dir = Path(download_dir) / "screenshots"
+    screenshot_dir.mkdir(parents=True, exist_ok=True)
+
+    async with pool.lease() as lease:
+        login_page = await lease.new_page()
+        await ensure_logged_in(lease, login_page, rms_credentials, rakuten_credentials, screenshot_dir)
+
+        async def run_report_type(report_type: str, report_slug: str) -> List[Dict[str, Any]]:
+            def new_item(target_date: date) -> Dict[str, Any]:
+                return {
+                    "report_type": report_type,
+                    "slug": report_slug,
+                    "date": target_date,
+                    "status": "ok",
+                    "report_path": None,
+                    "error": None,
+                }
+
             try:
-                await p.stop()
-            except Exception:
-                pass
+                page = await lease.new_page()
+                await install_page_allowlist(page, get_resource_allowlist(report_type))
+            except Exception as e:
+                # タブを開けない・許可リストの正規表現が正しくないなどの場合も、この種別だけをエラーにする
+                logger.error(f"バッチ取得でタブの準備に失敗しました（{report_slug}）: {str(e)}")
+                return [{**new_item(d), "status": "error", "error": str(e)} for d in target_dates]
+
+            items = []
+            for target_date in target_dates:
+                item_dir = str(Path(download_dir) / report_slug / target_date.isoformat())
+                item = new_item(target_date)
+                phase_timer = metrics.PhaseTimer(report_slug)
+                try:
+                    async with _history_lock(report_slug):
+                        zip_file_path = await navigate_to_report_top(
+                            page, screenshot_dir, item_dir, target_date, report_type=report_type,
+                            on_phase=phase_timer
+                        )
+                    if zip_file_path:
+                        item["report_path"] = zip_file_path
+                    else:
+                        item["status"] = "no_data"
+                except Exception as e:
+                    logger.error(f"バッチ取得でエラーが発生しました（{report_slug} {target_date}）: {str(e)}")
+                    record_timeout(report_slug, e)
+                    item["status"] = "error"
+                    item["error"] = str(e)
+                finally:
+                    phase_timer.finish()
+                items.append(item)
+            return items
+
+        per_type = await asyncio.gather(
+            *(run_report_type(report_type, report_slug) for report_slug, report_type in targets.items())
+        )
 
+    return [item for items in per_type for item in items]
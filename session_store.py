@@ -0,0 +1,109 @@
+"""
+RMSログインセッションの永続化
+BrowserContext.storage_state（Cookie / localStorage）を暗号化してローカルディスクに保存する
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = Exception
+
+logger = logging.getLogger(__name__)
+
+
+def derive_fernet_key(secret: str) -> bytes:
+    """任意の文字列からFernet鍵（32バイトのURLセーフBase64）を導出する"""
+    digest = hashlib.sha256(secret.encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(digest)
+
+
+class SessionStateStore:
+    """
+    暗号化されたstorage_stateファイルの読み書き
+
+    Args:
+        path (str): 保存先ファイルパス
+        secret (str): 暗号鍵。Fernet鍵またはそこから鍵を導出する任意の文字列
+        max_age_seconds (float): これより古い保存状態は使わない（0以下で無制限）
+    """
+
+    def __init__(self, path: str, secret: str, max_age_seconds: float = 0):
+        self.path = Path(path)
+        self.max_age_seconds = max_age_seconds
+        self._fernet = None
+        if Fernet is None:
+            logger.warning("cryptographyがインストールされていないため、ログインセッションは保存されません")
+            return
+        try:
+            self._fernet = Fernet(secret.encode("utf-8"))
+        except (ValueError, TypeError):
+            self._fernet = Fernet(derive_fernet_key(secret))
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    def load(self) -> Optional[dict]:
+        """
+        保存済みのstorage_stateを読み込む
+
+        Returns:
+            Optional[dict]: storage_state。存在しない・期限切れ・復号できない場合はNone
+        """
+        if not self.enabled or not self.path.exists():
+            return None
+        try:
+            if self.max_age_seconds and self.max_age_seconds > 0:
+                age = time.time() - self.path.stat().st_mtime
+                if age > self.max_age_seconds:
+                    logger.info(f"保存済みセッションが古いため使用しません（{int(age)}秒前）")
+                    return None
+            token = self.path.read_bytes()
+            state = json.loads(self._fernet.decrypt(token).decode("utf-8"))
+            logger.info("保存済みのログインセッションを読み込みました")
+            return state
+        except InvalidToken:
+            logger.warning("保存済みセッションを復号できませんでした（鍵が変更された可能性があります）")
+            return None
+        except Exception as e:
+            logger.warning(f"保存済みセッションの読み込みに失敗しました: {str(e)}")
+            return None
+
+    def save(self, state: dict) -> None:
+        """storage_stateを暗号化し、一時ファイル経由でアトミックに保存する"""
+        if not self.enabled:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            token = self._fernet.encrypt(json.dumps(state).encode("utf-8"))
+            fd, tmp_path = tempfile.mkstemp(prefix=".session_", dir=str(self.path.parent))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(token)
+                os.chmod(tmp_path, 0o600)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            logger.info(f"ログインセッションを保存しました: {self.path}")
+        except Exception as e:
+            logger.warning(f"ログインセッションの保存に失敗しました: {str(e)}")
+
+    def clear(self) -> None:
+        """保存済みセッションを削除する"""
+        try:
+            if self.path.exists():
+                self.path.unlink()
+        except Exception as e:
+            logger.warning(f"保存済みセッションの削除に失敗しました: {str(e)}")
@@ -0,0 +1,80 @@
+"""
+シングルフライト
+同じキーの処理が実行中であれば新たに実行せず、実行中の結果を共有する
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    キー単位で同時実行を1つにまとめる
+
+    処理は独立したタスクで実行するため、最初の呼び出し元が切断・キャンセルされても
+    後から合流した呼び出し元には結果が返る。
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._stats = {
+            "calls_total": 0,
+            "executions_total": 0,
+            "coalesced_total": 0,
+            "errors_total": 0,
+        }
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        keyの処理を実行する。同じkeyが実行中であればその結果を待つ
+
+        Args:
+            key: 同一処理とみなすキー
+            func: 実行する処理（引数なしのコルーチン関数）
+
+        Returns:
+            処理結果（合流した呼び出し元はすべて同じオブジェクトを受け取る）
+        """
+        self._stats["calls_total"] += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced_total"] += 1
+            logger.info(f"[{self.name}] 実行中の処理に合流します: {key}")
+        else:
+            self._stats["executions_total"] += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if self._waiters[key] <= 0:
+                self._waiters.pop(key, None)
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        """keyの処理が実行中かどうか（実行中であれば do() は新たに実行せず合流する）"""
+        return key in self._inflight
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            # 待機者がいなくなっていても例外を取得済みにしておく
+            self._stats["errors_total"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """合流回数などの統計を返す"""
+        return {
+            "in_flight": len(self._inflight),
+            "waiting": sum(self._waiters.values()),
+            **self._stats,
+        }
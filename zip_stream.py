@@ -0,0 +1,60 @@
+"""
+ZIPストリーミング
+ZIP全体をメモリに組み立てずに、メンバーを書き込むたびにチャンクとして送出する
+"""
+import io
+import zipfile
+from typing import Iterable, Iterator, List, Tuple, Union
+
+ZipMember = Tuple[str, Union[bytes, Iterable[bytes]]]
+
+
+class _ChunkWriter(io.RawIOBase):
+    """書き込まれたバイト列を溜めておき、取り出せるようにするシーク不可のストリーム"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip_stream(members: Iterable[ZipMember], compression: int = zipfile.ZIP_DEFLATED) -> Iterator[bytes]:
+    """
+    メンバーを順にZIPへ書き込みながらチャンクを返す
+
+    Args:
+        members: (ファイル名, 内容) のイテラブル。内容はbytes、またはbytesのイテラブル
+        compression: 圧縮方式
+
+    Yields:
+        bytes: ZIPデータのチャンク
+    """
+    writer = _ChunkWriter()
+    # シーク不可のストリームに対しては、zipfileがデータディスクリプタ形式で書き込む
+    with zipfile.ZipFile(writer, mode="w", compression=compression) as zf:
+        for name, content in members:
+            with zf.open(name, mode="w") as member:
+                if isinstance(content, (bytes, bytearray)):
+                    member.write(content)
+                else:
+                    for chunk in content:
+                        member.write(chunk)
+                        data = writer.drain()
+                        if data:
+                            yield data
+            data = writer.drain()
+            if data:
+                yield data
+    data = writer.drain()
+    if data:
+        yield data